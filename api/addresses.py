@@ -0,0 +1,72 @@
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NameResolutionError
+import ipaddress
+import socket
+
+
+class AddressRefused(Exception):
+    pass
+
+
+def public_address(host, port):
+    """Resolves ``host`` and returns its first address.
+
+    Raises ``AddressRefused`` when any address of the host is private,
+    loopback, link-local or otherwise not globally routable, so a URL
+    cannot be used to reach the metadata service or internal services.
+    """
+    addresses = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+    for address in addresses:
+        if not ipaddress.ip_address(address[4][0].split("%")[0]).is_global:
+            raise AddressRefused(f"{host} is not a public address")
+    return addresses[0][4][0]
+
+
+class _PublicAddressConnection:
+    def _new_conn(self):
+        # Connect to the address that was checked rather than resolving the
+        # host again, which a DNS rebinding attack could answer differently.
+        host = self._dns_host
+        try:
+            self._dns_host = public_address(host, self.port)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        try:
+            return super()._new_conn()
+        finally:
+            self._dns_host = host
+
+
+class PublicHTTPConnection(_PublicAddressConnection, HTTPConnection):
+    pass
+
+
+class PublicHTTPSConnection(_PublicAddressConnection, HTTPSConnection):
+    pass
+
+
+class PublicHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = PublicHTTPConnection
+
+
+class PublicHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = PublicHTTPSConnection
+
+
+class PublicAddressAdapter(HTTPAdapter):
+    """An HTTPAdapter that only connects to public addresses.
+
+    The check happens as each connection is opened, on the address the
+    socket then connects to; TLS still verifies the certificate against
+    the URL's host name. Connecting to a private address raises
+    ``AddressRefused``.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": PublicHTTPConnectionPool,
+            "https": PublicHTTPSConnectionPool,
+        }
@@ -1,11 +1,46 @@
-from flask import Flask, request, jsonify
-from bs4 import BeautifulSoup
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from addresses import AddressRefused, public_address
+from breaker import CircuitBreaker, CircuitOpen
 from io import BytesIO
-from google.cloud import storage
-import requests
+from jobs import IdempotencyConflict, JobQueue
+from links import LinkEnricher
+from cache import LRUCache, RefreshingCache, SQLiteCache, TieredCache
+from chart_filter import ChartFilter
+from conversations import INCREMENTAL, UNCHANGED, ConversationReader, ConversationSessions
+from images import ImageNormalizer, InvalidImageError
+from metrics import (
+    REQUEST_ID_HEADER, RequestIdFilter, finish_request, propagate, record_conversation_upload, record_usage,
+    render_metrics, stage, start_request,
+)
+from payloads import PayloadTemplate, encode_json, slot
+from prompt_store import PromptStore
+from router import PoolMember, UpstreamPool
+from ratelimit import PRIORITY_BATCH, PRIORITY_INTERACTIVE, RateLimited, RateLimiter, estimate_tokens
+from streaming import IncrementalJSONParser, iter_stream_content, sse_event
+from tickers import TickerReader, normalize_ticker
+from upstream import UpstreamClient
+from uploads import FIELDS_ALLOWANCE, ImageTooLargeError, ImageUploadReader
+from warmup import WarmUp
+from urllib.parse import urlparse
 import base64
+import hashlib
 import json
+import logging
+import math
 import os
+import tempfile
+import threading
+import time
+import requests
+
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s",
+)
+for handler in logging.getLogger().handlers:
+    handler.addFilter(RequestIdFilter())
 
 app = Flask(__name__)
 
@@ -17,292 +52,1080 @@ OPENAI_PROMPT_FILE_PATH = "openai_prompt.txt"
 PERPLEXITY_PROMPT_FILE_PATH = "perplexity_prompt.txt"
 RIZZ_PROMPT_FILE_PATH = "rizz_prompt.txt"
 
-OPENAI_BASE_URL = "https://api.openai.com/v1/chat/completions"
-PERPLEXITY_BASE_URL = "https://api.perplexity.ai/chat/completions"
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1/chat/completions")
+PERPLEXITY_BASE_URL = os.environ.get("PERPLEXITY_BASE_URL", "https://api.perplexity.ai/chat/completions")
+
+PROMPT_BUCKET_NAME = os.environ.get("PROMPT_BUCKET_NAME", "gen_ai_prompts")
+PROMPT_REFRESH_SECONDS = int(os.environ.get("PROMPT_REFRESH_SECONDS", "300"))
+
+prompt_store = PromptStore(
+    PROMPT_BUCKET_NAME,
+    [OPENAI_PROMPT_FILE_PATH, PERPLEXITY_PROMPT_FILE_PATH, RIZZ_PROMPT_FILE_PATH],
+    ttl=PROMPT_REFRESH_SECONDS,
+)
+
+UPSTREAM_POOL_SIZE = int(os.environ.get("UPSTREAM_POOL_SIZE", "100"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get("UPSTREAM_READ_TIMEOUT", "60"))
+UPSTREAM_MAX_RETRIES = int(os.environ.get("UPSTREAM_MAX_RETRIES", "2"))
+
+# Each upstream gets a circuit breaker that sheds calls while most recent
+# ones fail or take longer than UPSTREAM_BREAKER_SLOW_SECONDS.
+UPSTREAM_BREAKER_ERROR_RATE = float(os.environ.get("UPSTREAM_BREAKER_ERROR_RATE", "0.5"))
+UPSTREAM_BREAKER_SLOW_SECONDS = float(os.environ.get("UPSTREAM_BREAKER_SLOW_SECONDS", "30"))
+UPSTREAM_BREAKER_SLOW_RATE = float(os.environ.get("UPSTREAM_BREAKER_SLOW_RATE", "0.5"))
+UPSTREAM_BREAKER_MIN_CALLS = int(os.environ.get("UPSTREAM_BREAKER_MIN_CALLS", "10"))
+UPSTREAM_BREAKER_WINDOW = float(os.environ.get("UPSTREAM_BREAKER_WINDOW", "60"))
+UPSTREAM_BREAKER_OPEN_SECONDS = float(os.environ.get("UPSTREAM_BREAKER_OPEN_SECONDS", "30"))
+
+# Hedging is off unless a percentile (e.g. 95) is set. A hedge doubles the
+# cost of the call it duplicates, so at most UPSTREAM_HEDGE_MAX_RATE of calls
+# are hedged.
+UPSTREAM_HEDGE_PERCENTILE = float(os.environ.get("UPSTREAM_HEDGE_PERCENTILE", "0")) or None
+UPSTREAM_HEDGE_MAX_RATE = float(os.environ.get("UPSTREAM_HEDGE_MAX_RATE", "0.05"))
+UPSTREAM_HEDGE_MIN_DELAY = float(os.environ.get("UPSTREAM_HEDGE_MIN_DELAY", "1"))
+# Keep-alive connections each worker opens to every upstream before it reports ready.
+UPSTREAM_WARM_CONNECTIONS = int(os.environ.get("UPSTREAM_WARM_CONNECTIONS", "2"))
+
+
+def upstream_client(name, url):
+    breaker = CircuitBreaker(
+        name,
+        error_rate=UPSTREAM_BREAKER_ERROR_RATE,
+        slow_seconds=UPSTREAM_BREAKER_SLOW_SECONDS,
+        slow_rate=UPSTREAM_BREAKER_SLOW_RATE,
+        min_calls=UPSTREAM_BREAKER_MIN_CALLS,
+        window=UPSTREAM_BREAKER_WINDOW,
+        open_seconds=UPSTREAM_BREAKER_OPEN_SECONDS,
+    )
+    return UpstreamClient(
+        name,
+        url,
+        pool_size=UPSTREAM_POOL_SIZE,
+        connect_timeout=UPSTREAM_CONNECT_TIMEOUT,
+        read_timeout=UPSTREAM_READ_TIMEOUT,
+        max_retries=UPSTREAM_MAX_RETRIES,
+        breaker=breaker,
+        hedge_percentile=UPSTREAM_HEDGE_PERCENTILE,
+        hedge_max_rate=UPSTREAM_HEDGE_MAX_RATE,
+        hedge_min_delay=UPSTREAM_HEDGE_MIN_DELAY,
+    )
+
+
+openai_client = upstream_client("openai", OPENAI_BASE_URL)
+perplexity_client = upstream_client("perplexity", PERPLEXITY_BASE_URL)
+
+# Limits are per API key and shared evenly by the gunicorn workers until the
+# upstream's x-ratelimit-* headers say otherwise. 0 disables a limit.
+RATE_LIMIT_QUEUE_SIZE = int(os.environ.get("RATE_LIMIT_QUEUE_SIZE", "100"))
+RATE_LIMIT_MAX_WAIT = float(os.environ.get("RATE_LIMIT_MAX_WAIT", "10"))
+RATE_LIMIT_SHARE = 1.0 / int(os.environ.get("WEB_CONCURRENCY", "1"))
+
+
+def rate_limiter(name, rpm, tpm):
+    prefix = name.upper().replace("-", "_")
+    return RateLimiter(
+        name,
+        rpm=int(os.environ.get(f"{prefix}_RPM", rpm)),
+        tpm=int(os.environ.get(f"{prefix}_TPM", tpm)),
+        max_queue=RATE_LIMIT_QUEUE_SIZE,
+        max_wait=RATE_LIMIT_MAX_WAIT,
+        share=RATE_LIMIT_SHARE,
+    )
+
+
+perplexity_limiter = rate_limiter("perplexity", rpm=50, tpm=0)
+
+CHART_ANALYSIS_MODEL = os.environ.get("CHART_ANALYSIS_MODEL", "gpt-5-mini-2025-08-07")
+RIZZ_MODEL = os.environ.get("RIZZ_MODEL", "gpt-5-mini-2025-08-07")
+
+# CHART_UPSTREAMS and RIZZ_UPSTREAMS spread a product's OpenAI calls over
+# several OpenAI-compatible endpoints, keys and models, e.g.
+#   [{"name": "primary"},
+#    {"name": "fallback", "url": "https://...", "keyEnv": "RIZZ_FALLBACK_KEY", "model": "gpt-4.1-mini", "rpm": 100}]
+# Members default to OPENAI_BASE_URL, the product's key and model and 500
+# rpm / 200k tpm, and share an upstream client (and its circuit breaker)
+# when they share a URL. Unset, each product has a single "openai" member.
+# A member whose "keyEnv" variable is unset stops the app from starting.
+UPSTREAM_ROUTING_ALPHA = float(os.environ.get("UPSTREAM_ROUTING_ALPHA", "0.3"))
+UPSTREAM_PROBE_SECONDS = float(os.environ.get("UPSTREAM_PROBE_SECONDS", "30"))
+
+openai_clients = {OPENAI_BASE_URL: openai_client}
+
+
+def upstream_pool(name, api_key, model):
+    config = json.loads(os.environ.get(f"{name.upper()}_UPSTREAMS") or '[{"name": "openai"}]')
+    members = []
+    for entry in config:
+        url = entry.get("url", OPENAI_BASE_URL)
+        member_key = entry.get("key", api_key)
+        if "keyEnv" in entry:
+            member_key = os.environ.get(entry["keyEnv"])
+            if not member_key:
+                # Fail now rather than send "Bearer None" from this member on every call routed to it.
+                raise RuntimeError(f"{name.upper()}_UPSTREAMS member {entry['name']!r}: {entry['keyEnv']} is not set")
+        if url not in openai_clients:
+            openai_clients[url] = upstream_client(entry["name"], url)
+        members.append(PoolMember(
+            entry["name"],
+            openai_clients[url],
+            rate_limiter(f"{name}-{entry['name']}", rpm=entry.get("rpm", 500), tpm=entry.get("tpm", 200000)),
+            member_key,
+            entry.get("model", model),
+        ))
+    return UpstreamPool(name, members, alpha=UPSTREAM_ROUTING_ALPHA, probe_interval=UPSTREAM_PROBE_SECONDS)
+
+
+chart_pool = upstream_pool("chart", CANDLESTICK_OPENAI_API_KEY, CHART_ANALYSIS_MODEL)
+rizz_pool = upstream_pool("rizz", RIZZ_OPENAI_API_KEY, RIZZ_MODEL)
+
+# Expected completion sizes, counted against the tokens-per-minute limits up front.
+CHART_COMPLETION_TOKENS = 1500
+RIZZ_COMPLETION_TOKENS = 800
+ARTICLES_COMPLETION_TOKENS = 1000
+SUMMARY_COMPLETION_TOKENS = 500
+
+image_normalizer = ImageNormalizer(
+    max_side=int(os.environ.get("IMAGE_MAX_SIDE", "2048")),
+    short_side=int(os.environ.get("IMAGE_SHORT_SIDE", "768")),
+    quality=int(os.environ.get("IMAGE_QUALITY", "85")),
+    image_format=os.environ.get("IMAGE_FORMAT", "JPEG"),
+    detail=os.environ.get("IMAGE_DETAIL", "auto"),
+)
+
+# Screenshots can also be uploaded as multipart/form-data or a raw image/*
+# body, which skips base64 and JSON parsing of the whole image.
+upload_reader = ImageUploadReader(
+    max_bytes=int(os.environ.get("IMAGE_MAX_BYTES", str(20 * 1024 * 1024))),
+    spool_bytes=int(os.environ.get("IMAGE_SPOOL_BYTES", str(1024 * 1024))),
+)
+
+
+def image_error(e):
+    return {"error": str(e)}, 413 if isinstance(e, ImageTooLargeError) else 400
+
+
+def image_error_response(e):
+    body, status = image_error(e)
+    return jsonify(body), status
+
+
+CHART_CACHE_SIZE = int(os.environ.get("CHART_CACHE_SIZE", "512"))
+CHART_CACHE_TTL = int(os.environ.get("CHART_CACHE_TTL", "21600"))
+CHART_CACHE_PATH = os.environ.get("CHART_CACHE_PATH")
+
+chart_cache = TieredCache(
+    LRUCache(maxsize=CHART_CACHE_SIZE, ttl=CHART_CACHE_TTL),
+    SQLiteCache(CHART_CACHE_PATH, ttl=CHART_CACHE_TTL) if CHART_CACHE_PATH else None,
+)
+
+# "shadow" scores every image and logs agreement with the model; only "enforce" rejects.
+chart_filter = ChartFilter(
+    mode=os.environ.get("CHART_FILTER_MODE", "off"),
+    threshold=float(os.environ.get("CHART_FILTER_THRESHOLD", "0.2")),
+    ocr=os.environ.get("CHART_FILTER_OCR", "1") == "1",
+)
+
+ticker_reader = TickerReader(enabled=os.environ.get("TICKER_OCR", "1") == "1")
+
+# Successive screenshots of one chat sent to /getResponses with a "sessionId"
+# are read with OCR, and only the messages that are new since the previous
+# screenshot go to the model, as text. Session ids are chosen by the client,
+# so they must be long enough to be random (e.g. a UUID): an unchanged
+# screenshot is answered with the session's previous result.
+CONVERSATION_SESSION_ID_MIN_LENGTH = 16
+SESSION_ID_ERROR = (
+    f"'sessionId' must be a random string of {CONVERSATION_SESSION_ID_MIN_LENGTH} to 255 characters, such as a UUID."
+)
+conversation_reader = ConversationReader(
+    enabled=os.environ.get("CONVERSATION_OCR", "1") == "1",
+    min_confidence=float(os.environ.get("CONVERSATION_OCR_MIN_CONFIDENCE", "80")),
+)
+conversation_sessions = ConversationSessions(
+    maxsize=int(os.environ.get("CONVERSATION_SESSIONS_SIZE", "2048")),
+    ttl=int(os.environ.get("CONVERSATION_SESSIONS_TTL", "3600")),
+)
+# Reads screenshots that start a session while the model looks at them.
+conversation_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="conversation-ocr")
+
+PERPLEXITY_SEARCH_RECENCY = os.environ.get("PERPLEXITY_SEARCH_RECENCY", "month")
+ARTICLES_CACHE_TTLS = {"hour": 60, "day": 900, "week": 3600, "month": 3 * 3600}
+ARTICLES_CACHE_TTL = int(os.environ.get("ARTICLES_CACHE_TTL", ARTICLES_CACHE_TTLS.get(PERPLEXITY_SEARCH_RECENCY, 900)))
+ARTICLES_CACHE_STALE_TTL = int(os.environ.get("ARTICLES_CACHE_STALE_TTL", ARTICLES_CACHE_TTL))
+
+articles_cache = RefreshingCache(
+    maxsize=int(os.environ.get("ARTICLES_CACHE_SIZE", "2048")),
+    ttl=ARTICLES_CACHE_TTL,
+    stale_ttl=ARTICLES_CACHE_STALE_TTL,
+    cacheable=lambda result: result[1] == 200,
+)
+
+# Checking article links and adding OpenGraph previews is opt-in per request
+# with "enrichLinks"; ARTICLE_LINKS_ENRICH turns it on by default.
+ARTICLE_LINKS_ENRICH = os.environ.get("ARTICLE_LINKS_ENRICH", "0") == "1"
+LINK_CACHE_TTL = int(os.environ.get("LINK_CACHE_TTL", "86400"))
+LINK_CACHE_PATH = os.environ.get("LINK_CACHE_PATH")
+
+link_enricher = LinkEnricher(
+    TieredCache(
+        LRUCache(maxsize=int(os.environ.get("LINK_CACHE_SIZE", "4096")), ttl=LINK_CACHE_TTL),
+        SQLiteCache(LINK_CACHE_PATH, ttl=LINK_CACHE_TTL) if LINK_CACHE_PATH else None,
+    ),
+    deadline=float(os.environ.get("ARTICLE_LINKS_DEADLINE", "2")),
+    ttl=LINK_CACHE_TTL,
+    error_ttl=int(os.environ.get("LINK_CACHE_ERROR_TTL", "600")),
+    pool_size=int(os.environ.get("ARTICLE_LINKS_POOL_SIZE", "16")),
+    allow_private=os.environ.get("ARTICLE_LINKS_ALLOW_PRIVATE", "0") == "1",
+)
+
+
+def invalidate_caches(filename):
+    if filename == OPENAI_PROMPT_FILE_PATH:
+        chart_cache.clear()
+    elif filename == PERPLEXITY_PROMPT_FILE_PATH:
+        articles_cache.clear()
+
+
+prompt_store.add_listener(invalidate_caches)
 
 
 def get_txt_file(filename):
-    bucket_name = "gen_ai_prompts"
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(filename)
+    return prompt_store.get(filename)
 
-    text = blob.download_as_text()
-    return text
 
+STREAM_OPTIONS = {"stream": True, "stream_options": {"include_usage": True}}
 
-@app.route("/getChartAnalysis", methods=["POST"])
-def get_chart_analysis():
-    try:
-        data = request.get_json()
-        if not data or "base64Image" not in data:
-            return jsonify({"error": "Missing 'base64Image' in JSON body."}), 400
 
-        base64_image = data["base64Image"]
-        prompt = get_txt_file(OPENAI_PROMPT_FILE_PATH)
+def wants_stream(data):
+    return (
+        data.get("stream") is True or
+        request.args.get("stream") in ("1", "true") or
+        "text/event-stream" in request.headers.get("Accept", "")
+    )
 
-        trading_styles = ", ".join(data.get("tradingStyles", ["Not Sure"]))
-        risk = data.get("risk", "Not Sure")
 
-        prompt = f"User trading style(s): {trading_styles}. User risk preference: {risk}.\n\n{prompt}"
+def event_stream(events):
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-        payload = {
-            "model": "gpt-5-mini-2025-08-07",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt
+
+def final_event(body, status):
+    if status == 200:
+        return sse_event("result", body)
+    return sse_event("error", dict(body, status=status))
+
+
+def stream_response(response, paths, parse_content, on_result=None):
+    def generate():
+        parser = IncrementalJSONParser(paths)
+        try:
+            with stage("stream"):
+                for content in iter_stream_content(response, on_usage=openai_usage):
+                    for path, value in parser.feed(content):
+                        yield sse_event(path[-1], value)
+        except Exception as e:
+            yield sse_event("error", {"error": str(e), "status": 500})
+            return
+        finally:
+            response.close()
+
+        with stage("parse"):
+            body, status = parse_content(parser.text)
+        if on_result is not None:
+            on_result(body, status)
+        yield final_event(body, status)
+
+    return event_stream(generate())
+
+
+def replay_stream(document, paths, body, status):
+    def generate():
+        for path in paths:
+            value = document
+            for key in path:
+                if not isinstance(value, dict) or key not in value:
+                    break
+                value = value[key]
+            else:
+                yield sse_event(path[-1], value)
+        yield final_event(body, status)
+
+    return event_stream(generate())
+
+
+def request_endpoint():
+    # The route pattern keeps the label set bounded.
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+@app.before_request
+def begin_request():
+    g.request_start = time.perf_counter()
+    g.request_id = start_request(request_endpoint(), request.headers.get(REQUEST_ID_HEADER))
+
+
+@app.after_request
+def end_request(response):
+    response.headers[REQUEST_ID_HEADER] = g.request_id
+    endpoint, method, start, request_bytes = request_endpoint(), request.method, g.request_start, request.content_length
+    # Streamed bodies are only done once the server closes the response.
+    response.call_on_close(lambda: finish_request(
+        endpoint, method, response.status_code, time.perf_counter() - start, request_bytes, response.content_length,
+    ))
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    job_queue.export_metrics()
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
+def openai_usage(usage):
+    record_usage("openai", usage)
+
+
+# Raised when an upstream cannot take a call right now.
+UNAVAILABLE = (RateLimited, CircuitOpen)
+
+
+def unavailable_response(e):
+    retry_after = max(1, math.ceil(e.retry_after))
+    return jsonify({
+        "error": "The service is busy right now, please retry shortly.",
+        "retryAfter": retry_after,
+    }), 503, {"Retry-After": str(retry_after)}
+
+
+@app.route("/stats", methods=["GET"])
+def get_stats():
+    return jsonify({
+        "prompts": prompt_store.stats(),
+        "images": image_normalizer.stats(),
+        "chartCache": chart_cache.stats(),
+        "chartFilter": chart_filter.stats(),
+        "tickerOcr": ticker_reader.stats(),
+        "conversations": dict(conversation_sessions.stats(), ocr=conversation_reader.stats()),
+        "jobs": job_queue.stats(),
+        "warmUp": warm_up.stats(),
+        "articlesCache": articles_cache.stats(),
+        "articleLinks": link_enricher.stats(),
+        "upstreams": {
+            client.name: client.stats() for client in list(openai_clients.values()) + [perplexity_client]
+        },
+        "routing": {pool.name: pool.stats() for pool in (chart_pool, rizz_pool)},
+        "rateLimits": {
+            limiter.name: limiter.stats()
+            for limiter in [member.limiter for member in chart_pool.members + rizz_pool.members] + [perplexity_limiter]
+        },
+    }), 200
+
+
+CHART_ANALYSIS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "chart_analysis",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "status": {
+                    "type": "boolean",
+                    "description": "Indicates if the uploaded image is a trading chart (true) or not (false)"
+                },
+                "result": {
+                    "type": "object",
+                    "properties": {
+                        "ticker": {
+                            "type": "string",
+                            "description": "Ticker symbol present in input image"
                         },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}",
-                                "detail": "high"
-                            }
-                        }
-                    ]
-                }
-            ],
-            "response_format": {
-                "type": "json_schema",
-                "json_schema": {
-                    "name": "chart_analysis",
-                    "schema": {
-                        "type": "object",
-                        "properties": {
-                            "status": {
-                                "type": "boolean",
-                                "description": "Indicates if the uploaded image is a trading chart (true) or not (false)"
-                            },
-                            "result": {
-                                "type": "object",
-                                "properties": {
-                                    "ticker": {
-                                        "type": "string",
-                                        "description": "Ticker symbol present in input image"
+                        "features": {
+                            "type": "object",
+                            "properties": {
+                                "generalTrends": {
+                                    "type": "object",
+                                    "properties": {
+                                        "trendDirection": {
+                                            "type": "string",
+                                            "enum": ["up", "down", "sideways"],
+                                            "description": "Overall trend direction of the asset"
+                                        },
+                                        "trendStrength": {
+                                            "type": "string",
+                                            "enum": ["weak", "moderate", "strong"],
+                                            "description": "Strength of the detected trend"
+                                        },
+                                        "volume": {
+                                            "type": "string",
+                                            "enum": ["low", "medium", "high"],
+                                            "description": "Relative trading volume of the asset"
+                                        },
+                                        "volatility": {
+                                            "type": "string",
+                                            "enum": ["low", "medium", "high"],
+                                            "description": "Current market volatility."
+                                        },
+                                        "analysis": {
+                                            "type": "string",
+                                            "description": "Start with a sentence that includes the ticker name and the current price (if legible, otherwise say not legible). Then assess the current market structure. Identify whether the price is trending, consolidating, or reversing. Evaluate how the current price action fits within the larger trend. Identify signs of momentum exhaustion or build up and explain the reasoning behind it. Analyze volatility expansion or contraction. Highlight key liquidity zones where price is likely to see significant reactions. Mention Smart Money concepts (previous swing highs/lows, order blocks, fair value gaps) only if clearly visible on the chart."
+                                        }
                                     },
-                                    "features": {
-                                        "type": "object",
-                                        "properties": {
-                                            "generalTrends": {
-                                                "type": "object",
-                                                "properties": {
-                                                    "trendDirection": {
-                                                        "type": "string",
-                                                        "enum": ["up", "down", "sideways"],
-                                                        "description": "Overall trend direction of the asset"
-                                                    },
-                                                    "trendStrength": {
-                                                        "type": "string",
-                                                        "enum": ["weak", "moderate", "strong"],
-                                                        "description": "Strength of the detected trend"
-                                                    },
-                                                    "volume": {
-                                                        "type": "string",
-                                                        "enum": ["low", "medium", "high"],
-                                                        "description": "Relative trading volume of the asset"
-                                                    },
-                                                    "volatility": {
-                                                        "type": "string",
-                                                        "enum": ["low", "medium", "high"],
-                                                        "description": "Current market volatility."
-                                                    },
-                                                    "analysis": {
-                                                        "type": "string",
-                                                        "description": "Start with a sentence that includes the ticker name and the current price (if legible, otherwise say not legible). Then assess the current market structure. Identify whether the price is trending, consolidating, or reversing. Evaluate how the current price action fits within the larger trend. Identify signs of momentum exhaustion or build up and explain the reasoning behind it. Analyze volatility expansion or contraction. Highlight key liquidity zones where price is likely to see significant reactions. Mention Smart Money concepts (previous swing highs/lows, order blocks, fair value gaps) only if clearly visible on the chart."
-                                                    }
-                                                },
-                                                "required": ["trendDirection", "trendStrength", "volume", "volatility", "analysis"],
-                                                "additionalProperties": False
-                                            },
-                                            "supportResistance": {
-                                                "type": "object",
-                                                "properties": {
-                                                    "supportLevels": {
-                                                        "type": "array",
-                                                        "items": {"type": "string"},
-                                                        "description": "List of price points (1-2) representing support levels present in input image."
-                                                    },
-                                                    "resistanceLevels": {
-                                                        "type": "array",
-                                                        "items": {"type": "string"},
-                                                        "description": "List of price points (1-2) representing resistance levels present in input image"
-                                                    },
-                                                    "analysis": {
-                                                        "type": "string",
-                                                        "description": "Only provide analysis if support & resistance levels are clearly drawn or confidently inferred from visible market structure. Do not use the current price line as a support or resistance level. Provide accurate numbers only if legible; otherwise leave supportLevels and resistanceLevels arrays empty. Explain if reactions are strengthening or weakening."
-                                                    }
-                                                },
-                                                "required": ["supportLevels", "resistanceLevels", "analysis"],
-                                                "additionalProperties": False
-                                            },
-                                            "candlestickPatterns": {
-                                                "type": "object",
-                                                "properties": {
-                                                    "recognizedPatterns": {
-                                                        "type": "array",
-                                                        "items": {
-                                                            "type": "object",
-                                                            "properties": {
-                                                                "patternName": {
-                                                                    "type": "string",
-                                                                    "description": "Name of the recognized candlestick pattern."
-                                                                },
-                                                                "analysis": {
-                                                                    "type": "string",
-                                                                    "description": "Identify candlestick patterns only if their full structure is clearly visible. For each, describe its structure and typical implication in context. If no clear patterns are visible, return an empty recognizedPatterns array."
-                                                                }
-                                                            },
-                                                            "required": ["patternName", "analysis"],
-                                                            "additionalProperties": False
-                                                        }
-                                                    }
-                                                },
-                                                "required": ["recognizedPatterns"],
-                                                "additionalProperties": False
-                                            },
-                                            "indicatorAnalyses": {
-                                                "type": "object",
-                                                "properties": {
-                                                    "selectedIndicators": {
-                                                        "type": "array",
-                                                        "items": {
-                                                            "type": "object",
-                                                            "properties": {
-                                                                "indicatorName": {
-                                                                    "type": "string",
-                                                                    "description": "Type of indicator present in the input image"
-                                                                },
-                                                                "analysis": {
-                                                                    "type": "string",
-                                                                    "description": "Only include indicators that are visibly present on the chart (e.g., RSI, MACD, moving averages, VWAP, Bollinger Bands). If no indicators are visible, return an empty selectedIndicators array. For each indicator, describe its signal in context and end with a"
-                                                                }
-                                                            },
-                                                            "required": ["indicatorName", "analysis"],
-                                                            "additionalProperties": False
-                                                        }
-                                                    }
-                                                },
-                                                "required": ["selectedIndicators"],
-                                                "additionalProperties": False
-                                            },
-                                            "futureMarketPrediction": {
+                                    "required": ["trendDirection", "trendStrength", "volume", "volatility", "analysis"],
+                                    "additionalProperties": False
+                                },
+                                "supportResistance": {
+                                    "type": "object",
+                                    "properties": {
+                                        "supportLevels": {
+                                            "type": "array",
+                                            "items": {"type": "string"},
+                                            "description": "List of price points (1-2) representing support levels present in input image."
+                                        },
+                                        "resistanceLevels": {
+                                            "type": "array",
+                                            "items": {"type": "string"},
+                                            "description": "List of price points (1-2) representing resistance levels present in input image"
+                                        },
+                                        "analysis": {
+                                            "type": "string",
+                                            "description": "Only provide analysis if support & resistance levels are clearly drawn or confidently inferred from visible market structure. Do not use the current price line as a support or resistance level. Provide accurate numbers only if legible; otherwise leave supportLevels and resistanceLevels arrays empty. Explain if reactions are strengthening or weakening."
+                                        }
+                                    },
+                                    "required": ["supportLevels", "resistanceLevels", "analysis"],
+                                    "additionalProperties": False
+                                },
+                                "candlestickPatterns": {
+                                    "type": "object",
+                                    "properties": {
+                                        "recognizedPatterns": {
+                                            "type": "array",
+                                            "items": {
                                                 "type": "object",
                                                 "properties": {
-                                                    "timeHorizon": {
+                                                    "patternName": {
                                                         "type": "string",
-                                                        "enum": ["short_term", "medium_term", "long_term"],
-                                                        "description": "Timeframe for the market prediction"
+                                                        "description": "Name of the recognized candlestick pattern."
                                                     },
                                                     "analysis": {
                                                         "type": "string",
-                                                        "description": "Identify the timeframe if it is clearly visible; if not, state 'timeframe uncertain.' Choose a time horizon (short, medium, long) consistent with the chart. Assess likely market direction using visible price action, candlestick patterns, liquidity zones, order blocks, or fair value gaps. Mention breakouts or reversals only if supported by what is on the chart."
+                                                        "description": "Identify candlestick patterns only if their full structure is clearly visible. For each, describe its structure and typical implication in context. If no clear patterns are visible, return an empty recognizedPatterns array."
                                                     }
                                                 },
-                                                "required": ["timeHorizon", "analysis"],
+                                                "required": ["patternName", "analysis"],
                                                 "additionalProperties": False
-                                            },
-                                            "potentialTradeSetup": {
+                                            }
+                                        }
+                                    },
+                                    "required": ["recognizedPatterns"],
+                                    "additionalProperties": False
+                                },
+                                "indicatorAnalyses": {
+                                    "type": "object",
+                                    "properties": {
+                                        "selectedIndicators": {
+                                            "type": "array",
+                                            "items": {
                                                 "type": "object",
                                                 "properties": {
-                                                    "entryTargetPrice": {
-                                                        "type": "string",
-                                                        "description": "Recommended full price price for trade entry"
-                                                    },
-                                                    "stopLossPrice": {
+                                                    "indicatorName": {
                                                         "type": "string",
-                                                        "description": "Recommended full price for stop loss"
+                                                        "description": "Type of indicator present in the input image"
                                                     },
                                                     "analysis": {
                                                         "type": "string",
-                                                        "description": "Present one potential trade setup aligned to the user's trading style(s) and risk if provided, otherwise default to a balanced setup. Define a clear entry and stop loss only if exact prices are legible; otherwise describe them relative to visible structures (e.g., below swing low, at order block edge). Explain rationale, risk management, and profit taking. If timeframe mismatches the user's style, note that."
+                                                        "description": "Only include indicators that are visibly present on the chart (e.g., RSI, MACD, moving averages, VWAP, Bollinger Bands). If no indicators are visible, return an empty selectedIndicators array. For each indicator, describe its signal in context and end with a"
                                                     }
                                                 },
-                                                "required": ["entryTargetPrice", "stopLossPrice", "analysis"],
+                                                "required": ["indicatorName", "analysis"],
                                                 "additionalProperties": False
                                             }
+                                        }
+                                    },
+                                    "required": ["selectedIndicators"],
+                                    "additionalProperties": False
+                                },
+                                "futureMarketPrediction": {
+                                    "type": "object",
+                                    "properties": {
+                                        "timeHorizon": {
+                                            "type": "string",
+                                            "enum": ["short_term", "medium_term", "long_term"],
+                                            "description": "Timeframe for the market prediction"
                                         },
-                                        "required": [
-                                            "generalTrends",
-                                            "supportResistance",
-                                            "candlestickPatterns",
-                                            "indicatorAnalyses",
-                                            "futureMarketPrediction",
-                                            "potentialTradeSetup"
-                                        ],
-                                        "additionalProperties": False
-                                    }
+                                        "analysis": {
+                                            "type": "string",
+                                            "description": "Identify the timeframe if it is clearly visible; if not, state 'timeframe uncertain.' Choose a time horizon (short, medium, long) consistent with the chart. Assess likely market direction using visible price action, candlestick patterns, liquidity zones, order blocks, or fair value gaps. Mention breakouts or reversals only if supported by what is on the chart."
+                                        }
+                                    },
+                                    "required": ["timeHorizon", "analysis"],
+                                    "additionalProperties": False
                                 },
-                                "required": ["ticker", "features"],
-                                "additionalProperties": False
-                            }
-                        },
-                        "required": ["status", "result"],
-                        "additionalProperties": False
+                                "potentialTradeSetup": {
+                                    "type": "object",
+                                    "properties": {
+                                        "entryTargetPrice": {
+                                            "type": "string",
+                                            "description": "Recommended full price price for trade entry"
+                                        },
+                                        "stopLossPrice": {
+                                            "type": "string",
+                                            "description": "Recommended full price for stop loss"
+                                        },
+                                        "analysis": {
+                                            "type": "string",
+                                            "description": "Present one potential trade setup aligned to the user's trading style(s) and risk if provided, otherwise default to a balanced setup. Define a clear entry and stop loss only if exact prices are legible; otherwise describe them relative to visible structures (e.g., below swing low, at order block edge). Explain rationale, risk management, and profit taking. If timeframe mismatches the user's style, note that."
+                                        }
+                                    },
+                                    "required": ["entryTargetPrice", "stopLossPrice", "analysis"],
+                                    "additionalProperties": False
+                                }
+                            },
+                            "required": [
+                                "generalTrends",
+                                "supportResistance",
+                                "candlestickPatterns",
+                                "indicatorAnalyses",
+                                "futureMarketPrediction",
+                                "potentialTradeSetup"
+                            ],
+                            "additionalProperties": False
+                        }
                     },
-                    "strict": True
-                },
+                    "required": ["ticker", "features"],
+                    "additionalProperties": False
+                }
             },
-        }
+            "required": ["status", "result"],
+            "additionalProperties": False
+        },
+        "strict": True
+    },
+}
+
+CHART_ANALYSIS_SCHEMA_VERSION = hashlib.sha256(
+    json.dumps([chart_pool.models, CHART_ANALYSIS_RESPONSE_FORMAT], sort_keys=True).encode()
+).hexdigest()[:12]
+CHART_STREAM_PATHS = [("status",), ("result", "ticker")] + [
+    ("result", "features", section)
+    for section in CHART_ANALYSIS_RESPONSE_FORMAT["json_schema"]["schema"]["properties"]["result"]
+    ["properties"]["features"]["required"]
+]
+
+
+def chart_cache_key(image_bytes, trading_styles, risk):
+    styles = ",".join(sorted({style.strip().lower() for style in trading_styles}))
+    return ":".join([
+        "chart",
+        CHART_ANALYSIS_SCHEMA_VERSION,
+        prompt_store.version(OPENAI_PROMPT_FILE_PATH),
+        hashlib.sha256(image_bytes).hexdigest(),
+        hashlib.sha256(f"{styles}|{str(risk).strip().lower()}".encode()).hexdigest()[:16],
+    ])
+
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {CANDLESTICK_OPENAI_API_KEY}"
+CHART_ANALYSIS_PAYLOAD = {
+    "model": slot("model"),
+    "messages": [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": slot("prompt")
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": slot("image"),
+                        "detail": slot("detail")
+                    }
+                }
+            ]
         }
+    ],
+    "response_format": CHART_ANALYSIS_RESPONSE_FORMAT,
+}
+CHART_ANALYSIS_TEMPLATE = PayloadTemplate(CHART_ANALYSIS_PAYLOAD)
+CHART_ANALYSIS_STREAM_TEMPLATE = PayloadTemplate(dict(CHART_ANALYSIS_PAYLOAD, **STREAM_OPTIONS))
+
+
+def model_payload(template, **values):
+    """``render(model)`` for an upstream pool, rendering the body once per model it is sent to."""
+    bodies = {}
+
+    def render(model):
+        if model not in bodies:
+            with stage("payload"):
+                bodies[model] = template.render(model=model, **values)
+        return bodies[model]
+
+    return render
+
+
+def render_chart_payload(prompt, image, stream=False):
+    template = CHART_ANALYSIS_STREAM_TEMPLATE if stream else CHART_ANALYSIS_TEMPLATE
+    return model_payload(template, prompt=prompt, image=image, detail=image.detail)
+
+
+def parse_chart_content(content_str):
+    try:
+        parsed_content = json.loads(content_str)
+    except json.JSONDecodeError:
+        return {
+            "error": "Could not parse JSON from OpenAI response",
+            "raw_content": content_str
+        }, 500
+
+    if "status" not in parsed_content:
+        return {
+            "error": "Missing 'status' field in parsed content",
+            "parsed_content": parsed_content
+        }, 500
+
+    if parsed_content["status"]:
+        if "result" not in parsed_content:
+            return {
+                "error": "Missing 'result' field in parsed content",
+                "parsed_content": parsed_content
+            }, 500
+        return parsed_content["result"], 200
+    else:
+        return {
+            "error": "The provided image is not a valid trading chart"
+        }, 400
+
+
+def cache_chart_result(cache_key, body, status, score=None):
+    # Only real model verdicts are cached, not upstream or parsing failures.
+    if status in (200, 400):
+        chart_cache.set(cache_key, {"body": body, "status": status})
+        if score is not None:
+            chart_filter.record_verdict(score, status == 200)
+
+
+def prefilter_chart(image):
+    """Returns the local chart score and whether the image should be rejected without calling OpenAI."""
+    if not chart_filter.enabled:
+        return None, False
+    score = chart_filter.score(image.data)
+    return score, chart_filter.should_reject(score)
+
+
+def chart_prompt(trading_styles, risk):
+    prompt = get_txt_file(OPENAI_PROMPT_FILE_PATH)
+    trading_styles = ", ".join(trading_styles)
+    return f"User trading style(s): {trading_styles}. User risk preference: {risk}.\n\n{prompt}"
+
+
+def chart_cost(prompt_chars, image):
+    return estimate_tokens(prompt_chars, image, CHART_COMPLETION_TOKENS)
+
+
+def request_chart_analysis(body, cost, priority=PRIORITY_INTERACTIVE):
+    with stage("upstream"):
+        response = chart_pool.post(body, cost=cost, priority=priority, route="chart")
+    if response.status_code != 200:
+        app.logger.warning("OpenAI chart analysis returned %s: %s", response.status_code, response.text[:1000])
+        return {"error": "OpenAI API error", "details": response.json()}, 500
+
+    with stage("parse"):
+        return parse_chart_response(response.json())
+
+
+def parse_chart_response(openai_json):
+    record_usage("openai", openai_json.get("usage"))
+    if (
+        "choices" in openai_json and
+        len(openai_json["choices"]) > 0 and
+        "message" in openai_json["choices"][0] and
+        "content" in openai_json["choices"][0]["message"]
+    ):
+        content_str = openai_json["choices"][0]["message"]["content"]
+        return parse_chart_content(content_str)
+
+    else:
+        return {
+            "error": "Invalid response format from OpenAI",
+            "openai_json": openai_json
+        }, 500
+
+
+def stream_chart_analysis(body, cost, on_value):
+    """Like request_chart_analysis, but calls ``on_value(path, value)`` as soon as
+    the status or ticker has been generated."""
+    with stage("upstream"):
+        response = chart_pool.post(body, cost=cost, stream=True, route="chart")
+    if response.status_code != 200:
+        return {"error": "OpenAI API error", "details": response.json()}, 500
+
+    parser = IncrementalJSONParser([("status",), ("result", "ticker")])
+    try:
+        with stage("stream"):
+            for content in iter_stream_content(response, on_usage=openai_usage):
+                for path, value in parser.feed(content):
+                    on_value(path, value)
+    finally:
+        response.close()
+    with stage("parse"):
+        return parse_chart_content(parser.text)
+
 
-        response = requests.post(OPENAI_BASE_URL, json=payload, headers=headers, timeout=60)
+PreparedChart = namedtuple("PreparedChart", ["cache_key", "image", "score"])
+
+
+def prepare_chart(image_bytes, trading_styles, risk):
+    """Everything the chart endpoints do with an upload before calling OpenAI.
+
+    Returns ``(answer, chart)``. ``answer`` is a ``(body, status)`` to reply
+    with right away (a cached verdict, an image that cannot be decoded or
+    one the pre-filter rejects) and ``chart`` is None; otherwise ``answer``
+    is None and ``chart`` holds the cache key, the normalized image and its
+    pre-filter score.
+    """
+    with stage("cache"):
+        cache_key = chart_cache_key(image_bytes, trading_styles, risk)
+        cached = chart_cache.get(cache_key)
+    if cached is not None:
+        return (cached["body"], cached["status"]), None
+
+    try:
+        with stage("normalize"):
+            image = image_normalizer.normalize(image_bytes)
+    except InvalidImageError as e:
+        return ({"error": str(e)}, 400), None
+
+    with stage("prefilter"):
+        score, rejected = prefilter_chart(image)
+    if rejected:
+        return ({"error": "The provided image is not a valid trading chart"}, 400), None
+    return None, PreparedChart(cache_key, image, score)
+
+
+def finish_chart(chart, body, status):
+    cache_chart_result(chart.cache_key, body, status, chart.score)
+    return body, status
+
+
+def request_prepared_chart(chart, prompt, priority=PRIORITY_INTERACTIVE):
+    """Analyzes a prepared chart with ``prompt`` (text or JSON-encoded bytes) and caches the verdict."""
+    body = render_chart_payload(prompt, chart.image)
+    return finish_chart(chart, *request_chart_analysis(body, chart_cost(len(prompt), chart.image), priority))
+
+
+def analyze_chart(image_bytes, trading_styles, risk, priority=PRIORITY_INTERACTIVE):
+    """The chart analysis of an uploaded image as ``(body, status)``, served from the cache when possible."""
+    answer, chart = prepare_chart(image_bytes, trading_styles, risk)
+    if answer is not None:
+        return answer
+
+    with stage("prompt"):
+        prompt = chart_prompt(trading_styles, risk)
+    return request_prepared_chart(chart, prompt, priority)
+
+
+@app.route("/getChartAnalysis", methods=["POST"])
+def get_chart_analysis():
+    try:
+        try:
+            with stage("decode"):
+                data, image_bytes = upload_reader.read(request)
+        except InvalidImageError as e:
+            return image_error_response(e)
+
+        trading_styles = data.get("tradingStyles", ["Not Sure"])
+        risk = data.get("risk", "Not Sure")
+
+        if not wants_stream(data):
+            body, status = analyze_chart(image_bytes, trading_styles, risk)
+            with stage("respond"):
+                return jsonify(body), status
+
+        answer, chart = prepare_chart(image_bytes, trading_styles, risk)
+        if answer is not None:
+            body, status = answer
+            document = {"status": status == 200}
+            if status == 200:
+                document["result"] = body
+            return replay_stream(document, CHART_STREAM_PATHS, body, status)
+
+        with stage("prompt"):
+            prompt = chart_prompt(trading_styles, risk)
+        body = render_chart_payload(prompt, chart.image, stream=True)
+        with stage("upstream"):
+            response = chart_pool.post(body, cost=chart_cost(len(prompt), chart.image), stream=True, route="chart")
         if response.status_code != 200:
-            app.logger.debug('JON SNOW!!!')
-            app.logger.debug(response.json())
             return jsonify({"error": "OpenAI API error", "details": response.json()}), 500
+        return stream_response(
+            response,
+            CHART_STREAM_PATHS,
+            parse_chart_content,
+            on_result=lambda body, status: finish_chart(chart, body, status),
+        )
+
+    except UNAVAILABLE as e:
+        return unavailable_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+CHART_BATCH_MAX_IMAGES = int(os.environ.get("CHART_BATCH_MAX_IMAGES", "8"))
+CHART_BATCH_CONCURRENCY = int(os.environ.get("CHART_BATCH_CONCURRENCY", "4"))
+CHART_BATCH_MAX_BYTES = CHART_BATCH_MAX_IMAGES * (upload_reader.max_bytes * 4 // 3) + FIELDS_ALLOWANCE
+# A full batch is the largest body any endpoint takes; this also bounds chunked bodies without a Content-Length.
+app.config["MAX_CONTENT_LENGTH"] = CHART_BATCH_MAX_BYTES
+
+CHART_BATCH_SUMMARY_INSTRUCTIONS = (
+    "You are given technical analyses of several charts of the same asset, usually on different timeframes, "
+    "in the order the user uploaded them. Compare them and write a short cross-timeframe summary: where the "
+    "timeframes agree or conflict on trend, which levels line up across timeframes, and how that should change "
+    "the trade setup for the user's trading style and risk."
+)
 
+CHART_BATCH_SUMMARY_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "chart_batch_summary",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "trendAlignment": {
+                    "type": "string",
+                    "enum": ["aligned", "mixed", "conflicting"],
+                    "description": "Whether the analysed timeframes agree on the trend direction"
+                },
+                "analysis": {
+                    "type": "string",
+                    "description": "Cross-timeframe summary of the individual analyses"
+                }
+            },
+            "required": ["trendAlignment", "analysis"],
+            "additionalProperties": False
+        },
+        "strict": True
+    }
+}
+
+
+def analyze_batch_item(base64_image, trading_styles, risk, prompt_json):
+    try:
+        with stage("decode"):
+            image_bytes = upload_reader.decode(base64_image)
+    except InvalidImageError as e:
+        return image_error(e)
+
+    answer, chart = prepare_chart(image_bytes, trading_styles, risk)
+    if answer is not None:
+        return answer
+    return request_prepared_chart(chart, prompt_json, PRIORITY_BATCH)
+
+
+def summarize_chart_batch(results, trading_styles, risk):
+    analyses = [item["result"] for item in results if item["status"] == 200]
+    if len(analyses) < 2:
+        return None
+
+    payload = {
+        "messages": [
+            {"role": "system", "content": CHART_BATCH_SUMMARY_INSTRUCTIONS},
+            {
+                "role": "user",
+                "content": (
+                    f"User trading style(s): {', '.join(trading_styles)}. User risk preference: {risk}.\n\n"
+                    f"{json.dumps(analyses)}"
+                )
+            }
+        ],
+        "response_format": CHART_BATCH_SUMMARY_RESPONSE_FORMAT,
+    }
+    cost = estimate_tokens(len(payload["messages"][1]["content"]), completion=SUMMARY_COMPLETION_TOKENS)
+    try:
+        with stage("summary"):
+            response = chart_pool.post(
+                lambda model: encode_json(dict(payload, model=model)), cost=cost, priority=PRIORITY_BATCH,
+            )
+    except UNAVAILABLE as e:
+        return {"error": str(e), "retryAfter": math.ceil(e.retry_after)}
+    except requests.RequestException as e:
+        # The summary is optional; the analyses already made are still returned.
+        app.logger.warning("OpenAI batch summary failed: %s", e)
+        return {"error": f"Could not get the summary: {e}"}
+    if response.status_code != 200:
+        try:
+            details = response.json()
+        except ValueError:
+            details = response.text[:1000]
+        return {"error": "OpenAI API error", "details": details}
+    try:
         openai_json = response.json()
-        if (
-            "choices" in openai_json and
-            len(openai_json["choices"]) > 0 and
-            "message" in openai_json["choices"][0] and
-            "content" in openai_json["choices"][0]["message"]
-        ):
-            content_str = openai_json["choices"][0]["message"]["content"]
+        record_usage("openai", openai_json.get("usage"))
+        return json.loads(openai_json["choices"][0]["message"]["content"])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return {"error": "Could not parse summary from OpenAI response"}
+
+
+@app.route("/getChartAnalysisBatch", methods=["POST"])
+def get_chart_analysis_batch():
+    try:
+        try:
+            data = upload_reader.read_json(request, CHART_BATCH_MAX_BYTES)
+        except ImageTooLargeError as e:
+            return image_error_response(e)
+        if not isinstance(data, dict) or not isinstance(data.get("base64Images"), list) or not data["base64Images"]:
+            return jsonify({"error": "Missing 'base64Images' list in JSON body."}), 400
+        if len(data["base64Images"]) > CHART_BATCH_MAX_IMAGES:
+            return jsonify({"error": f"At most {CHART_BATCH_MAX_IMAGES} images can be analyzed per batch."}), 400
+
+        trading_styles = data.get("tradingStyles", ["Not Sure"])
+        risk = data.get("risk", "Not Sure")
+
+        # The prompt is fetched and JSON-encoded once for the whole batch.
+        with stage("prompt"):
+            prompt_json = encode_json(chart_prompt(trading_styles, risk))
+
+        def analyze(base64_image):
             try:
-                parsed_content = json.loads(content_str)
-            except json.JSONDecodeError:
-                return jsonify({
-                    "error": "Could not parse JSON from OpenAI response",
-                    "raw_content": content_str
-                }), 500
-
-            if "status" not in parsed_content:
-                return jsonify({
-                    "error": "Missing 'status' field in parsed content",
-                    "parsed_content": parsed_content
-                }), 500
-
-            if parsed_content["status"]:
-                if "result" not in parsed_content:
-                    return jsonify({
-                        "error": "Missing 'result' field in parsed content",
-                        "parsed_content": parsed_content
-                    }), 500
-                return jsonify(parsed_content["result"]), 200
+                return analyze_batch_item(base64_image, trading_styles, risk, prompt_json)
+            except UNAVAILABLE as e:
+                return {"error": str(e), "retryAfter": math.ceil(e.retry_after)}, 503
+            except Exception as e:
+                return {"error": str(e)}, 500
+
+        with ThreadPoolExecutor(max_workers=min(CHART_BATCH_CONCURRENCY, len(data["base64Images"]))) as executor:
+            outcomes = list(executor.map(propagate(analyze), data["base64Images"]))
+
+        results = []
+        for body, status in outcomes:
+            if status == 200:
+                results.append({"status": status, "result": body})
             else:
-                return jsonify({
-                    "error": "The provided image is not a valid trading chart"
-                }), 400
+                results.append(dict(body, status=status))
 
-        else:
-            return jsonify({
-                "error": "Invalid response format from OpenAI",
-                "openai_json": openai_json
-            }), 500
+        response = {"results": results}
+        if data.get("summarize"):
+            response["summary"] = summarize_chart_batch(results, trading_styles, risk)
+        return jsonify(response), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def normalize_user_prompt(user_prompt):
+    return " ".join(str(user_prompt).split())
+
+
+def articles_cache_key(user_prompt):
+    return ":".join([
+        "articles",
+        PERPLEXITY_SEARCH_RECENCY,
+        prompt_store.version(PERPLEXITY_PROMPT_FILE_PATH),
+        hashlib.sha256(user_prompt.casefold().encode()).hexdigest(),
+    ])
+
+
+def fetch_articles(user_prompt):
+    with stage("prompt"):
+        prompt = get_txt_file(PERPLEXITY_PROMPT_FILE_PATH)
+
+    payload = {
+        "model": "sonar",
+        "messages": [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "article_response",
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "articles": {
+                            "type": "array",
+                            "description": "List of relevant news articles",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "title": {
+                                        "type": "string",
+                                        "description": "The headline of the news article"
+                                    },
+                                    "summary": {
+                                        "type": "string",
+                                        "description": "A brief summary explaining the article's relevance to the chart analysis"
+                                    },
+                                    "link": {
+                                        "type": "string",
+                                        "description": "The link to the news article"
+                                    }
+                                },
+                                "required": ["title", "summary", "link"],
+                                "additionalProperties": False
+                            }
+                        }
+                    },
+                    "required": ["articles"],
+                    "additionalProperties": False
+                }
+            }
+        },
+        "temperature": 0.0,
+        "top_p": 0.9,
+        "return_images": False,
+        "return_related_questions": False,
+        "search_recency_filter": PERPLEXITY_SEARCH_RECENCY,
+        "top_k": 0,
+        "stream": False,
+        "presence_penalty": 0,
+        "frequency_penalty": 1
+    }
+    headers = {
+        "Authorization": f"Bearer {PERPLEXITY_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+    cost = estimate_tokens(len(prompt) + len(user_prompt), completion=ARTICLES_COMPLETION_TOKENS)
+    with stage("upstream"):
+        response = perplexity_client.post(
+            json=payload, headers=headers, limiter=perplexity_limiter, cost=cost, route="articles",
+        )
+    if response.status_code != 200:
+        app.logger.warning("Perplexity returned %s: %s", response.status_code, response.text[:1000])
+        return {"error": "Perplexity API error", "details": response.json()}, 500
+
+    response_json = response.json()
+    record_usage("perplexity", response_json.get("usage"))
+    if ("choices" in response_json and
+        isinstance(response_json["choices"], list) and
+        len(response_json["choices"]) > 0 and
+        "message" in response_json["choices"][0] and
+        "content" in response_json["choices"][0]["message"]):
+
+        content_str = response_json["choices"][0]["message"]["content"]
+
+        cleaned_content = content_str.strip()
+        cleaned_content = cleaned_content.replace("json", "")
+        cleaned_content = cleaned_content.replace("`", "")
+
+        try:
+            with stage("parse"):
+                parsed = json.loads(cleaned_content)
+            return parsed, 200
+        except json.JSONDecodeError:
+            return {
+                "error": "Could not parse JSON from Perplexity response",
+                "raw_content": content_str
+            }, 500
+    else:
+        return {
+            "error": "Invalid response format from Perplexity",
+            "raw_response": response_json
+        }, 500
+
+
 @app.route("/getArticles", methods=["POST"])
 def get_articles():
     try:
@@ -310,227 +1133,534 @@ def get_articles():
         if not data or "userPrompt" not in data:
             return jsonify({"error": "Missing 'userPrompt' in JSON body."}), 400
 
-        user_prompt = data["userPrompt"]
-        prompt = get_txt_file(PERPLEXITY_PROMPT_FILE_PATH)
+        body, status = load_articles(data["userPrompt"], data.get("enrichLinks", ARTICLE_LINKS_ENRICH))
+        return jsonify(body), status
+
+    except UNAVAILABLE as e:
+        return unavailable_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def load_articles(user_prompt, enrich_links=False):
+    user_prompt = normalize_user_prompt(user_prompt)
+    body, status = articles_cache.get_or_load(articles_cache_key(user_prompt), lambda: fetch_articles(user_prompt))
+    if enrich_links and status == 200 and isinstance(body.get("articles"), list):
+        # Links are checked per URL, so the cached Perplexity result is left as it is.
+        with stage("links"):
+            body = dict(body, articles=link_enricher.enrich(body["articles"]))
+    return body, status
+
+
+# Runs the analysis and articles calls of /getChartAnalysisWithArticles. It
+# outlives requests, so a request that is done never waits for an articles
+# call it no longer needs (after a chart error or a changed ticker); that
+# call still fills the articles cache.
+COMBINED_WORKERS = int(os.environ.get("COMBINED_WORKERS", "64"))
+combined_executor = ThreadPoolExecutor(max_workers=COMBINED_WORKERS, thread_name_prefix="combined")
+
+
+class ArticlesLookup:
+    """Starts the articles call for a chart once a ticker is known.
+
+    The OCR ticker is used first so the call can overlap the chart analysis.
+    If the model later reports a different ticker, the articles are fetched
+    again for the model's ticker, which is what the response is about.
+    """
+
+    def __init__(self, executor, enrich_links=False):
+        self.executor = executor
+        self.enrich_links = enrich_links
+        self.ticker = None
+        self.source = None
+        self.future = None
+        self._lock = threading.Lock()
+
+    def start(self, ticker, source):
+        if not ticker or not str(ticker).strip():
+            return
+        with self._lock:
+            if self.source == "model" or normalize_ticker(self.ticker) == normalize_ticker(ticker):
+                return
+            if self.future is not None:
+                app.logger.info("Refetching articles for model ticker %s instead of OCR ticker %s", ticker, self.ticker)
+                self.future.cancel()
+            self.ticker = str(ticker).strip()
+            self.source = source
+            self.future = self.executor.submit(propagate(load_articles), self.ticker, self.enrich_links)
+
+    def result(self):
+        if self.future is None:
+            return None, None
+        try:
+            return self.future.result()
+        except UNAVAILABLE as e:
+            return {"error": str(e), "retryAfter": math.ceil(e.retry_after)}, 503
+        except Exception as e:
+            return {"error": str(e)}, 500
+
+
+@app.route("/getChartAnalysisWithArticles", methods=["POST"])
+def get_chart_analysis_with_articles():
+    try:
+        try:
+            with stage("decode"):
+                data, image_bytes = upload_reader.read(request)
+        except InvalidImageError as e:
+            return image_error_response(e)
+
+        trading_styles = data.get("tradingStyles", ["Not Sure"])
+        risk = data.get("risk", "Not Sure")
+
+        articles = ArticlesLookup(combined_executor, data.get("enrichLinks", ARTICLE_LINKS_ENRICH))
+        ocr_ticker = None
+
+        answer, chart = prepare_chart(image_bytes, trading_styles, risk)
+        if answer is not None:
+            chart_body, chart_status = answer
+        else:
+            def on_value(path, value):
+                if path == ("result", "ticker"):
+                    articles.start(value, "model")
+
+            # The vision call starts first; OCR runs while it is in flight.
+            with stage("prompt"):
+                prompt = chart_prompt(trading_styles, risk)
+            body = render_chart_payload(prompt, chart.image, stream=True)
+            analysis = combined_executor.submit(
+                propagate(stream_chart_analysis), body, chart_cost(len(prompt), chart.image), on_value,
+            )
+            with stage("ocr"):
+                ocr_ticker = ticker_reader.read(chart.image.data)
+            articles.start(ocr_ticker, "ocr")
+
+            chart_body, chart_status = finish_chart(chart, *analysis.result())
+
+        if chart_status != 200:
+            return jsonify(chart_body), chart_status
+
+        articles.start(chart_body.get("ticker"), "model")
+        if ocr_ticker:
+            ticker_reader.record_model_ticker(ocr_ticker, chart_body.get("ticker"))
+        articles_body, articles_status = articles.result()
+
+        response = {"analysis": chart_body, "ticker": articles.ticker, "tickerSource": articles.source}
+        if articles_status == 200:
+            response["articles"] = articles_body.get("articles", [])
+        elif articles_status is not None:
+            response["articlesError"] = dict(articles_body, status=articles_status)
+        return jsonify(response), 200
+
+    except UNAVAILABLE as e:
+        return unavailable_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 
-        payload = {
-            "model": "sonar",
-            "messages": [
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            "response_format": {
-                "type": "json_schema",
-                "json_schema": {
-                    "name": "article_response",
-                    "schema": {
+RIZZ_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "decode_situationship",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "responses": {
+                    "type": "array",
+                    "description": "List of exactly 4 categorized convo responses",
+                    "items": {
                         "type": "object",
-                        "properties": {
-                            "articles": {
-                                "type": "array",
-                                "description": "List of relevant news articles",
-                                "items": {
-                                    "type": "object",
-                                    "properties": {
-                                        "title": {
-                                            "type": "string",
-                                            "description": "The headline of the news article"
-                                        },
-                                        "summary": {
-                                            "type": "string",
-                                            "description": "A brief summary explaining the article's relevance to the chart analysis"
-                                        },
-                                        "link": {
-                                            "type": "string",
-                                            "description": "The link to the news article"
-                                        }
-                                    },
-                                    "required": ["title", "summary", "link"],
-                                    "additionalProperties": False
+                            "properties": {
+                                "text": {
+                                    "type": "string",
+                                    "description": "Text message response pulled from the conversation"
+                                },
+                                "category": {
+                                    "type": "string",
+                                    "enum": ["rizz", "nsfw", "romantic", "end it"],
+                                    "description": "Category that best describes the tone or intent of the response"
                                 }
-                            }
-                        },
-                        "required": ["articles"],
-                        "additionalProperties": False
+                            },
+                            "required": ["text", "category"],
+                            "additionalProperties": False
                     }
+                },
+                "interestLevel": {
+                    "type": "number",
+                    "description": "Score from 0 to 10 indicating how interested the other person seems based on message tone, effort, and engagement"
+                },
+                "breakdown": {
+                    "type": "string",
+                    "description": "Analyze the screenshot and user input describing the situationship. Identify emotional cues, contradictions, message tone, ghosting patterns, power dynamics, or mismatched effort. Summarize what’s really going on in a concise paragraph and give a direct recommendation (e.g., keep going, cut it off, call it out, etc.)."
+                },
+                "redFlags": {
+                    "type": "string",
+                    "description": "A 3–4 sentence summary highlighting the most concerning behaviors or signals in the conversation, such as breadcrumbing, lovebombing, mixed signals, emotional unavailability"
+                },
+                "greenFlags": {
+                    "type": "string",
+                    "description": "A 3–4 sentence summary highlighting positive behaviors in the conversation, such as signs of real interest, emotional availability, consistency"
                 }
             },
-            "temperature": 0.0,
-            "top_p": 0.9,
-            "return_images": False,
-            "return_related_questions": False,
-            "search_recency_filter": "month",
-            "top_k": 0,
-            "stream": False,
-            "presence_penalty": 0,
-            "frequency_penalty": 1
-        }
-        headers = {
-            "Authorization": f"Bearer {PERPLEXITY_API_KEY}",
-            "Content-Type": "application/json"
+            "required": ["responses", "interestLevel", "breakdown", "redFlags", "greenFlags"],
+            "additionalProperties": False
+        },
+        "strict": True
+    }
+}
+
+RIZZ_STREAM_PATHS = [(key,) for key in RIZZ_RESPONSE_FORMAT["json_schema"]["schema"]["required"]]
+
+
+RIZZ_PAYLOAD = {
+    "model": slot("model"),
+    "temperature": 0.7,
+    "messages": [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": slot("prompt")
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": slot("image"),
+                        "detail": slot("detail")
+                    }
+                }
+            ]
         }
+    ],
+    "response_format": RIZZ_RESPONSE_FORMAT,
+}
+RIZZ_TEMPLATE = PayloadTemplate(RIZZ_PAYLOAD)
+RIZZ_STREAM_TEMPLATE = PayloadTemplate(dict(RIZZ_PAYLOAD, **STREAM_OPTIONS))
 
-        response = requests.post(PERPLEXITY_BASE_URL, json=payload, headers=headers, timeout=60)
-        if response.status_code != 200:
-            return jsonify({"error": "Perplexity API error", "details": response.json()}), 500
+# Incremental session uploads carry the new messages in the prompt instead of the screenshot.
+RIZZ_TEXT_PAYLOAD = dict(RIZZ_PAYLOAD, messages=[{"role": "user", "content": slot("prompt")}])
+RIZZ_TEXT_TEMPLATE = PayloadTemplate(RIZZ_TEXT_PAYLOAD)
+RIZZ_TEXT_STREAM_TEMPLATE = PayloadTemplate(dict(RIZZ_TEXT_PAYLOAD, **STREAM_OPTIONS))
 
-        response_json = response.json()
-        if ("choices" in response_json and
-            isinstance(response_json["choices"], list) and
-            len(response_json["choices"]) > 0 and
-            "message" in response_json["choices"][0] and
-            "content" in response_json["choices"][0]["message"]):
 
-            content_str = response_json["choices"][0]["message"]["content"]
+def render_rizz_payload(prompt, image, stream=False):
+    if image is None:
+        template = RIZZ_TEXT_STREAM_TEMPLATE if stream else RIZZ_TEXT_TEMPLATE
+        return model_payload(template, prompt=prompt)
+    template = RIZZ_STREAM_TEMPLATE if stream else RIZZ_TEMPLATE
+    return model_payload(template, prompt=prompt, image=image, detail=image.detail)
 
-            cleaned_content = content_str.strip()
-            cleaned_content = cleaned_content.replace("json", "")
-            cleaned_content = cleaned_content.replace("`", "")
 
-            try:
-                parsed = json.loads(cleaned_content)
-                return jsonify(parsed), 200
-            except json.JSONDecodeError:
-                return jsonify({
-                    "error": "Could not parse JSON from Perplexity response",
-                    "raw_content": content_str
-                }), 500
-        else:
-            return jsonify({
-                "error": "Invalid response format from Perplexity",
-                "raw_response": response_json
-            }), 500
+def parse_rizz_content(raw_content):
+    try:
+        return json.loads(raw_content), 200
+    except json.JSONDecodeError:
+        return {
+            "error": "Could not parse JSON from model response",
+            "raw_content": raw_content
+        }, 500
+
+
+def rizz_prompt_for(description, name):
+    with stage("prompt"):
+        rizz_prompt = get_txt_file(RIZZ_PROMPT_FILE_PATH)
+
+    if len(name) > 0:
+        rizz_prompt += f"\nBelow is user's description of their situationship:\n{description} with {name}"
+    else:
+        rizz_prompt += f"\nBelow is user's description of their situationship:\n{description}"
+    return rizz_prompt
+
+
+def request_rizz(rizz_prompt, image, stream=False, priority=PRIORITY_INTERACTIVE):
+    body = render_rizz_payload(rizz_prompt, image, stream=stream)
+    with stage("upstream"):
+        return rizz_pool.post(
+            body, cost=estimate_tokens(len(rizz_prompt), image, RIZZ_COMPLETION_TOKENS), priority=priority,
+            stream=stream, route="rizz",
+        )
+
+
+def parse_rizz_response(response_data):
+    record_usage("openai", response_data.get("usage"))
+    if (
+        "choices" in response_data and
+        len(response_data["choices"]) > 0 and
+        "message" in response_data["choices"][0] and
+        "content" in response_data["choices"][0]["message"]
+    ):
+        raw_content = response_data["choices"][0]["message"]["content"]
+        with stage("parse"):
+            return parse_rizz_content(raw_content)
+    else:
+        return {
+            "error": "Invalid structure in response",
+            "response_data": response_data
+        }, 500
+
+
+def conversation_session_key(session_id, description, name):
+    return hashlib.sha256(json.dumps([str(session_id), description, name]).encode()).hexdigest()
+
+
+def valid_session_id(session_id):
+    return not session_id or (
+        isinstance(session_id, str) and CONVERSATION_SESSION_ID_MIN_LENGTH <= len(session_id) <= 255
+    )
+
+
+def read_conversation(image_data):
+    """The OCR transcript of a screenshot, or None when it cannot be read."""
+    try:
+        return conversation_reader.read(image_data)
+    except Exception:
+        # Only costs the session its diff; the upload is answered from the image.
+        app.logger.exception("Could not read the conversation screenshot")
+        return None
+
+
+def plan_rizz_upload(image, description, name, session_id=None):
+    """What to send the model for an upload, as ``(prompt, image, plan, transcript)``.
+
+    Outside a session ``plan`` and ``transcript`` are None. In a session the
+    screenshot is read with OCR; if it continues what the session has seen,
+    only the new messages are sent, in the prompt, and ``image`` is None.
+    ``transcript`` is a future when the session is new, since nothing is
+    diffed against it yet.
+    """
+    prompt = rizz_prompt_for(description, name)
+    if not session_id:
+        return prompt, image, None, None
+
+    key = conversation_session_key(session_id, description, name)
+    session = conversation_sessions.get(key)
+    if session is None:
+        transcript = conversation_executor.submit(propagate(read_conversation), image.data)
+        plan = conversation_sessions.plan(key, None, None)
+    else:
+        with stage("ocr"):
+            transcript = read_conversation(image.data)
+        plan = conversation_sessions.plan(key, session, transcript)
+    record_conversation_upload(plan.mode)
+
+    if plan.mode == INCREMENTAL:
+        return prompt + conversation_sessions.context(plan, name), None, plan, transcript
+    return prompt, image, plan, transcript
+
+
+def finish_rizz_upload(plan, transcript, body, status):
+    if plan is None or status != 200:
+        return
+    if isinstance(transcript, Future):
+        transcript = transcript.result()
+    conversation_sessions.update(plan, transcript, body)
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
 
+def generate_rizz(image_bytes, description, name, priority=PRIORITY_INTERACTIVE, session_id=None):
+    """The suggested replies for an uploaded conversation as ``(body, status)``."""
+    try:
+        with stage("normalize"):
+            image = image_normalizer.normalize(image_bytes)
+    except InvalidImageError as e:
+        return {"error": str(e)}, 400
+
+    prompt, image, plan, transcript = plan_rizz_upload(image, description, name, session_id)
+    if plan is not None and plan.mode == UNCHANGED:
+        # Nothing new in the chat since the last screenshot, so the last answer still stands.
+        finish_rizz_upload(plan, transcript, plan.session["result"], 200)
+        return plan.session["result"], 200
+
+    resp = request_rizz(prompt, image, priority=priority)
+    if resp.status_code != 200:
+        app.logger.warning("OpenAI responses returned %s: %s", resp.status_code, resp.text[:1000])
+        return {"error": resp.json()}, 500
+    body, status = parse_rizz_response(resp.json())
+    finish_rizz_upload(plan, transcript, body, status)
+    return body, status
 
 
 @app.route("/getResponses", methods=["POST"])
 def generate_response():
     try:
-        data = request.get_json()
-        if not data or "base64Image" not in data:
-            return jsonify({"error": "Missing 'base64Image' in request JSON."}), 400
+        try:
+            with stage("decode"):
+                data, image_bytes = upload_reader.read(request)
+        except InvalidImageError as e:
+            return image_error_response(e)
 
         description = data["description"]
         name = data["name"]
-        base64_image = data["base64Image"]
+        session_id = data.get("sessionId")
+        if not valid_session_id(session_id):
+            return jsonify({"error": SESSION_ID_ERROR}), 400
 
-        rizz_prompt = get_txt_file(RIZZ_PROMPT_FILE_PATH)
-
-        if len(name) > 0:
-            rizz_prompt += f"\nBelow is user's description of their situationship:\n{description} with {name}"
-        else:
-            rizz_prompt += f"\nBelow is user's description of their situationship:\n{description}"
+        if not wants_stream(data):
+            body, status = generate_rizz(image_bytes, description, name, session_id=session_id)
+            with stage("respond"):
+                return jsonify(body), status
 
-        payload = {
-            "model": "gpt-5-mini-2025-08-07",
-            "temperature": 0.7,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": rizz_prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}",
-                                "detail": "high"
-                            }
-                        }
-                    ]
-                }
-            ],
-            "response_format": {
-                "type": "json_schema",
-                "json_schema": {
-                    "name": "decode_situationship",
-                    "schema": {
-                        "type": "object",
-                        "properties": {
-                            "responses": {
-                                "type": "array",
-                                "description": "List of exactly 4 categorized convo responses",
-                                "items": {
-                                    "type": "object",
-                                        "properties": {
-                                            "text": {
-                                                "type": "string",
-                                                "description": "Text message response pulled from the conversation"
-                                            },
-                                            "category": {
-                                                "type": "string",
-                                                "enum": ["rizz", "nsfw", "romantic", "end it"],
-                                                "description": "Category that best describes the tone or intent of the response"
-                                            }
-                                        },
-                                        "required": ["text", "category"],
-                                        "additionalProperties": False
-                                }
-                            },
-                            "interestLevel": {
-                                "type": "number",
-                                "description": "Score from 0 to 10 indicating how interested the other person seems based on message tone, effort, and engagement"
-                            },
-                            "breakdown": {
-                                "type": "string",
-                                "description": "Analyze the screenshot and user input describing the situationship. Identify emotional cues, contradictions, message tone, ghosting patterns, power dynamics, or mismatched effort. Summarize what’s really going on in a concise paragraph and give a direct recommendation (e.g., keep going, cut it off, call it out, etc.)."
-                            },
-                            "redFlags": {
-                                "type": "string",
-                                "description": "A 3–4 sentence summary highlighting the most concerning behaviors or signals in the conversation, such as breadcrumbing, lovebombing, mixed signals, emotional unavailability"
-                            },
-                            "greenFlags": {
-                                "type": "string",
-                                "description": "A 3–4 sentence summary highlighting positive behaviors in the conversation, such as signs of real interest, emotional availability, consistency"
-                            }
-                        },
-                        "required": ["responses", "interestLevel", "breakdown", "redFlags", "greenFlags"],
-                        "additionalProperties": False
-                    },
-                    "strict": True
-                }
-            }
-        }
+        try:
+            with stage("normalize"):
+                image = image_normalizer.normalize(image_bytes)
+        except InvalidImageError as e:
+            return jsonify({"error": str(e)}), 400
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {RIZZ_OPENAI_API_KEY}"
-        }
+        prompt, image, plan, transcript = plan_rizz_upload(image, description, name, session_id)
+        if plan is not None and plan.mode == UNCHANGED:
+            body = plan.session["result"]
+            finish_rizz_upload(plan, transcript, body, 200)
+            return replay_stream(body, RIZZ_STREAM_PATHS, body, 200)
 
-        resp = requests.post(OPENAI_BASE_URL, json=payload, headers=headers, timeout=60)
+        resp = request_rizz(prompt, image, stream=True)
         if resp.status_code != 200:
+            app.logger.warning("OpenAI responses returned %s: %s", resp.status_code, resp.text[:1000])
             return jsonify({"error": resp.json()}), 500
+        return stream_response(
+            resp, RIZZ_STREAM_PATHS, parse_rizz_content,
+            on_result=lambda body, status: finish_rizz_upload(plan, transcript, body, status),
+        )
 
-        response_data = resp.json()
-        if (
-            "choices" in response_data and
-            len(response_data["choices"]) > 0 and
-            "message" in response_data["choices"][0] and
-            "content" in response_data["choices"][0]["message"]
-        ):
-            raw_content = response_data["choices"][0]["message"]["content"]
+    except UNAVAILABLE as e:
+        return unavailable_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Clients on flaky connections can submit an analysis as a job and poll for
+# (or be sent) the result, instead of holding a request open for the whole
+# OpenAI call. Jobs live in SQLite so every worker process shares them and
+# they survive restarts.
+JOB_QUEUE_PATH = os.environ.get("JOB_QUEUE_PATH", os.path.join(tempfile.gettempdir(), "rizz-jobs.sqlite3"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_RESULT_TTL = int(os.environ.get("JOB_RESULT_TTL", "86400"))
+JOB_TIMEOUT = int(os.environ.get("JOB_TIMEOUT", "300"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_SECONDS = int(os.environ.get("JOB_POLL_SECONDS", "2"))
+JOB_WEBHOOK_SECRET = os.environ.get("JOB_WEBHOOK_SECRET")
+JOB_WEBHOOK_WORKERS = int(os.environ.get("JOB_WEBHOOK_WORKERS", "4"))
+# Comma-separated hosts webhooks may be sent to. Without a list any host is
+# allowed, but only at a public address, checked on submit and on delivery.
+JOB_WEBHOOK_HOSTS = {host.strip() for host in os.environ.get("JOB_WEBHOOK_HOSTS", "").split(",") if host.strip()}
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+# Fields that only matter to the submit request itself.
+JOB_REQUEST_FIELDS = {"base64Image", "stream", "webhookUrl", "idempotencyKey"}
+
+
+def chart_job(fields, image_bytes):
+    return analyze_chart(
+        image_bytes, fields.get("tradingStyles", ["Not Sure"]), fields.get("risk", "Not Sure"), PRIORITY_BATCH,
+    )
+
+
+def rizz_job(fields, image_bytes):
+    return generate_rizz(
+        image_bytes, fields["description"], fields["name"], PRIORITY_BATCH, session_id=fields.get("sessionId"),
+    )
+
+
+job_queue = JobQueue(
+    JOB_QUEUE_PATH,
+    {"getChartAnalysis": chart_job, "getResponses": rizz_job},
+    workers=JOB_WORKERS,
+    result_ttl=JOB_RESULT_TTL,
+    job_timeout=JOB_TIMEOUT,
+    max_attempts=JOB_MAX_ATTEMPTS,
+    retry_on=UNAVAILABLE,
+    webhook_secret=JOB_WEBHOOK_SECRET,
+    webhook_workers=JOB_WEBHOOK_WORKERS,
+    webhook_allow_private=bool(JOB_WEBHOOK_HOSTS),
+)
+job_queue.start()
+
+
+def valid_webhook_url(url):
+    if not isinstance(url, str):
+        return False
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return False
+    if JOB_WEBHOOK_HOSTS:
+        return parsed.hostname in JOB_WEBHOOK_HOSTS
+    try:
+        public_address(parsed.hostname, parsed.port or (443 if parsed.scheme == "https" else 80))
+    except (AddressRefused, OSError, ValueError):
+        return False
+    return True
 
-            try:
-                parsed_responses = json.loads(raw_content)
-                return jsonify(parsed_responses), 200
-            except json.JSONDecodeError:
-                return jsonify({
-                    "error": "Could not parse JSON from model response",
-                    "raw_content": raw_content
-                }), 500
-        else:
-            return jsonify({
-                "error": "Invalid structure in response",
-                "response_data": response_data
-            }), 500
+
+def job_response(job, status):
+    headers = {"Location": f"/jobs/{job['jobId']}"}
+    if "result" not in job:
+        headers["Retry-After"] = str(JOB_POLL_SECONDS)
+    return jsonify(job), status, headers
+
+
+@app.route("/jobs/<kind>", methods=["POST"])
+def submit_job(kind):
+    try:
+        if kind not in job_queue.handlers:
+            return jsonify({"error": f"Unknown job kind '{kind}'."}), 404
+
+        try:
+            with stage("decode"):
+                data, image_bytes = upload_reader.read(request)
+        except InvalidImageError as e:
+            return image_error_response(e)
+
+        if kind == "getResponses" and ("description" not in data or "name" not in data):
+            return jsonify({"error": "Missing 'description' or 'name'."}), 400
+        if kind == "getResponses" and not valid_session_id(data.get("sessionId")):
+            return jsonify({"error": SESSION_ID_ERROR}), 400
+        webhook_url = data.get("webhookUrl")
+        if webhook_url is not None and not valid_webhook_url(webhook_url):
+            return jsonify({"error": "'webhookUrl' must be an http(s) URL of an allowed host."}), 400
+        idempotency_key = request.headers.get(IDEMPOTENCY_KEY_HEADER) or data.get("idempotencyKey")
+        if idempotency_key is not None and (not isinstance(idempotency_key, str) or len(idempotency_key) > 255):
+            return jsonify({"error": "The idempotency key must be a string of at most 255 characters."}), 400
+
+        fields = {key: value for key, value in data.items() if key not in JOB_REQUEST_FIELDS}
+        try:
+            with stage("enqueue"):
+                job, created = job_queue.submit(
+                    kind, fields, image_bytes, idempotency_key=idempotency_key, webhook_url=webhook_url,
+                    request_id=g.request_id,
+                )
+        except IdempotencyConflict as e:
+            return jsonify({"error": str(e)}), 409
+        return job_response(job, 202 if created else 200)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job."}), 404
+    return job_response(job, 200)
+
+
+# The heavy work of getting a worker going happens here rather than at import
+# time, so gunicorn can boot workers quickly; /ready reports when it is done.
+warm_up = WarmUp([
+    ("prompts", prompt_store.start),
+    ("images", image_normalizer.warm_up),
+    ("chartFilter", chart_filter.warm_up),
+    ("tickerOcr", ticker_reader.warm_up),
+    ("conversationOcr", conversation_reader.warm_up),
+    ("openai", lambda: [client.warm_up(UPSTREAM_WARM_CONNECTIONS) for client in openai_clients.values()]),
+    ("perplexity", lambda: perplexity_client.warm_up(UPSTREAM_WARM_CONNECTIONS)),
+])
+warm_up.start()
+
+
+@app.route("/ready", methods=["GET"])
+def get_ready():
+    if not warm_up.ready:
+        return jsonify({"ready": False}), 503, {"Retry-After": "1"}
+    return jsonify(warm_up.stats()), 200
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", debug=True)
@@ -0,0 +1,129 @@
+from collections import deque
+import logging
+import threading
+import time
+
+from metrics import record_breaker_rejection, record_breaker_state
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """The upstream is failing; retry after ``retry_after`` seconds."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is unavailable, retry after {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Sheds calls to an upstream that is failing or too slow.
+
+    Outcomes of the calls in the last ``window`` seconds are kept. Once there
+    are at least ``min_calls`` of them and the share of failures reaches
+    ``error_rate``, or the share slower than ``slow_seconds`` reaches
+    ``slow_rate``, the breaker opens and ``before_call`` raises
+    ``CircuitOpen`` for ``open_seconds``. After that a single probe call is
+    let through; it closes the breaker if it succeeds and reopens it if not.
+    """
+
+    def __init__(self, name, error_rate=0.5, slow_seconds=30.0, slow_rate=0.5, min_calls=10, window=60.0,
+                 open_seconds=30.0):
+        self.name = name
+        self.error_rate = error_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+
+        self.state = CLOSED
+        self._lock = threading.Lock()
+        self._outcomes = deque()
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+        self.rejected = 0
+        record_breaker_state(name, CLOSED, transition=False)
+
+    @property
+    def available(self):
+        """Whether ``before_call`` would let a call through now, without claiming the probe."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                return time.monotonic() - self._opened_at >= self.open_seconds
+            return not self._probing
+
+    def before_call(self):
+        """Raises ``CircuitOpen`` unless a call may go ahead now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+            retry_after = max(1.0, self._opened_at + self.open_seconds - now)
+        record_breaker_rejection(self.name)
+        raise CircuitOpen(self.name, retry_after)
+
+    def cancel(self):
+        """Called instead of ``record`` when an admitted call was never made."""
+        with self._lock:
+            self._probing = False
+
+    def record(self, success, seconds):
+        slow = seconds >= self.slow_seconds
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if success and not slow:
+                    self._outcomes.clear()
+                    self._transition(CLOSED)
+                else:
+                    self._open(now)
+                return
+            if self.state == OPEN:
+                return
+
+            self._outcomes.append((now, success, slow))
+            while self._outcomes and self._outcomes[0][0] < now - self.window:
+                self._outcomes.popleft()
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(1 for _, ok, _ in self._outcomes if not ok)
+            slow_calls = sum(1 for _, _, was_slow in self._outcomes if was_slow)
+            if failures / calls >= self.error_rate or slow_calls / calls >= self.slow_rate:
+                logger.warning(
+                    "%s circuit opened: %d/%d calls failed, %d/%d slower than %.0fs",
+                    self.name, failures, calls, slow_calls, calls, self.slow_seconds,
+                )
+                self._open(now)
+
+    def stats(self):
+        return {"state": self.state, "opened": self.opened, "rejected": self.rejected, "recent_calls": len(self._outcomes)}
+
+    def _open(self, now):
+        self._opened_at = now
+        self._outcomes.clear()
+        self.opened += 1
+        self._transition(OPEN)
+
+    def _transition(self, state):
+        if state == self.state:
+            return
+        logger.info("%s circuit %s -> %s", self.name, self.state, state)
+        self.state = state
+        record_breaker_state(self.name, state)
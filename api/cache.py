@@ -0,0 +1,294 @@
+from collections import OrderedDict
+import json
+import os
+import threading
+import time
+
+from sqlite_thread import SQLiteThread
+
+
+class LRUCache:
+    """Bounded in-process cache with per-entry TTLs."""
+
+    def __init__(self, maxsize=512, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": _ratio(self.hits, self.misses),
+        }
+
+
+class SQLiteCache:
+    """On-disk cache shared by every worker process on the host.
+
+    Values must be JSON serializable. Queries run on a ``SQLiteThread`` so a
+    write lock held by another process does not block the event loop.
+    """
+
+    PURGE_EVERY = 100
+
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = SQLiteThread(path, setup=("PRAGMA journal_mode=WAL",), timeout=5)
+        self._db.run(
+            _commit,
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)",
+        )
+
+    def get(self, key):
+        rows = self._db.execute("SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time()))
+        if not rows:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(rows[0][0])
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._writes += 1
+        self._db.run(self._set, key, json.dumps(value), expires_at, self._writes % self.PURGE_EVERY == 0)
+
+    def delete(self, key):
+        self._db.run(_commit, "DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        self._db.run(_commit, "DELETE FROM cache")
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": _ratio(self.hits, self.misses)}
+
+    @staticmethod
+    def _set(connection, key, value, expires_at, purge):
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at)
+            )
+            if purge:
+                connection.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+
+def _commit(connection, sql, parameters=()):
+    with connection:
+        connection.execute(sql, parameters)
+
+
+class TieredCache:
+    """An LRUCache in front of an optional shared cache."""
+
+    def __init__(self, local, shared=None):
+        self.local = local
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            self.shared.set(key, value, ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": _ratio(self.hits, self.misses),
+            "local": self.local.stats(),
+        }
+        if self.shared is not None:
+            stats["shared"] = self.shared.stats()
+        return stats
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one call.
+
+    The first caller for a key runs ``fn``; callers arriving while it is
+    running wait for it and receive the same result or exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RefreshingCache:
+    """TTL cache with request coalescing and stale-while-revalidate.
+
+    Entries younger than ``ttl`` are served as they are. Entries between
+    ``ttl`` and ``ttl + stale_ttl`` are still served, but trigger a single
+    background reload. Concurrent misses for the same key share one load.
+    Only values accepted by ``cacheable`` are stored.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, stale_ttl=300, cacheable=None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.cacheable = cacheable or (lambda value: True)
+        self._entries = LRUCache(maxsize=maxsize, ttl=ttl + stale_ttl)
+        self._flight = SingleFlight()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+
+    def get_or_load(self, key, loader):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, loaded_at = entry
+            if time.time() - loaded_at < self.ttl:
+                self.fresh_hits += 1
+            else:
+                self.stale_hits += 1
+                with self._lock:
+                    refresh = key not in self._refreshing
+                    self._refreshing.add(key)
+                if refresh:
+                    threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+            return value
+
+        self.misses += 1
+        return self._flight.do(key, lambda: self._load(key, loader))
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        hits = self.fresh_hits + self.stale_hits
+        return {
+            "size": self._entries.stats()["size"],
+            "fresh_hits": self.fresh_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refresh_errors": self.refresh_errors,
+            "hit_ratio": _ratio(hits, self.misses),
+            "coalesced": self._flight.stats(),
+        }
+
+    def _load(self, key, loader):
+        value = loader()
+        if self.cacheable(value):
+            self._entries.set(key, (value, time.time()))
+        return value
+
+    def _refresh(self, key, loader):
+        try:
+            self._flight.do(key, lambda: self._load(key, loader))
+        except Exception:
+            self.refresh_errors += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+
+def _ratio(hits, misses):
+    total = hits + misses
+    return hits / total if total else 0.0
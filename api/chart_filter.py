@@ -0,0 +1,206 @@
+from collections import namedtuple
+import logging
+import math
+import re
+import threading
+import time
+
+from ocr import cv2, load_opencv, np, pytesseract, tesseract_available, tesseract_missing
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_WIDTH = 512
+PRICE_LABEL_PATTERN = re.compile(r"\d[\d,]*\.\d+|\d{2,}")
+
+ChartScore = namedtuple("ChartScore", ["confidence", "is_chart", "features", "elapsed"])
+
+
+class ChartFilter:
+    """Cheap local check for whether an image looks like a trading chart.
+
+    Scores red/green candle-shaped strokes spread across the width, long
+    horizontal grid/price lines, the height variation of dark vertical
+    strokes and overall edge density, and combines them into a confidence.
+    When the confidence is inconclusive and ``ocr`` is on, the right-hand
+    price axis is OCR'd for numeric labels.
+
+    ``mode`` is one of ``off``, ``shadow`` (score and log agreement with the
+    model, never reject) or ``enforce`` (reject below ``threshold``).
+    """
+
+    def __init__(self, mode="off", threshold=0.2, ocr=True, ocr_band=(0.2, 0.8)):
+        self.mode = mode
+        self.threshold = threshold
+        self.ocr = ocr
+        self.ocr_band = ocr_band
+
+        self._lock = threading.Lock()
+        self.scored = 0
+        self.rejected = 0
+        self.agree = 0
+        self.disagree = 0
+        self.false_rejects = 0
+        self.total_seconds = 0.0
+
+    @property
+    def enabled(self):
+        return self.mode in ("shadow", "enforce")
+
+    def warm_up(self):
+        """Imports OpenCV and checks for tesseract ahead of the first score."""
+        if not self.enabled:
+            return
+        load_opencv()
+        if self.ocr:
+            self.ocr = tesseract_available("price axis OCR")
+
+    def score(self, image_bytes):
+        start = time.perf_counter()
+        image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return ChartScore(0.0, False, {}, time.perf_counter() - start)
+
+        height, width = image.shape[:2]
+        if width > ANALYSIS_WIDTH:
+            image = cv2.resize(image, (ANALYSIS_WIDTH, max(1, round(height * ANALYSIS_WIDTH / width))),
+                               interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        colors = candle_masks(image)
+        features = {
+            "edge_density": edge_density(gray),
+            "grid_lines": horizontal_line_count(gray),
+        }
+        features.update(candle_strokes(colors, width=gray.shape[1]))
+        features.update(stroke_heights(gray))
+
+        z = (
+            -3.0
+            + 4.0 * min(1.0, features["colored_candles"] / 20.0) * features["candle_spread"]
+            + 1.5 * min(1.0, features["grid_lines"] / 3.0)
+            + 1.0 * min(1.0, features["strokes"] / 30.0) * min(1.0, features["stroke_height_cv"] / 0.6)
+            + (0.5 if 0.005 <= features["edge_density"] <= 0.25 else -1.5)
+        )
+        confidence = sigmoid(z)
+
+        if self.ocr and self.ocr_band[0] <= confidence <= self.ocr_band[1]:
+            try:
+                labels = price_axis_labels(gray)
+            except pytesseract.TesseractNotFoundError:
+                tesseract_missing("price axis OCR")
+                self.ocr = False
+                labels = None
+            if labels is not None:
+                features["price_labels"] = labels
+                z += 2.0 if labels >= 3 else -1.0
+                confidence = sigmoid(z)
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.scored += 1
+            self.total_seconds += elapsed
+        return ChartScore(confidence, confidence >= self.threshold, features, elapsed)
+
+    def should_reject(self, score):
+        if self.mode != "enforce" or score.is_chart:
+            return False
+        with self._lock:
+            self.rejected += 1
+        logger.info("Chart filter rejected image (confidence %.2f, %s)", score.confidence, score.features)
+        return True
+
+    def record_verdict(self, score, model_is_chart):
+        with self._lock:
+            if score.is_chart == model_is_chart:
+                self.agree += 1
+            else:
+                self.disagree += 1
+                if model_is_chart:
+                    self.false_rejects += 1
+        logger.info(
+            "Chart filter %s with model (filter=%s confidence=%.2f, model=%s, %s)",
+            "agreed" if score.is_chart == model_is_chart else "disagreed",
+            score.is_chart, score.confidence, model_is_chart, score.features,
+        )
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "threshold": self.threshold,
+            "scored": self.scored,
+            "rejected": self.rejected,
+            "agree": self.agree,
+            "disagree": self.disagree,
+            "false_rejects": self.false_rejects,
+            "mean_ms": self.total_seconds / self.scored * 1000 if self.scored else 0.0,
+        }
+
+
+def sigmoid(z):
+    return 1.0 / (1.0 + math.exp(-z))
+
+
+def edge_density(gray):
+    edges = cv2.Canny(gray, 50, 150)
+    return float(np.count_nonzero(edges)) / edges.size
+
+
+def stroke_heights(gray):
+    # Candle wicks vary a lot in height while text strokes are all about the same height.
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 8)
+    if np.median(gray) < 128:
+        binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 15, -8)
+    vertical = cv2.morphologyEx(binary, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, 6)))
+    _, _, stats, _ = cv2.connectedComponentsWithStats(vertical)
+    widths, heights = stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT]
+    heights = heights[(heights >= 6) & (widths <= 14) & (heights >= 2 * widths)]
+    cv = float(heights.std() / heights.mean()) if len(heights) > 1 else 0.0
+    return {"strokes": int(len(heights)), "stroke_height_cv": cv}
+
+
+def candle_strokes(masks, width, bins=16):
+    red, green = masks
+    colored = cv2.morphologyEx(
+        (red | green).astype(np.uint8) * 255, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, 4)),
+    )
+    _, _, stats, _ = cv2.connectedComponentsWithStats(colored)
+    stats = stats[1:]
+    widths, heights = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]
+    candles = stats[(heights >= 4) & (widths <= 30) & (heights >= 1.5 * widths)]
+    occupied = {int((x + w / 2) * bins / width) for x, w in zip(candles[:, cv2.CC_STAT_LEFT], candles[:, cv2.CC_STAT_WIDTH])}
+    return {
+        "colored_candles": int(len(candles)),
+        "candle_spread": len(occupied) / float(bins),
+        "red_fraction": float(np.count_nonzero(red)) / red.size,
+        "green_fraction": float(np.count_nonzero(green)) / green.size,
+    }
+
+
+def horizontal_line_count(gray):
+    # Grid and price lines run across (nearly) the whole plot; chat bubbles and text do not.
+    edges = cv2.Canny(gray, 10, 30)
+    width = gray.shape[1]
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (width // 2, 1))
+    horizontal = cv2.morphologyEx(edges, cv2.MORPH_OPEN, kernel)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(horizontal)
+    return int(np.count_nonzero(stats[1:, cv2.CC_STAT_WIDTH] >= 0.75 * width))
+
+
+def candle_masks(image):
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    vivid = (saturation > 80) & (value > 60)
+    red = vivid & ((hue <= 10) | (hue >= 170))
+    green = vivid & (hue >= 40) & (hue <= 90)
+    return red, green
+
+
+def price_axis_labels(gray):
+    strip = gray[:, int(gray.shape[1] * 0.82):]
+    strip = cv2.resize(strip, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+    try:
+        text = pytesseract.image_to_string(strip, config="--psm 6 -c tessedit_char_whitelist=0123456789.,")
+    except pytesseract.TesseractError as e:
+        logger.warning("Skipping price axis OCR: %s", e)
+        return None
+    return len(PRICE_LABEL_PATTERN.findall(text))
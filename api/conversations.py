@@ -0,0 +1,228 @@
+from cache import LRUCache
+from collections import namedtuple
+from difflib import SequenceMatcher
+from ocr import cv2, load_opencv, np, pytesseract, tesseract_available, tesseract_missing
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ChatMessage = namedtuple("ChatMessage", ["sender", "text"])
+Transcript = namedtuple("Transcript", ["messages", "confidence"])
+SessionPlan = namedtuple("SessionPlan", ["key", "session", "mode", "new_messages"])
+
+# Lines that are only a day, a time or a read receipt, printed between bubbles.
+SYSTEM_LINE_PATTERN = re.compile(
+    r"^(today|yesterday|(mon|tue|wed|thu|fri|sat|sun)[a-z]*|\d{1,2}/\d{1,2}(/\d{2,4})?)?[\s,]*"
+    r"(\d{1,2}:\d{2}\s*([ap]\.?m\.?)?)?$"
+    r"|^(read|delivered|seen)(\s+\d{1,2}:\d{2}\s*([ap]\.?m\.?)?)?$",
+    re.IGNORECASE,
+)
+
+INCREMENTAL = "incremental"
+UNCHANGED = "unchanged"
+FULL = "full"
+
+
+def message_key(message):
+    """Comparable form of a message, so OCR spacing and punctuation noise does not break the diff."""
+    return message.sender, re.sub(r"[\W_]+", "", message.text.casefold())
+
+
+class ConversationReader:
+    """Reads the messages of a chat screenshot with OCR.
+
+    Text blocks are read with tesseract below the top ``header_height`` and
+    above the bottom ``footer_height`` fraction of the screenshot, which
+    hold the contact name and the input bar. A block right of the middle is
+    a message from the user, one left of it from the other person, and
+    centred lines such as timestamps are skipped. ``read`` returns None
+    when OCR is unavailable, finds no messages or its mean word confidence
+    is below ``min_confidence``, so the caller can fall back to the image.
+    """
+
+    def __init__(self, enabled=True, min_confidence=80, header_height=0.12, footer_height=0.08):
+        self.enabled = enabled
+        self.min_confidence = min_confidence
+        self.header_height = header_height
+        self.footer_height = footer_height
+
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.low_confidence = 0
+        self.total_seconds = 0.0
+
+    def warm_up(self):
+        """Imports OpenCV and checks for tesseract ahead of the first read."""
+        if not self.enabled:
+            return
+        load_opencv()
+        self.enabled = tesseract_available("conversation OCR")
+
+    def read(self, image_bytes):
+        if not self.enabled:
+            return None
+
+        start = time.perf_counter()
+        transcript = None
+        image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if image is not None:
+            try:
+                transcript = self._read_messages(image)
+            except pytesseract.TesseractNotFoundError:
+                tesseract_missing("conversation OCR")
+                self.enabled = False
+            except pytesseract.TesseractError as e:
+                logger.warning("Skipping conversation OCR: %s", e)
+
+        low_confidence = transcript is not None and transcript.confidence < self.min_confidence
+        with self._lock:
+            self.reads += 1
+            self.low_confidence += low_confidence or transcript is None
+            self.total_seconds += time.perf_counter() - start
+        if transcript is None or low_confidence or not transcript.messages:
+            return None
+        return transcript
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "reads": self.reads,
+            "low_confidence": self.low_confidence,
+            "mean_ms": self.total_seconds / self.reads * 1000 if self.reads else 0.0,
+        }
+
+    def _read_messages(self, image):
+        height, width = image.shape
+        top = int(height * self.header_height)
+        bottom = max(top + 1, int(height * (1 - self.footer_height)))
+        data = pytesseract.image_to_data(image[top:bottom], config="--psm 3", output_type=pytesseract.Output.DICT)
+
+        blocks = {}
+        for i, text in enumerate(data["text"]):
+            text = text.strip()
+            confidence = float(data["conf"][i])
+            if not text or confidence < 0:
+                continue
+            block = blocks.setdefault((data["block_num"][i], data["par_num"][i]), {
+                "words": [], "left": width, "right": 0, "top": data["top"][i], "confidence": [],
+            })
+            block["words"].append(text)
+            block["left"] = min(block["left"], data["left"][i])
+            block["right"] = max(block["right"], data["left"][i] + data["width"][i])
+            block["confidence"].append((confidence, len(text)))
+
+        messages = []
+        weighted = chars = 0
+        for block in sorted(blocks.values(), key=lambda block: block["top"]):
+            text = " ".join(block["words"])
+            centre = (block["left"] + block["right"]) / 2
+            centred = abs(centre - width / 2) < width * 0.1 and block["right"] - block["left"] < width * 0.5
+            if centred or SYSTEM_LINE_PATTERN.match(text):
+                continue
+            messages.append(ChatMessage("me" if centre > width / 2 else "them", text))
+            for confidence, length in block["confidence"]:
+                weighted += confidence * length
+                chars += length
+        return Transcript(messages, weighted / chars if chars else 0.0)
+
+
+class ConversationSessions:
+    """Bounded store of conversation sessions for successive screenshots of one chat.
+
+    A session keeps the messages read so far (at most ``max_messages``) and
+    a short summary of the model's last answer. ``plan`` compares a new
+    screenshot's transcript with the session: when its first messages
+    overlap the end of what the session has seen, only the messages after
+    the overlap need to go to the model. Sessions are evicted least
+    recently used past ``maxsize`` and expire ``ttl`` seconds after their
+    last upload.
+    """
+
+    def __init__(self, maxsize=2048, ttl=3600, max_messages=200, context_messages=6, summary_chars=1200,
+                 min_overlap=2):
+        self.max_messages = max_messages
+        self.context_messages = context_messages
+        self.summary_chars = summary_chars
+        self.min_overlap = min_overlap
+        self._sessions = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.modes = {INCREMENTAL: 0, UNCHANGED: 0, FULL: 0}
+
+    def get(self, key):
+        return self._sessions.get(key)
+
+    def plan(self, key, session, transcript):
+        """Decides how to send an upload to session ``key``.
+
+        The plan's ``mode`` is ``incremental`` when ``new_messages`` can be
+        sent on their own, ``unchanged`` when the screenshot shows nothing
+        new, and ``full`` when the screenshot has to be sent.
+        """
+        if session is None or transcript is None or not session["messages"]:
+            return self._plan(key, session, FULL)
+
+        previous = [message_key(message) for message in session["messages"]]
+        current = [message_key(message) for message in transcript.messages]
+        match = SequenceMatcher(None, previous, current, autojunk=False).find_longest_match(
+            0, len(previous), 0, len(current),
+        )
+        overlap = min(self.min_overlap, len(previous), len(current))
+        # The last bubble of the previous screenshot may have been cut off at the bottom edge.
+        if match.size < overlap or match.a + match.size < len(previous) - 1:
+            return self._plan(key, session, FULL)
+
+        new_messages = transcript.messages[match.b + match.size:]
+        return self._plan(key, session, INCREMENTAL if new_messages else UNCHANGED, new_messages)
+
+    def context(self, plan, name=""):
+        """The text that replaces the screenshot for an incremental upload."""
+        earlier = plan.session["messages"][-self.context_messages:]
+        lines = ["", "The screenshot is not attached. The conversation continues from one the user uploaded earlier."]
+        if plan.session["summary"]:
+            lines += ["", "Summary of the conversation so far:", plan.session["summary"]]
+        if earlier:
+            lines += ["", "Last messages already seen:"] + [format_message(message, name) for message in earlier]
+        lines += ["", "New messages since then:"] + [format_message(message, name) for message in plan.new_messages]
+        return "\n".join(lines)
+
+    def update(self, plan, transcript, result):
+        """Stores the outcome of an upload that was answered with ``result``."""
+        if plan.mode == INCREMENTAL:
+            messages = plan.session["messages"] + list(plan.new_messages)
+        elif plan.mode == UNCHANGED:
+            messages = plan.session["messages"]
+        else:
+            messages = list(transcript.messages) if transcript is not None else []
+        self._sessions.set(plan.key, {
+            "messages": messages[-self.max_messages:],
+            "summary": summarize(result, self.summary_chars),
+            "result": result,
+        })
+
+    def stats(self):
+        stats = self._sessions.stats()
+        return {"sessions": stats["size"], "evictions": stats["evictions"], "modes": dict(self.modes)}
+
+    def _plan(self, key, session, mode, new_messages=()):
+        with self._lock:
+            self.modes[mode] += 1
+        return SessionPlan(key, session, mode, list(new_messages))
+
+
+def format_message(message, name=""):
+    sender = "User" if message.sender == "me" else (name or "Them")
+    return f"{sender}: {message.text}"
+
+
+def summarize(result, max_chars):
+    """A compact summary of the model's last answer, carried into incremental prompts."""
+    parts = []
+    if result.get("breakdown"):
+        parts.append(str(result["breakdown"]))
+    if result.get("interestLevel") is not None:
+        parts.append(f"Interest level so far: {result['interestLevel']}/10.")
+    summary = " ".join(parts)
+    return summary if len(summary) <= max_chars else summary[:max_chars - 3].rstrip() + "..."
@@ -0,0 +1,34 @@
+import os
+import shutil
+import tempfile
+
+# Handlers spend nearly all of their time waiting on OpenAI/Perplexity, so the
+# default is a gevent worker that keeps hundreds of those waits in flight per
+# process. WEB_WORKER_CLASS=sync restores one-request-per-worker behaviour.
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+# The app splits its per-key rate limits across this many workers.
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = os.environ.get("WEB_WORKER_CLASS", "gevent")
+worker_connections = int(os.environ.get("WEB_WORKER_CONNECTIONS", "500"))
+threads = int(os.environ.get("WEB_THREADS", "1"))
+timeout = int(os.environ.get("WEB_TIMEOUT", "120"))
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+accesslog = "-"
+
+# Workers write their metrics to files in this directory so /metrics can add
+# up every worker, not just the one that happens to serve the scrape.
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), f"rizz-metrics-{os.getpid()}")
+)
+
+
+def on_starting(server):
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
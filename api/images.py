@@ -0,0 +1,189 @@
+from collections import namedtuple
+from io import BytesIO
+from PIL import Image, ImageOps, UnidentifiedImageError
+import base64
+import binascii
+import logging
+import math
+import threading
+
+logger = logging.getLogger(__name__)
+
+EXIF_ORIENTATION = 0x0112
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+
+
+# Leading bytes of each format Pillow is expected to decode.
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+]
+SIGNATURE_BYTES = 12
+
+# Where formats keep metadata that must not be forwarded upstream as is.
+METADATA_KEYS = ("exif", "xmp", "XML:com.adobe.xmp", "photoshop", "comment")
+JPEG_METADATA_MARKERS = ("APP1", "APP13", "COM")
+
+
+class InvalidImageError(ValueError):
+    pass
+
+
+def sniff_image_format(data):
+    """The image format ``data`` starts with, or None."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "WEBP"
+    for signature, image_format in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return image_format
+    return None
+
+
+def has_metadata(image):
+    """Whether ``image`` carries EXIF, XMP, comments or text chunks."""
+    if any(key in image.info for key in METADATA_KEYS):
+        return True
+    if any(marker in JPEG_METADATA_MARKERS for marker, _ in getattr(image, "applist", ())):
+        return True
+    return bool(getattr(image, "text", None))
+
+
+NormalizedImage = namedtuple("NormalizedImage", [
+    "data", "mime_type", "detail", "width", "height", "original_size", "original_width", "original_height",
+])
+
+
+def decode_base64_image(base64_image):
+    if not isinstance(base64_image, str) or not base64_image:
+        raise InvalidImageError("'base64Image' must be a non-empty base64 string.")
+    if base64_image.startswith("data:"):
+        base64_image = base64_image.partition(",")[2]
+    try:
+        return base64.b64decode(base64_image, validate=False)
+    except (binascii.Error, ValueError):
+        raise InvalidImageError("'base64Image' is not valid base64.")
+
+
+class ImageNormalizer:
+    """Shrinks uploads to what the vision model actually looks at.
+
+    High-detail images are fitted into ``max_side`` and then scaled so the
+    short side is at most ``short_side`` before being tiled upstream, so any
+    pixels beyond that only cost upload bytes. Images that fit into
+    ``low_detail_side`` on both axes are sent with ``detail: low`` when
+    ``detail`` is ``auto``. EXIF orientation is applied and all metadata is
+    dropped on re-encode.
+    """
+
+    def __init__(self, max_side=2048, short_side=768, low_detail_side=512, quality=85,
+                 image_format="JPEG", detail="auto"):
+        self.max_side = max_side
+        self.short_side = short_side
+        self.low_detail_side = low_detail_side
+        self.quality = quality
+        self.image_format = image_format.upper()
+        self.detail = detail
+
+        self._lock = threading.Lock()
+        self.images = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.pixels_in = 0
+        self.pixels_out = 0
+
+    def normalize(self, image_bytes):
+        try:
+            image = Image.open(BytesIO(image_bytes))
+            original_format = image.format
+            original_width, original_height = image.size
+            original_scale = self._scale(original_width, original_height)
+            rotated = image.getexif().get(EXIF_ORIENTATION, 1) != 1
+            metadata = has_metadata(image)
+            if image.format == "JPEG" and original_scale < 1:
+                # Let libjpeg decode at a reduced scale instead of decoding the full image and resizing.
+                image.draft("RGB", (math.ceil(original_width * original_scale), math.ceil(original_height * original_scale)))
+            image = ImageOps.exif_transpose(image)
+        except Image.DecompressionBombError:
+            raise InvalidImageError("The image has too many pixels.")
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            raise InvalidImageError("'base64Image' is not a supported image.")
+
+        width, height = image.size
+        scale = self._scale(width, height)
+        if scale < 1:
+            width, height = max(1, round(width * scale)), max(1, round(height * scale))
+            image = image.resize((width, height), Image.LANCZOS)
+
+        data, mime_type = self._encode(image)
+        if (
+            len(data) >= len(image_bytes) and original_scale == 1 and not rotated and not metadata and
+            original_format in MIME_TYPES
+        ):
+            # Small, already well-compressed uploads without metadata are cheaper to forward as they are.
+            data, mime_type = image_bytes, MIME_TYPES[original_format]
+
+        detail = self.detail
+        if detail == "auto":
+            detail = "low" if max(width, height) <= self.low_detail_side else "high"
+
+        normalized = NormalizedImage(
+            data, mime_type, detail, width, height, len(image_bytes), original_width, original_height,
+        )
+        self._record(normalized)
+        return normalized
+
+    def warm_up(self):
+        """Loads the decoders and encoder so the first upload does not pay for them."""
+        # Registers every format plugin, which Pillow otherwise does on the first open.
+        Image.init()
+        data, _ = self._encode(Image.new("RGB", (8, 8)))
+        Image.open(BytesIO(data)).load()
+
+    def stats(self):
+        return {
+            "images": self.images,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "pixels_in": self.pixels_in,
+            "pixels_out": self.pixels_out,
+        }
+
+    def _scale(self, width, height):
+        return min(1.0, self.max_side / max(width, height), self.short_side / min(width, height))
+
+    def _encode(self, image):
+        if image.mode not in ("RGB", "L"):
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            rgba = image.convert("RGBA")
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            image = background
+
+        buffer = BytesIO()
+        if self.image_format == "WEBP":
+            image.save(buffer, format="WEBP", quality=self.quality, method=4)
+        else:
+            # Pillow carries a JPEG comment over from the source unless told otherwise.
+            image.save(buffer, format="JPEG", quality=self.quality, optimize=True, comment=b"")
+        return buffer.getvalue(), MIME_TYPES[self.image_format]
+
+    def _record(self, normalized):
+        pixels_in = normalized.original_width * normalized.original_height
+        pixels_out = normalized.width * normalized.height
+        with self._lock:
+            self.images += 1
+            self.bytes_in += normalized.original_size
+            self.bytes_out += len(normalized.data)
+            self.pixels_in += pixels_in
+            self.pixels_out += pixels_out
+
+        logger.info(
+            "Normalized image %dx%d (%d bytes) -> %dx%d (%d bytes, detail=%s), saved %d bytes and %d pixels",
+            normalized.original_width, normalized.original_height, normalized.original_size,
+            normalized.width, normalized.height, len(normalized.data), normalized.detail,
+            normalized.original_size - len(normalized.data), pixels_in - pixels_out,
+        )
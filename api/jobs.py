@@ -0,0 +1,372 @@
+from addresses import AddressRefused, PublicAddressAdapter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import hashlib
+import hmac
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import requests
+
+from metrics import propagate, record_job, record_job_queue, record_webhook, start_request
+from sqlite_thread import SQLiteThread
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+WEBHOOK_SIGNATURE_HEADER = "X-Signature-SHA256"
+WEBHOOK_TIMEOUT = 10
+WEBHOOK_ATTEMPTS = 3
+# Attempts at writing a job's outcome while another process holds the database lock.
+WRITE_ATTEMPTS = 5
+WRITE_BACKOFF_MAX = 8.0
+
+
+class IdempotencyConflict(Exception):
+    """The idempotency key belongs to a job of another kind."""
+
+
+class JobQueue:
+    """Durable queue of analysis jobs in SQLite, shared by every worker process on the host.
+
+    ``handlers`` maps a job kind to ``fn(fields, image_bytes)`` returning
+    ``(body, status)``. Each process runs ``workers`` threads that claim the
+    oldest queued job. A job whose handler raises one of ``retry_on`` (an
+    exception with a ``retry_after``) is queued again after that delay, up to
+    ``max_attempts`` attempts; jobs stuck running for longer than
+    ``job_timeout`` (e.g. because their process died) are picked up again
+    the same way. Finished jobs keep their result for ``result_ttl``
+    seconds, and a submit with the idempotency key of a job that has not
+    expired yet returns that job instead of creating a new one; reusing the
+    key for another kind of job raises ``IdempotencyConflict``.
+
+    When a job has a ``webhook_url`` its final state is POSTed there, signed
+    with ``webhook_secret`` if one is set. Webhooks are delivered by their
+    own ``webhook_workers`` threads, so slow or dead webhook hosts do not
+    hold up the queue. Webhooks to private, loopback or link-local
+    addresses are refused unless ``webhook_allow_private`` is set.
+
+    Database calls go through a ``SQLiteThread``, so waiting on another
+    process's lock does not block a gevent worker's event loop.
+    """
+
+    MAINTENANCE_INTERVAL = 10.0
+
+    def __init__(self, path, handlers, workers=2, result_ttl=86400, job_timeout=300, max_attempts=3,
+                 poll_interval=1.0, retry_on=(), webhook_secret=None, webhook_workers=4,
+                 webhook_allow_private=False):
+        self.path = path
+        self.handlers = handlers
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.job_timeout = job_timeout
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.retry_on = retry_on
+        self.webhook_secret = webhook_secret
+
+        self._wakeup = threading.Condition()
+        self._stopped = threading.Event()
+        self._threads = []
+        self._maintained_at = 0.0
+        self._webhooks = requests.Session()
+        if not webhook_allow_private:
+            self._webhooks.mount("http://", PublicAddressAdapter())
+            self._webhooks.mount("https://", PublicAddressAdapter())
+            # A proxy from the environment would connect on our behalf, past the address check.
+            self._webhooks.trust_env = False
+        self._webhook_executor = ThreadPoolExecutor(max_workers=webhook_workers, thread_name_prefix="job-webhook")
+        self.submitted = 0
+        self.attached = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Autocommit; multi-statement changes go through _transaction.
+        self._db = SQLiteThread(path, setup=("PRAGMA journal_mode=WAL",), timeout=5, isolation_level=None)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, idempotency_key TEXT UNIQUE, kind TEXT NOT NULL, status TEXT NOT NULL, "
+            "fields TEXT, image BLOB, webhook_url TEXT, request_id TEXT, result TEXT, result_status INTEGER, "
+            "attempts INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, run_after REAL NOT NULL, "
+            "started_at REAL, finished_at REAL, expires_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, run_after)")
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopped.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def submit(self, kind, fields, image_bytes, idempotency_key=None, webhook_url=None, request_id=None):
+        """Returns ``(job, created)``; ``created`` is False when an existing job was returned."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind {kind!r}.")
+        now = time.time()
+        if idempotency_key:
+            existing = self._find(idempotency_key, now)
+            if existing is not None:
+                return self._attach(existing, kind), False
+
+        job_id = uuid.uuid4().hex
+        row = (
+            job_id, idempotency_key or None, kind, QUEUED, json.dumps(fields), image_bytes,
+            webhook_url, request_id, now, now, now + self.result_ttl,
+        )
+        try:
+            self._db.run(_insert, row)
+        except sqlite3.IntegrityError:
+            # Another process inserted the same idempotency key first.
+            return self._attach(self._find(idempotency_key, now), kind), False
+
+        self.submitted += 1
+        with self._wakeup:
+            self._wakeup.notify()
+        return self.get(job_id), True
+
+    def get(self, job_id):
+        rows = self._db.execute(
+            f"SELECT {PUBLIC_COLUMNS} FROM jobs WHERE id = ? AND expires_at > ?", (job_id, time.time())
+        )
+        return _job(rows[0]) if rows else None
+
+    def depths(self):
+        """Number of queued and running jobs, and the age of the oldest queued one."""
+        now = time.time()
+        rows = self._db.execute(
+            "SELECT status, COUNT(*), MIN(created_at) FROM jobs WHERE status IN (?, ?) GROUP BY status",
+            (QUEUED, RUNNING),
+        )
+        depths = {QUEUED: 0, RUNNING: 0}
+        oldest_age = 0.0
+        for status, count, oldest in rows:
+            depths[status] = count
+            if status == QUEUED:
+                oldest_age = now - oldest
+        return depths, oldest_age
+
+    def export_metrics(self):
+        depths, oldest_age = self.depths()
+        record_job_queue(depths, oldest_age)
+
+    def stats(self):
+        depths, oldest_age = self.depths()
+        return {
+            "queued": depths[QUEUED],
+            "running": depths[RUNNING],
+            "oldest_queued_seconds": round(oldest_age, 3),
+            "submitted": self.submitted,
+            "attached": self.attached,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+    def _attach(self, job, kind):
+        if job["kind"] != kind:
+            raise IdempotencyConflict(f"The idempotency key is already used by a {job['kind']} job.")
+        self.attached += 1
+        return job
+
+    def _find(self, idempotency_key, now):
+        rows = self._db.execute(
+            f"SELECT {PUBLIC_COLUMNS} FROM jobs WHERE idempotency_key = ? AND expires_at > ?", (idempotency_key, now)
+        )
+        return _job(rows[0]) if rows else None
+
+    def _work(self):
+        while not self._stopped.is_set():
+            try:
+                claimed = self._claim()
+            except sqlite3.Error:
+                logger.exception("Could not claim a job")
+                claimed = None
+            if claimed is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            try:
+                self._run(*claimed)
+            except Exception:
+                # The job stays running and is queued again once it times out.
+                logger.exception("Could not finish job %s", claimed[0])
+
+    def _claim(self):
+        now = time.time()
+        if now - self._maintained_at >= self.MAINTENANCE_INTERVAL:
+            self._maintained_at = now
+            self._db.run(self._maintain, now)
+        return self._db.run(self._claim_next, now)
+
+    def _claim_next(self, connection, now):
+        with _transaction(connection):
+            row = connection.execute(
+                "SELECT id, kind, fields, image, webhook_url, request_id, created_at, attempts FROM jobs "
+                "WHERE status = ? AND run_after <= ? ORDER BY run_after LIMIT 1",
+                (QUEUED, now),
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (RUNNING, now, row[0]),
+                )
+        return row
+
+    def _maintain(self, connection, now):
+        with _transaction(connection):
+            stale = now - self.job_timeout
+            connection.execute(
+                "UPDATE jobs SET status = ?, run_after = ? WHERE status = ? AND started_at < ? AND attempts < ?",
+                (QUEUED, now, RUNNING, stale, self.max_attempts),
+            )
+            connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, result_status = 504, finished_at = ?, fields = NULL, "
+                "image = NULL WHERE status = ? AND started_at < ?",
+                (FAILED, json.dumps({"error": "The job timed out."}), now, RUNNING, stale),
+            )
+            connection.execute("DELETE FROM jobs WHERE expires_at <= ?", (now,))
+
+    def _run(self, job_id, kind, fields, image_bytes, webhook_url, request_id, created_at, attempts):
+        start_request(f"job:{kind}", request_id)
+        started = time.time()
+        try:
+            body, status = self.handlers[kind](json.loads(fields), bytes(image_bytes))
+        except self.retry_on as e:
+            if attempts + 1 < self.max_attempts:
+                self._requeue(job_id, kind, e)
+                return
+            body, status = {"error": str(e), "retryAfter": math.ceil(e.retry_after)}, 503
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            body, status = {"error": str(e)}, 500
+
+        outcome = DONE if status < 500 else FAILED
+        finished = time.time()
+        self._write(
+            "UPDATE jobs SET status = ?, result = ?, result_status = ?, finished_at = ?, expires_at = ?, "
+            "fields = NULL, image = NULL WHERE id = ?",
+            (outcome, json.dumps(body), status, finished, finished + self.result_ttl, job_id),
+        )
+        if outcome == DONE:
+            self.completed += 1
+        else:
+            self.failed += 1
+        record_job(kind, outcome, started - created_at if attempts == 0 else None)
+        logger.info("Job %s (%s) %s with status %s in %.2fs", job_id, kind, outcome, status, finished - started)
+
+        if webhook_url:
+            self._webhook_executor.submit(propagate(self._deliver), webhook_url, job_id)
+
+    def _requeue(self, job_id, kind, e):
+        self._write(
+            "UPDATE jobs SET status = ?, run_after = ? WHERE id = ?", (QUEUED, time.time() + e.retry_after, job_id),
+        )
+        self.retried += 1
+        record_job(kind, "retried")
+        logger.info("Job %s retrying in %.1fs: %s", job_id, e.retry_after, e)
+
+    def _write(self, sql, parameters):
+        """Runs an UPDATE, retrying with backoff while the database stays locked past the busy timeout."""
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                self._db.execute(sql, parameters)
+                return
+            except sqlite3.OperationalError as e:
+                if attempt + 1 == WRITE_ATTEMPTS:
+                    raise
+                delay = min(WRITE_BACKOFF_MAX, 0.5 * 2 ** attempt)
+                logger.warning("Could not update the job queue (%s), retrying in %.1fs", e, delay)
+                time.sleep(delay)
+
+    def _deliver(self, url, job_id):
+        try:
+            self._notify(url, self.get(job_id))
+        except Exception:
+            logger.exception("Could not deliver the webhook for job %s", job_id)
+            record_webhook("failed")
+
+    def _notify(self, url, job):
+        body = json.dumps(job).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.webhook_secret:
+            signature = hmac.new(self.webhook_secret.encode(), body, hashlib.sha256).hexdigest()
+            headers[WEBHOOK_SIGNATURE_HEADER] = signature
+        for attempt in range(WEBHOOK_ATTEMPTS):
+            if attempt:
+                time.sleep(2 ** attempt)
+            try:
+                response = self._webhooks.post(url, data=body, headers=headers, timeout=WEBHOOK_TIMEOUT)
+                response.close()
+            except AddressRefused as e:
+                logger.warning("Refused the webhook for job %s: %s", job["jobId"], e)
+                break
+            except requests.RequestException as e:
+                logger.warning("Webhook for job %s failed: %s", job["jobId"], e)
+                continue
+            if response.status_code < 500:
+                record_webhook("delivered" if response.ok else "rejected")
+                return
+            logger.warning("Webhook for job %s returned %s", job["jobId"], response.status_code)
+        record_webhook("failed")
+
+
+def _insert(connection, row):
+    with _transaction(connection):
+        if row[1]:
+            # An expired job's idempotency key can be used again.
+            connection.execute("DELETE FROM jobs WHERE idempotency_key = ? AND expires_at <= ?", (row[1], row[8]))
+        connection.execute(
+            "INSERT INTO jobs (id, idempotency_key, kind, status, fields, image, webhook_url, request_id, "
+            "created_at, run_after, expires_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            row,
+        )
+
+
+@contextmanager
+def _transaction(connection):
+    # BEGIN IMMEDIATE takes the write lock up front, so two processes cannot claim the same job.
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+
+PUBLIC_COLUMNS = "id, kind, status, result, result_status, attempts, created_at, started_at, finished_at"
+
+
+def _job(row):
+    job_id, kind, status, result, result_status, attempts, created_at, started_at, finished_at = row
+    job = {
+        "jobId": job_id,
+        "kind": kind,
+        "status": status,
+        "attempts": attempts,
+        "createdAt": created_at,
+        "startedAt": started_at,
+        "finishedAt": finished_at,
+    }
+    if result is not None:
+        job["result"] = json.loads(result)
+        job["resultStatus"] = result_status
+    return job
@@ -0,0 +1,31 @@
+import importlib
+import threading
+
+
+class LazyModule:
+    """Stands in for a module that is only imported the first time one of its attributes is used.
+
+        cv2 = LazyModule("cv2")
+
+    keeps heavy imports out of the worker's startup; ``load`` imports the
+    module ahead of time, e.g. from a warm-up thread.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._module or self.load(), attribute)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
@@ -0,0 +1,210 @@
+from addresses import AddressRefused, PublicAddressAdapter
+from cache import SingleFlight
+from concurrent.futures import ThreadPoolExecutor, wait
+from lazy import LazyModule
+from metrics import propagate, record_link_check
+from requests.adapters import HTTPAdapter
+from urllib.parse import urljoin, urlparse
+import logging
+import threading
+import requests
+
+# Only requests that ask for previews need the HTML parser.
+bs4 = LazyModule("bs4")
+
+logger = logging.getLogger(__name__)
+
+DEAD_STATUSES = {404, 410}
+MAX_REDIRECTS = 5
+READ_CHUNK_SIZE = 16 * 1024
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+USER_AGENT = "Mozilla/5.0 (compatible; rizz.ai link preview)"
+PUBLISHED_KEYS = (
+    "article:published_time", "og:published_time", "datepublished", "publishdate", "pubdate", "date", "dc.date",
+)
+
+
+class LinkRefused(Exception):
+    pass
+
+
+class LinkEnricher:
+    """Checks the links of articles and adds OpenGraph previews to them.
+
+    Every link of a response is fetched at once on a pooled session; links
+    still loading after ``deadline`` seconds are returned as they are, and
+    their fetch carries on to fill the cache for the next request. Each
+    URL's outcome is cached in ``cache``: previews and dead links for
+    ``ttl`` seconds, and outcomes that say nothing about the link (timeouts,
+    403s, 5xx) for ``error_ttl``. Concurrent fetches of one URL are shared.
+
+    Links that answer 404 or 410, whose host does not resolve or refuses
+    connections, or that are not http(s) are dead and dropped. Links to
+    private or loopback addresses are treated as dead unless
+    ``allow_private`` is set, so a made-up link cannot reach internal
+    services; the address is checked as each connection is opened, so a
+    host cannot pass the check and then resolve somewhere else.
+    """
+
+    def __init__(self, cache, deadline=2.0, connect_timeout=2.0, read_timeout=3.0, ttl=86400, error_ttl=600,
+                 max_bytes=512 * 1024, pool_size=16, allow_private=False):
+        self.cache = cache
+        self.deadline = deadline
+        self.timeout = (connect_timeout, read_timeout)
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.max_bytes = max_bytes
+        self.allow_private = allow_private
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        # A proxy from the environment would be the address checked, not the link's host.
+        self.session.trust_env = False
+        adapter_class = HTTPAdapter if allow_private else PublicAddressAdapter
+        adapter = adapter_class(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="link")
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self.outcomes = {}
+        self.late = 0
+
+    def enrich(self, articles):
+        """Returns ``articles`` without dead links, with a ``preview`` on those that have one."""
+        results = {}
+        pending = {}
+        for link in {article.get("link") for article in articles}:
+            if not isinstance(link, str) or urlparse(link).scheme not in ("http", "https"):
+                results[link] = {"alive": False}
+                continue
+            cached = self.cache.get(link)
+            if cached is not None:
+                results[link] = cached
+            else:
+                pending[self._executor.submit(propagate(self.check), link)] = link
+
+        if pending:
+            done, not_done = wait(pending, timeout=self.deadline)
+            for future in done:
+                results[pending[future]] = future.result()
+            with self._lock:
+                self.late += len(not_done)
+
+        enriched = []
+        for article in articles:
+            result = results.get(article.get("link"))
+            if result is None:
+                enriched.append(article)
+            elif result["alive"]:
+                enriched.append(dict(article, preview=result["preview"]) if result.get("preview") else article)
+        return enriched
+
+    def check(self, url):
+        """The cached or freshly fetched ``{"alive": ..., "preview": ...}`` for ``url``."""
+        return self._flight.do(url, lambda: self._check(url))
+
+    def stats(self):
+        return {
+            "outcomes": dict(self.outcomes),
+            "late": self.late,
+            "cache": self.cache.stats(),
+            "coalesced": self._flight.stats(),
+        }
+
+    def _check(self, url):
+        cached = self.cache.get(url)
+        if cached is not None:
+            return cached
+        outcome, result = self._fetch(url)
+        self.cache.set(url, result, self.ttl if outcome in ("enriched", "alive", "dead") else self.error_ttl)
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        record_link_check(outcome)
+        return result
+
+    def _fetch(self, url):
+        try:
+            response = self._get(url)
+        except (LinkRefused, AddressRefused) as e:
+            logger.info("Dropping link %s: %s", url, e)
+            return "dead", {"alive": False}
+        except requests.Timeout:
+            return "timeout", {"alive": True}
+        except requests.ConnectionError as e:
+            logger.info("Dropping unreachable link %s: %s", url, e)
+            return "dead", {"alive": False}
+        except requests.RequestException as e:
+            logger.info("Could not check link %s: %s", url, e)
+            return "error", {"alive": True}
+
+        with response:
+            if response.status_code in DEAD_STATUSES:
+                return "dead", {"alive": False}
+            if not response.ok:
+                return "error", {"alive": True}
+            if response.headers.get("Content-Type", "").split(";")[0].strip().lower() not in HTML_TYPES:
+                return "alive", {"alive": True}
+            try:
+                html = self._read_head(response)
+            except requests.RequestException:
+                return "timeout", {"alive": True}
+
+        encoding = response.encoding if "charset" in response.headers.get("Content-Type", "") else None
+        return "enriched", {"alive": True, "preview": parse_preview(html, response.url, encoding)}
+
+    def _get(self, url):
+        # Redirects are followed by hand so every hop gets the scheme check.
+        for _ in range(MAX_REDIRECTS + 1):
+            _check_scheme(url)
+            response = self.session.get(url, timeout=self.timeout, stream=True, allow_redirects=False)
+            if not response.is_redirect:
+                return response
+            response.close()
+            url = urljoin(url, response.headers["Location"])
+        raise requests.TooManyRedirects(f"More than {MAX_REDIRECTS} redirects")
+
+    def _read_head(self, response):
+        """Reads the page up to its ``</head>``, which holds the OpenGraph tags, or ``max_bytes``."""
+        html = b""
+        for chunk in response.iter_content(READ_CHUNK_SIZE):
+            html += chunk
+            if len(html) >= self.max_bytes or b"</head>" in html[-len(chunk) - 7:].lower():
+                break
+        return html[:self.max_bytes]
+
+
+def _check_scheme(url):
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise LinkRefused("not an http(s) URL")
+
+
+def parse_preview(html, base_url, encoding=None):
+    """OpenGraph title, image, site name and published date of an HTML page."""
+    soup = bs4.BeautifulSoup(
+        html, "html.parser", parse_only=bs4.SoupStrainer(["meta", "title", "time"]), from_encoding=encoding,
+    )
+    meta = {}
+    for tag in soup.find_all("meta"):
+        key = tag.get("property") or tag.get("name") or tag.get("itemprop")
+        content = (tag.get("content") or "").strip()
+        if key and content:
+            meta.setdefault(key.strip().lower(), content)
+
+    title = meta.get("og:title") or meta.get("twitter:title")
+    if not title and soup.title is not None and soup.title.string:
+        title = soup.title.string.strip()
+    image = meta.get("og:image") or meta.get("og:image:url") or meta.get("twitter:image")
+    published = next((meta[key] for key in PUBLISHED_KEYS if key in meta), None)
+    if not published:
+        time_tag = soup.find("time", datetime=True)
+        published = time_tag["datetime"].strip() if time_tag is not None else None
+
+    preview = {
+        "title": title,
+        "image": urljoin(base_url, image) if image else None,
+        "siteName": meta.get("og:site_name"),
+        "publishedAt": published,
+    }
+    return {key: value for key, value in preview.items() if value}
@@ -0,0 +1,254 @@
+import contextvars
+import logging
+import os
+import re
+import time
+import uuid
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID_PATTERN = re.compile(r"^[\w.:-]{1,128}$")
+
+REQUEST_ID = contextvars.ContextVar("request_id", default="-")
+ENDPOINT = contextvars.ContextVar("endpoint", default="-")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time from receiving a request until its response body is sent.",
+    ["endpoint", "method", "status"], buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUEST_BYTES = Histogram(
+    "http_request_size_bytes", "Request body size.", ["endpoint"], buckets=SIZE_BUCKETS,
+)
+HTTP_RESPONSE_BYTES = Histogram(
+    "http_response_size_bytes", "Response body size, when known up front.", ["endpoint"], buckets=SIZE_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "handler_stage_duration_seconds", "Time spent in each stage of a handler.",
+    ["endpoint", "stage"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_SECONDS = Histogram(
+    "upstream_request_duration_seconds", "Time per upstream attempt (until response headers when streaming).",
+    ["upstream", "status"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_RETRIES = Counter("upstream_retries_total", "Upstream attempts that were retried.", ["upstream"])
+UPSTREAM_REQUEST_BYTES = Histogram(
+    "upstream_request_size_bytes", "Upstream request body size.", ["upstream"], buckets=SIZE_BUCKETS,
+)
+UPSTREAM_RESPONSE_BYTES = Histogram(
+    "upstream_response_size_bytes", "Upstream response body size, when known up front.", ["upstream"],
+    buckets=SIZE_BUCKETS,
+)
+UPSTREAM_TOKENS = Counter("upstream_tokens_total", "Tokens reported in upstream usage blocks.", ["upstream", "kind"])
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "rate_limit_wait_seconds", "Time admitted requests waited for their API key's rate limit.",
+    ["limiter", "priority"], buckets=LATENCY_BUCKETS,
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    "rate_limit_rejections_total", "Requests turned away by a rate limiter.", ["limiter", "reason"],
+)
+UPSTREAM_HEDGES = Counter(
+    "upstream_hedges_total", "Hedged upstream requests by outcome.", ["upstream", "outcome"],
+)
+BREAKER_STATES = ("closed", "half_open", "open")
+# With several workers the scrape shows the worst state any live worker is in.
+BREAKER_STATE = Gauge(
+    "circuit_breaker_state", "0 = closed, 1 = half open, 2 = open.", ["upstream"], multiprocess_mode="livemax",
+)
+BREAKER_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total", "Circuit breaker state changes.", ["upstream", "state"],
+)
+BREAKER_REJECTIONS = Counter(
+    "circuit_breaker_rejections_total", "Calls shed by an open circuit breaker.", ["upstream"],
+)
+
+# The queue is shared by every worker process, so the latest reading from any
+# of them is the current one.
+JOB_QUEUE_DEPTH = Gauge(
+    "job_queue_depth", "Jobs waiting or running.", ["status"], multiprocess_mode="livemostrecent",
+)
+JOB_OLDEST_AGE_SECONDS = Gauge(
+    "job_queue_oldest_age_seconds", "Age of the oldest job still waiting to run.",
+    multiprocess_mode="livemostrecent",
+)
+JOB_WAIT_SECONDS = Histogram(
+    "job_wait_seconds", "Time jobs waited in the queue before a worker picked them up.", ["kind"],
+    buckets=LATENCY_BUCKETS,
+)
+JOBS = Counter("jobs_total", "Finished job attempts by outcome.", ["kind", "outcome"])
+JOB_WEBHOOKS = Counter("job_webhooks_total", "Job webhook deliveries by outcome.", ["outcome"])
+UPSTREAM_ROUTES = Counter(
+    "upstream_routes_total", "Requests routed to each member of an upstream pool, by reason.", ["pool", "member", "reason"],
+)
+UPSTREAM_ROUTE_EWMA_SECONDS = Gauge(
+    "upstream_route_ewma_seconds", "Moving average latency of each upstream pool member.", ["pool", "member"],
+    multiprocess_mode="livemostrecent",
+)
+CONVERSATION_UPLOADS = Counter(
+    "conversation_uploads_total", "Conversation session uploads by how they were sent to the model.", ["mode"],
+)
+LINK_CHECKS = Counter("article_link_checks_total", "Article links fetched for previews, by outcome.", ["outcome"])
+
+
+class stage:
+    """Times a block of a handler into ``handler_stage_duration_seconds``.
+
+        with stage("upstream"):
+            response = openai_client.post(...)
+    """
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if ENABLED:
+            STAGE_SECONDS.labels(ENDPOINT.get(), self.name).observe(time.perf_counter() - self.start)
+        return False
+
+
+def start_request(endpoint, request_id=None):
+    if not request_id or not REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex
+    REQUEST_ID.set(request_id)
+    ENDPOINT.set(endpoint)
+    return request_id
+
+
+def finish_request(endpoint, method, status, seconds, request_bytes, response_bytes):
+    if not ENABLED:
+        return
+    HTTP_REQUEST_SECONDS.labels(endpoint, method, str(status)).observe(seconds)
+    if request_bytes is not None:
+        HTTP_REQUEST_BYTES.labels(endpoint).observe(request_bytes)
+    if response_bytes is not None:
+        HTTP_RESPONSE_BYTES.labels(endpoint).observe(response_bytes)
+
+
+def propagate(fn):
+    """Wraps ``fn`` so it logs and records metrics under the current request when run in another thread."""
+    request_id, endpoint = REQUEST_ID.get(), ENDPOINT.get()
+
+    def run(*args, **kwargs):
+        REQUEST_ID.set(request_id)
+        ENDPOINT.set(endpoint)
+        return fn(*args, **kwargs)
+
+    return run
+
+
+def record_upstream(upstream, status, seconds, request_bytes=None, response_bytes=None):
+    if not ENABLED:
+        return
+    UPSTREAM_SECONDS.labels(upstream, str(status)).observe(seconds)
+    if request_bytes is not None:
+        UPSTREAM_REQUEST_BYTES.labels(upstream).observe(request_bytes)
+    if response_bytes is not None:
+        UPSTREAM_RESPONSE_BYTES.labels(upstream).observe(response_bytes)
+
+
+def record_retry(upstream):
+    if ENABLED:
+        UPSTREAM_RETRIES.labels(upstream).inc()
+
+
+def record_usage(upstream, usage):
+    if not ENABLED or not isinstance(usage, dict):
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if isinstance(usage.get(kind), int):
+            UPSTREAM_TOKENS.labels(upstream, kind[:-len("_tokens")]).inc(usage[kind])
+
+
+def record_rate_limit_wait(limiter, priority, seconds):
+    if ENABLED:
+        RATE_LIMIT_WAIT_SECONDS.labels(limiter, priority).observe(seconds)
+
+
+def record_rate_limit_rejection(limiter, reason):
+    if ENABLED:
+        RATE_LIMIT_REJECTIONS.labels(limiter, reason).inc()
+
+
+def record_hedge(upstream, outcome):
+    if ENABLED:
+        UPSTREAM_HEDGES.labels(upstream, outcome).inc()
+
+
+def record_breaker_state(upstream, state, transition=True):
+    if ENABLED:
+        BREAKER_STATE.labels(upstream).set(BREAKER_STATES.index(state))
+        if transition:
+            BREAKER_TRANSITIONS.labels(upstream, state).inc()
+
+
+def record_breaker_rejection(upstream):
+    if ENABLED:
+        BREAKER_REJECTIONS.labels(upstream).inc()
+
+
+def record_job_queue(depths, oldest_age):
+    if ENABLED:
+        for status, depth in depths.items():
+            JOB_QUEUE_DEPTH.labels(status).set(depth)
+        JOB_OLDEST_AGE_SECONDS.set(oldest_age)
+
+
+def record_job(kind, outcome, wait_seconds=None):
+    if not ENABLED:
+        return
+    JOBS.labels(kind, outcome).inc()
+    if wait_seconds is not None:
+        JOB_WAIT_SECONDS.labels(kind).observe(wait_seconds)
+
+
+def record_webhook(outcome):
+    if ENABLED:
+        JOB_WEBHOOKS.labels(outcome).inc()
+
+
+def record_route(pool, member, reason):
+    if ENABLED:
+        UPSTREAM_ROUTES.labels(pool, member, reason).inc()
+
+
+def record_route_latency(pool, member, seconds):
+    if ENABLED:
+        UPSTREAM_ROUTE_EWMA_SECONDS.labels(pool, member).set(seconds)
+
+
+def record_conversation_upload(mode):
+    if ENABLED:
+        CONVERSATION_UPLOADS.labels(mode).inc()
+
+
+def record_link_check(outcome):
+    if ENABLED:
+        LINK_CHECKS.labels(outcome).inc()
+
+
+def render_metrics():
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # Under gunicorn every worker writes its own files; add them all up.
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = REQUEST_ID.get()
+        return True
@@ -0,0 +1,30 @@
+import logging
+
+from lazy import LazyModule
+
+# Shared by the chart filter, the ticker reader and the conversation reader.
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+pytesseract = LazyModule("pytesseract")
+
+logger = logging.getLogger(__name__)
+
+
+def load_opencv():
+    """Imports OpenCV and numpy ahead of the first image."""
+    cv2.load()
+    np.load()
+
+
+def tesseract_available(feature):
+    """Whether the tesseract binary can be run; logs that ``feature`` is disabled when not."""
+    try:
+        pytesseract.get_tesseract_version()
+    except pytesseract.TesseractNotFoundError:
+        tesseract_missing(feature)
+        return False
+    return True
+
+
+def tesseract_missing(feature):
+    logger.warning("tesseract is not installed, disabling %s", feature)
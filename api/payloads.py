@@ -0,0 +1,85 @@
+import base64
+import json
+import re
+
+SLOT_PATTERN = re.compile(rb'"\\u0000(\w+)\\u0000"')
+
+# Multiple of 3 so every chunk base64-encodes without padding.
+ENCODE_CHUNK_SIZE = 3 * 64 * 1024
+
+
+def slot(name):
+    return f"\x00{name}\x00"
+
+
+class PayloadTemplate:
+    """A request body serialized once, with holes for the per-request values.
+
+    Build the payload dict with ``slot("name")`` wherever a value changes per
+    request. ``render`` then fills the holes into a single pre-sized buffer:
+    strings are JSON-encoded, ``bytes`` are copied as already-encoded JSON,
+    and images are base64-encoded in chunks straight into the buffer as a
+    data URL, so the encoded image is never held in memory twice.
+    """
+
+    def __init__(self, payload):
+        serialized = json.dumps(payload, separators=(",", ":")).encode()
+        pieces = SLOT_PATTERN.split(serialized)
+        self.static = pieces[0::2]
+        self.slots = [name.decode() for name in pieces[1::2]]
+        self.static_size = sum(len(piece) for piece in self.static)
+
+    def render(self, **values):
+        encoded = []
+        size = self.static_size
+        for name in self.slots:
+            value = values[name]
+            if isinstance(value, (bytes, bytearray)):
+                size += len(value)
+            elif hasattr(value, "mime_type"):
+                size += len(data_url_prefix(value)) + base64_size(len(value.data)) + 1
+            else:
+                value = encode_json(value)
+                size += len(value)
+            encoded.append(value)
+
+        buffer = bytearray(size)
+        position = 0
+        for static, value in zip(self.static, encoded + [None]):
+            buffer[position:position + len(static)] = static
+            position += len(static)
+            if value is None:
+                break
+            if hasattr(value, "mime_type"):
+                position = write_data_url(buffer, position, value)
+            else:
+                buffer[position:position + len(value)] = value
+                position += len(value)
+        return buffer
+
+
+def encode_json(value):
+    return json.dumps(value).encode()
+
+
+def base64_size(length):
+    return 4 * ((length + 2) // 3)
+
+
+def data_url_prefix(image):
+    return f'"data:{image.mime_type};base64,'.encode()
+
+
+def write_data_url(buffer, position, image):
+    prefix = data_url_prefix(image)
+    buffer[position:position + len(prefix)] = prefix
+    position += len(prefix)
+
+    data = memoryview(image.data)
+    for start in range(0, len(data), ENCODE_CHUNK_SIZE):
+        chunk = base64.b64encode(data[start:start + ENCODE_CHUNK_SIZE])
+        buffer[position:position + len(chunk)] = chunk
+        position += len(chunk)
+
+    buffer[position:position + 1] = b'"'
+    return position + 1
@@ -0,0 +1,151 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from lazy import LazyModule
+import hashlib
+import logging
+import threading
+import time
+
+# The GCS client pulls in most of google-cloud and google-auth.
+storage = LazyModule("google.cloud.storage")
+
+logger = logging.getLogger(__name__)
+
+CachedPrompt = namedtuple("CachedPrompt", ["text", "generation", "etag", "checked_at"])
+
+
+class PromptStore:
+    """Keeps prompt files from a GCS bucket in memory.
+
+    Prompts are loaded once and then revalidated in a background thread every
+    ``ttl`` seconds. Revalidation only fetches blob metadata; the body is
+    downloaded again only when the generation or etag changed. If the bucket
+    cannot be reached the last good copy keeps being served.
+
+    ``bucket`` can be any object with a ``get_blob(name)`` method returning
+    something with ``generation``, ``etag`` and ``download_as_text()``, which
+    makes it easy to run against a local fake bucket.
+    """
+
+    def __init__(self, bucket_name, filenames=(), ttl=300, bucket=None):
+        self.bucket_name = bucket_name
+        self.filenames = list(filenames)
+        self.ttl = ttl
+        self._bucket = bucket
+        self._bucket_lock = threading.Lock()
+        self._prompts = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.downloads = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            with self._bucket_lock:
+                if self._bucket is None:
+                    self._bucket = storage.Client().bucket(self.bucket_name)
+        return self._bucket
+
+    def start(self):
+        # Each prompt is two round trips to GCS, so they are fetched side by side.
+        with ThreadPoolExecutor(max_workers=max(1, len(self.filenames))) as executor:
+            list(executor.map(self._preload, self.filenames))
+
+        if self.ttl and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="prompt-store-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get(self, filename):
+        cached = self._prompts.get(filename)
+        if cached is not None:
+            self.hits += 1
+            return cached.text
+
+        self.misses += 1
+        return self._load(filename).text
+
+    def version(self, filename):
+        cached = self._prompts.get(filename)
+        if cached is None:
+            self.get(filename)
+            cached = self._prompts[filename]
+        if cached.generation is not None:
+            return str(cached.generation)
+        return hashlib.sha256(cached.text.encode()).hexdigest()[:16]
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def refresh(self):
+        self.refreshes += 1
+        for filename in list(self._prompts):
+            try:
+                self._load(filename)
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Could not refresh prompt %s, serving cached copy: %s", filename, e)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "downloads": self.downloads,
+            "not_modified": self.not_modified,
+            "errors": self.errors,
+            "prompts": {
+                filename: {"generation": cached.generation, "age": time.time() - cached.checked_at}
+                for filename, cached in self._prompts.items()
+            },
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.ttl):
+            self.refresh()
+
+    def _preload(self, filename):
+        try:
+            self._load(filename)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Could not preload prompt %s: %s", filename, e)
+
+    def _load(self, filename):
+        blob = self.bucket.get_blob(filename)
+        if blob is None:
+            raise FileNotFoundError(f"gs://{self.bucket_name}/{filename} does not exist")
+
+        generation, etag = blob.generation, blob.etag
+        cached = self._prompts.get(filename)
+        changed = False
+        if cached is not None and cached.generation == generation and cached.etag == etag:
+            self.not_modified += 1
+            cached = cached._replace(checked_at=time.time())
+        else:
+            text = blob.download_as_text()
+            self.downloads += 1
+            changed = cached is not None and cached.text != text
+            cached = CachedPrompt(text, generation, etag, time.time())
+
+        with self._lock:
+            self._prompts[filename] = cached
+
+        if changed:
+            logger.info("Prompt %s changed (generation %s)", filename, generation)
+            for callback in self._listeners:
+                callback(filename)
+        return cached
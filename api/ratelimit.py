@@ -0,0 +1,266 @@
+import heapq
+import itertools
+import logging
+import math
+import re
+import threading
+import time
+
+from metrics import record_rate_limit_rejection, record_rate_limit_wait
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BATCH: "batch"}
+
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+# OpenAI charges a fixed base plus a per-512px-tile cost for images.
+IMAGE_BASE_TOKENS = 85
+IMAGE_TILE_TOKENS = 170
+
+
+class RateLimited(Exception):
+    """The request cannot be admitted now; retry after ``retry_after`` seconds."""
+
+    def __init__(self, name, retry_after, reason="queue_full"):
+        super().__init__(f"{name} is over its rate limit, retry after {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def parse_duration(value):
+    """Parses OpenAI reset durations such as ``"1s"``, ``"6m0s"`` or ``"20ms"``."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+
+def image_tokens(image):
+    if image is None:
+        return 0
+    if image.detail == "low":
+        return IMAGE_BASE_TOKENS
+    tiles = math.ceil(image.width / 512) * math.ceil(image.height / 512)
+    return IMAGE_BASE_TOKENS + IMAGE_TILE_TOKENS * tiles
+
+
+def estimate_tokens(prompt_chars, image=None, completion=0):
+    # About four characters per token for English prompts.
+    return prompt_chars // 4 + image_tokens(image) + completion
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding at most one minute of ``per_minute``.
+
+    A ``per_minute`` of 0 means unlimited.
+    """
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def set_limit(self, per_minute, now):
+        self.refill(now)
+        # A bucket that was unlimited starts out full.
+        self.level = min(self.level, float(per_minute)) if self.per_minute > 0 else float(per_minute)
+        self.per_minute = per_minute
+
+    def refill(self, now):
+        if self.per_minute > 0:
+            self.level = min(float(self.per_minute), self.level + (now - self.updated) * self.per_minute / 60.0)
+        self.updated = now
+
+    def delay(self, amount, now):
+        """Seconds until ``amount`` can be taken."""
+        if self.per_minute <= 0:
+            return 0.0
+        self.refill(now)
+        # A request larger than the whole bucket goes through once the bucket is full.
+        amount = min(amount, self.per_minute)
+        wait = max(0.0, (amount - self.level) * 60.0 / self.per_minute)
+        return max(wait, self.blocked_until - now)
+
+    def take(self, amount):
+        if self.per_minute > 0:
+            self.level -= amount
+
+    def sync(self, remaining, reset, now):
+        """Lowers the level to what the upstream says is left."""
+        if self.per_minute <= 0:
+            return
+        self.refill(now)
+        self.level = min(self.level, float(remaining))
+        if remaining <= 0 and reset:
+            self.blocked_until = max(self.blocked_until, now + reset)
+
+    def block(self, seconds, now):
+        self.refill(now)
+        self.level = min(self.level, 0.0)
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for one upstream API key.
+
+    ``acquire`` admits a request right away when both buckets have room and
+    nobody is waiting. Otherwise the caller joins a bounded queue ordered by
+    priority, then arrival, and waits at most ``max_wait`` seconds. A full
+    queue or an expired wait raises ``RateLimited`` with an estimate of when
+    to retry.
+
+    ``share`` is the fraction of the key's limits this process may use, e.g.
+    ``1 / workers``. ``observe`` applies ``x-ratelimit-*`` response headers
+    and ``penalize`` backs off after an upstream 429.
+    """
+
+    def __init__(self, name, rpm=0, tpm=0, max_queue=100, max_wait=10.0, share=1.0):
+        self.name = name
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.share = share
+        self.requests = TokenBucket(rpm * share)
+        self.tokens = TokenBucket(tpm * share)
+
+        self._cond = threading.Condition()
+        self._queue = []
+        self._order = itertools.count()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+
+    def acquire(self, cost=0, priority=PRIORITY_INTERACTIVE, timeout=None):
+        start = time.monotonic()
+        deadline = start + (self.max_wait if timeout is None else timeout)
+        with self._cond:
+            delay = self._delay(cost, start)
+            if not self._queue and delay <= 0:
+                self._take(cost)
+                return 0.0
+
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                record_rate_limit_rejection(self.name, "queue_full")
+                raise RateLimited(self.name, max(1.0, self._backlog_seconds(cost, start)), "queue_full")
+
+            entry = (priority, next(self._order))
+            heapq.heappush(self._queue, entry)
+            self.queued += 1
+            while True:
+                now = time.monotonic()
+                delay = self._delay(cost, now)
+                if self._queue[0] == entry and delay <= 0:
+                    heapq.heappop(self._queue)
+                    self._take(cost)
+                    self._cond.notify_all()
+                    break
+                if now >= deadline or (self._queue[0] == entry and now + delay > deadline):
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self._cond.notify_all()
+                    self.timed_out += 1
+                    record_rate_limit_rejection(self.name, "timeout")
+                    raise RateLimited(self.name, max(1.0, self._backlog_seconds(cost, now)), "timeout")
+                # Only the head of the queue needs to wake up for the buckets.
+                self._cond.wait(min(delay, deadline - now) if self._queue[0] == entry else deadline - now)
+
+        waited = time.monotonic() - start
+        self.wait_seconds += waited
+        record_rate_limit_wait(self.name, PRIORITY_NAMES.get(priority, str(priority)), waited)
+        return waited
+
+    def try_acquire(self, cost=0):
+        """Admits the request only if ``acquire`` would without waiting.
+
+        For optional calls such as hedges: it never queues and a refusal is
+        not counted as a rejection.
+        """
+        with self._cond:
+            if self._queue or self._delay(cost, time.monotonic()) > 0:
+                return False
+            self._take(cost)
+            return True
+
+    def observe(self, headers):
+        now = time.monotonic()
+        with self._cond:
+            for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+                limit = _header_number(headers, f"x-ratelimit-limit-{kind}")
+                if limit is not None and limit * self.share != bucket.per_minute:
+                    logger.info("%s %s limit is now %d per minute", self.name, kind, limit)
+                    bucket.set_limit(limit * self.share, now)
+                remaining = _header_number(headers, f"x-ratelimit-remaining-{kind}")
+                if remaining is not None:
+                    reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                    bucket.sync(remaining * self.share, reset, now)
+            self._cond.notify_all()
+
+    def headroom(self):
+        """Share of the per-minute limits left right now, from 0 to 1; 0 while requests are queued."""
+        now = time.monotonic()
+        with self._cond:
+            if self._queue:
+                return 0.0
+            headroom = 1.0
+            for bucket in (self.requests, self.tokens):
+                if bucket.per_minute > 0:
+                    bucket.refill(now)
+                    left = 0.0 if bucket.blocked_until > now else bucket.level / bucket.per_minute
+                    headroom = min(headroom, max(0.0, left))
+            return headroom
+
+    def penalize(self, seconds):
+        with self._cond:
+            self.throttled += 1
+            self.requests.block(seconds, time.monotonic())
+
+    def stats(self):
+        return {
+            "rpm": self.requests.per_minute,
+            "tpm": self.tokens.per_minute,
+            "waiting": len(self._queue),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "throttled": self.throttled,
+            "wait_seconds": round(self.wait_seconds, 3),
+        }
+
+    def _delay(self, cost, now):
+        return max(self.requests.delay(1, now), self.tokens.delay(cost, now))
+
+    def _take(self, cost):
+        self.requests.take(1)
+        self.tokens.take(cost)
+        self.admitted += 1
+
+    def _backlog_seconds(self, cost, now):
+        # Everybody in the queue goes first; assume they each need one request.
+        requests_wait = self.requests.delay(len(self._queue) + 1, now)
+        return max(requests_wait, self.tokens.delay(cost, now))
+
+
+def _header_number(headers, name):
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        return None
@@ -0,0 +1,152 @@
+from breaker import CircuitOpen
+from metrics import record_route, record_route_latency
+from ratelimit import PRIORITY_INTERACTIVE, RateLimited
+import logging
+import threading
+import time
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Turned-away or unreachable members are skipped for the next best one.
+FAILOVER_ERRORS = (RateLimited, CircuitOpen, requests.ConnectionError)
+
+
+class PoolMember:
+    """One way of serving a product's requests: an upstream client, an API key and a model."""
+
+    def __init__(self, name, client, limiter, api_key, model):
+        self.name = name
+        self.client = client
+        self.limiter = limiter
+        self.api_key = api_key
+        self.model = model
+        self.ewma = None
+        self.in_flight = 0
+        self.last_routed = 0.0
+        self.routed = 0
+        self.failovers = 0
+
+    @property
+    def ejected(self):
+        return self.client.breaker is not None and not self.client.breaker.available
+
+    def headroom(self):
+        return self.limiter.headroom() if self.limiter is not None else 1.0
+
+
+class UpstreamPool:
+    """Routes one product's OpenAI calls across several endpoints, keys and models.
+
+    Each request goes to the member with the lowest expected latency: its
+    EWMA latency, times its in-flight calls plus one, divided by its
+    rate-limit headroom. Members are ejected while their upstream's circuit
+    breaker is open and get traffic again once it lets a probe through; a
+    member that has not been picked for ``probe_interval`` seconds gets the
+    next request, so a member that recovered or got faster is noticed. If
+    the picked member turns a request away (rate limit or open breaker),
+    cannot be reached or answers with a 429 or 5xx, the next best member is
+    tried; the last member's answer is returned as is.
+
+    ``render(model)`` returns the request body for a member's model.
+    """
+
+    def __init__(self, name, members, alpha=0.3, probe_interval=30.0, min_headroom=0.05):
+        if not members:
+            raise ValueError(f"Upstream pool {name} has no members.")
+        self.name = name
+        self.members = list(members)
+        self.alpha = alpha
+        self.probe_interval = probe_interval
+        self.min_headroom = min_headroom
+        self._lock = threading.Lock()
+
+    @property
+    def models(self):
+        return sorted({member.model for member in self.members})
+
+    def post(self, render, cost=0, priority=PRIORITY_INTERACTIVE, stream=False, route=None):
+        tried = set()
+        while True:
+            member = self._choose(tried)
+            tried.add(member.name)
+            headers = {"Content-Type": "application/json", "Authorization": f"Bearer {member.api_key}"}
+            start = time.perf_counter()
+            try:
+                response = member.client.post(
+                    data=render(member.model), headers=headers, stream=stream, limiter=member.limiter, cost=cost,
+                    priority=priority, route=route,
+                )
+            except FAILOVER_ERRORS as e:
+                sent = isinstance(e, requests.ConnectionError)
+                self._finish(member, time.perf_counter() - start, False, sent=sent)
+                if len(tried) == len(self.members):
+                    raise
+                member.failovers += 1
+                logger.info("%s: %s turned the request away (%s), trying the next member", self.name, member.name, e)
+                continue
+            except Exception:
+                self._finish(member, time.perf_counter() - start, False)
+                raise
+            failed = response.status_code >= 500 or response.status_code == 429
+            self._finish(member, time.perf_counter() - start, not failed)
+            if failed and len(tried) < len(self.members):
+                member.failovers += 1
+                logger.info("%s: %s returned %s, trying the next member", self.name, member.name, response.status_code)
+                response.close()
+                continue
+            return response
+
+    def stats(self):
+        return {
+            member.name: {
+                "model": member.model,
+                "upstream": member.client.name,
+                "ewma_ms": round(member.ewma * 1000, 1) if member.ewma is not None else None,
+                "in_flight": member.in_flight,
+                "headroom": round(member.headroom(), 3),
+                "ejected": member.ejected,
+                "routed": member.routed,
+                "failovers": member.failovers,
+            }
+            for member in self.members
+        }
+
+    def _choose(self, tried):
+        now = time.monotonic()
+        with self._lock:
+            candidates = [member for member in self.members if member.name not in tried]
+            available = [member for member in candidates if not member.ejected] or candidates
+            stale = [
+                member for member in available
+                if member.ewma is not None and now - member.last_routed >= self.probe_interval
+            ]
+            if stale:
+                member, reason = stale[0], "probe"
+            else:
+                # On a tie a member without a latency yet goes first, so it gets one.
+                member = min(available, key=lambda member: (self._score(member), member.ewma is not None))
+                reason = "failover" if tried else "best"
+            member.in_flight += 1
+            member.last_routed = now
+            member.routed += 1
+        record_route(self.name, member.name, reason)
+        return member
+
+    def _score(self, member):
+        # Members without a latency yet look as fast as the fastest one, so they get tried.
+        known = [other.ewma for other in self.members if other.ewma is not None]
+        ewma = member.ewma if member.ewma is not None else min(known, default=0.0)
+        return ewma * (member.in_flight + 1) / max(member.headroom(), self.min_headroom)
+
+    def _finish(self, member, seconds, success, sent=True):
+        with self._lock:
+            member.in_flight -= 1
+            if not sent:
+                return
+            if not success and member.ewma is not None:
+                # A failure counts as at least twice as slow as usual.
+                seconds = max(seconds, 2 * member.ewma)
+            member.ewma = seconds if member.ewma is None else self.alpha * seconds + (1 - self.alpha) * member.ewma
+            ewma = member.ewma
+        record_route_latency(self.name, member.name, ewma)
@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+import sqlite3
+import sys
+
+
+def _gevent_patched():
+    if "gevent" not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched("threading")
+
+
+class SQLiteThread:
+    """One SQLite connection, used only from a dedicated OS thread.
+
+    sqlite3 blocks its thread while it waits for another process's lock (up
+    to the busy ``timeout``) or on the disk. Under gevent that thread is the
+    worker's event loop, so every in-flight request would stall with it.
+    Calls therefore run on a real thread from a gevent thread pool, and only
+    the calling greenlet waits; without gevent a one-thread executor is used
+    the same way. All calls share the one connection, so the ``setup``
+    statements (e.g. ``PRAGMA journal_mode=WAL``) run once per process
+    rather than once per greenlet.
+    """
+
+    def __init__(self, path, setup=(), **connect_kwargs):
+        self.path = path
+        self.setup = setup
+        self.connect_kwargs = connect_kwargs
+        self._connection = None
+        if _gevent_patched():
+            from gevent.threadpool import ThreadPool
+            self._pool = ThreadPool(1)
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    def run(self, fn, *args):
+        """Returns ``fn(connection, *args)``, called on the connection's thread."""
+        if isinstance(self._pool, ThreadPoolExecutor):
+            return self._pool.submit(self._call, fn, args).result()
+        return self._pool.apply(self._call, (fn, args))
+
+    def execute(self, sql, parameters=()):
+        """Runs one statement and returns all of its rows."""
+        return self.run(lambda connection: connection.execute(sql, parameters).fetchall())
+
+    def _call(self, fn, args):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, **self.connect_kwargs)
+            for statement in self.setup:
+                self._connection.execute(statement)
+        return fn(self._connection, *args)
@@ -0,0 +1,131 @@
+import json
+
+
+class IncrementalJSONParser:
+    """Finds completed values in a JSON document that arrives in pieces.
+
+    ``paths`` is a list of key paths such as ``("result", "features",
+    "generalTrends")``. Every time the value at one of those paths is closed,
+    ``feed`` returns it as ``(path, value)`` without waiting for the rest of
+    the document.
+    """
+
+    def __init__(self, paths):
+        self.paths = {tuple(path) for path in paths}
+        self.text = ""
+        self._pos = 0
+        # Each frame is [kind, path, state, key, start] where state is what the
+        # container expects next: "key", "colon", "value" or "comma".
+        self._stack = []
+        self._token = None
+
+    def feed(self, chunk):
+        self.text += chunk
+        completed = []
+        text = self.text
+        while self._pos < len(text):
+            char = text[self._pos]
+            if self._token is not None:
+                if not self._continue_token(char, completed):
+                    continue
+            elif char in " \t\r\n":
+                pass
+            elif not self._stack or self._stack[-1][2] == "value":
+                self._start_value(char, completed)
+            else:
+                self._structural(char, completed)
+            self._pos += 1
+        return completed
+
+    def _path_for_value(self):
+        if not self._stack:
+            return ()
+        frame = self._stack[-1]
+        return frame[1] + (frame[3],)
+
+    def _start_value(self, char, completed):
+        path = self._path_for_value()
+        if char in "{[":
+            kind = "object" if char == "{" else "array"
+            state = "key" if kind == "object" else "value"
+            key = None if kind == "object" else 0
+            self._stack.append([kind, path, state, key, self._pos])
+        elif char == "]" and self._stack and self._stack[-1][0] == "array":
+            self._close(completed)
+        elif char == '"':
+            self._token = ["string", path, self._pos, False]
+        else:
+            self._token = ["scalar", path, self._pos, False]
+
+    def _structural(self, char, completed):
+        frame = self._stack[-1]
+        if char in "}]":
+            self._close(completed)
+        elif char == '"' and frame[2] == "key":
+            self._token = ["key", None, self._pos, False]
+        elif char == ":" and frame[2] == "colon":
+            frame[2] = "value"
+        elif char == "," and frame[2] == "comma":
+            if frame[0] == "object":
+                frame[2] = "key"
+            else:
+                frame[2] = "value"
+                frame[3] += 1
+
+    def _continue_token(self, char, completed):
+        kind, path, start, escaped = self._token
+        if kind == "scalar":
+            if char in ",}] \t\r\n":
+                self._token = None
+                self._value_done(path, start, self._pos, completed)
+                # Re-read the delimiter as structure.
+                return False
+            return True
+
+        if escaped:
+            self._token[3] = False
+        elif char == "\\":
+            self._token[3] = True
+        elif char == '"':
+            self._token = None
+            if kind == "key":
+                frame = self._stack[-1]
+                frame[3] = json.loads(self.text[start:self._pos + 1])
+                frame[2] = "colon"
+            else:
+                self._value_done(path, start, self._pos + 1, completed)
+        return True
+
+    def _close(self, completed):
+        kind, path, _, _, start = self._stack.pop()
+        self._value_done(path, start, self._pos + 1, completed)
+
+    def _value_done(self, path, start, end, completed):
+        if self._stack:
+            self._stack[-1][2] = "comma"
+        if path in self.paths:
+            completed.append((path, json.loads(self.text[start:end])))
+
+
+def iter_stream_content(response, on_usage=None):
+    """Yields content deltas from an OpenAI-style chat completion stream.
+
+    ``on_usage`` is called with the ``usage`` block of the final chunk.
+    """
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            break
+        event = json.loads(data)
+        if on_usage is not None and event.get("usage"):
+            on_usage(event["usage"])
+        for choice in event.get("choices") or []:
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                yield content
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
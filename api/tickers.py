@@ -0,0 +1,113 @@
+import logging
+import re
+import threading
+import time
+
+from ocr import cv2, load_opencv, np, pytesseract, tesseract_available, tesseract_missing
+
+logger = logging.getLogger(__name__)
+
+TICKER_PATTERN = re.compile(r"(?<![A-Za-z0-9])(?:[A-Z0-9_]{2,12}:)?([A-Z][A-Z0-9]{0,9}(?:[./][A-Z0-9]{1,6})?!?)(?![A-Za-z0-9])")
+
+# Uppercase words that show up next to the symbol in chart headers.
+NOT_TICKERS = {
+    "NASDAQ", "NYSE", "AMEX", "ARCA", "BATS", "CBOE", "CME", "COMEX", "NYMEX", "TVC", "OTC", "LSE", "TSX",
+    "BINANCE", "COINBASE", "BYBIT", "KRAKEN", "OKX", "BITSTAMP", "OANDA", "FX", "FXCM", "FOREXCOM",
+    "O", "H", "L", "C", "D", "W", "M", "VOL", "CHG", "USD", "INC", "CORP", "LTD", "CO", "ETF", "THE",
+    "PRE", "POST", "LIVE", "CLOSED", "MARKET", "BUY", "SELL", "TRADINGVIEW", "MA", "EMA", "SMA", "RSI", "MACD",
+}
+
+
+def normalize_ticker(ticker):
+    """Comparable form of a ticker, e.g. ``NASDAQ:AAPL`` and ``aapl`` both become ``AAPL``."""
+    if not ticker:
+        return ""
+    return re.sub(r"[^A-Z0-9]", "", str(ticker).upper().rsplit(":", 1)[-1])
+
+
+def ticker_from_text(text):
+    for match in TICKER_PATTERN.finditer(text):
+        ticker = match.group(1)
+        if len(ticker) >= 2 and ticker not in NOT_TICKERS:
+            return ticker
+    return None
+
+
+class TickerReader:
+    """Reads the ticker from the title area of a chart screenshot with OCR.
+
+    Charting apps print the symbol in the top-left corner, so only the top
+    ``region_height`` by ``region_width`` fraction of the image is read. The
+    first all-caps token that is not an exchange, timeframe or OHLC label is
+    taken as the ticker.
+    """
+
+    def __init__(self, enabled=True, region_width=0.7, region_height=0.15):
+        self.enabled = enabled
+        self.region_width = region_width
+        self.region_height = region_height
+
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.found = 0
+        self.matches = 0
+        self.mismatches = 0
+        self.total_seconds = 0.0
+
+    def warm_up(self):
+        """Imports OpenCV and checks for tesseract ahead of the first read."""
+        if not self.enabled:
+            return
+        load_opencv()
+        self.enabled = tesseract_available("ticker OCR")
+
+    def read(self, image_bytes):
+        if not self.enabled:
+            return None
+
+        start = time.perf_counter()
+        ticker = None
+        image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if image is not None:
+            height, width = image.shape
+            title = image[:max(1, int(height * self.region_height)), :max(1, int(width * self.region_width))]
+            title = cv2.resize(title, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+            _, title = cv2.threshold(title, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            if np.count_nonzero(title) < title.size / 2:
+                # Dark theme: tesseract expects dark text on a light background.
+                title = cv2.bitwise_not(title)
+            try:
+                ticker = ticker_from_text(pytesseract.image_to_string(title, config="--psm 6"))
+            except pytesseract.TesseractNotFoundError:
+                tesseract_missing("ticker OCR")
+                self.enabled = False
+            except pytesseract.TesseractError as e:
+                logger.warning("Skipping ticker OCR: %s", e)
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.reads += 1
+            self.found += ticker is not None
+            self.total_seconds += elapsed
+        return ticker
+
+    def record_model_ticker(self, ocr_ticker, model_ticker):
+        matched = normalize_ticker(ocr_ticker) == normalize_ticker(model_ticker)
+        with self._lock:
+            if matched:
+                self.matches += 1
+            else:
+                self.mismatches += 1
+        if not matched:
+            logger.info("OCR ticker %r does not match model ticker %r", ocr_ticker, model_ticker)
+        return matched
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "reads": self.reads,
+            "found": self.found,
+            "matches": self.matches,
+            "mismatches": self.mismatches,
+            "mean_ms": self.total_seconds / self.reads * 1000 if self.reads else 0.0,
+        }
@@ -0,0 +1,169 @@
+from tempfile import SpooledTemporaryFile
+from images import SIGNATURE_BYTES, InvalidImageError, decode_base64_image, sniff_image_format
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import FormDataParser
+import json
+
+READ_CHUNK_SIZE = 64 * 1024
+# Room for the other JSON or form fields next to the image.
+FIELDS_ALLOWANCE = 64 * 1024
+# In-memory limit for the non-file form fields; werkzeug also applies it to
+# its own read buffer, so it has to be well above its 64 KiB reads.
+FORM_MEMORY_BYTES = 512 * 1024
+# Form fields whose values are lists; every other field holds a single value.
+LIST_FIELDS = {"tradingStyles"}
+BOOLEAN_FIELDS = {"stream", "enrichLinks"}
+
+
+class ImageTooLargeError(InvalidImageError):
+    pass
+
+
+class ImageUploadReader:
+    """Reads the image and other fields of a request to an image endpoint.
+
+    Three request formats are accepted:
+
+    - JSON with the image base64-encoded in ``base64Image``, read with the
+      same size limit even when it is chunked and has no Content-Length.
+    - ``multipart/form-data`` with the image in an ``image`` file part and
+      the other fields as form fields.
+    - A raw ``image/*`` body, with the other fields in the query string.
+
+    The binary formats are read in chunks into a buffer that moves to disk
+    past ``spool_bytes``, and the image is only base64-encoded once, into the
+    upstream payload. Uploads larger than ``max_bytes`` are turned away
+    with ``ImageTooLargeError`` as early as their size is known. Images
+    that are not JPEG, PNG, GIF, WebP, BMP or TIFF by their first bytes are
+    rejected with ``InvalidImageError``.
+    """
+
+    def __init__(self, max_bytes=20 * 1024 * 1024, spool_bytes=1024 * 1024):
+        self.max_bytes = max_bytes
+        self.spool_bytes = spool_bytes
+
+    def read(self, request):
+        """Returns ``(fields, image_bytes)``."""
+        if request.content_length is not None and request.content_length > self.max_request_bytes(request):
+            raise ImageTooLargeError(f"The image must be at most {self.max_bytes} bytes.")
+
+        if request.mimetype == "multipart/form-data":
+            fields, image_bytes = self._read_multipart(request)
+        elif request.mimetype.startswith("image/"):
+            fields, image_bytes = _fields(request.args), self._read_stream(request.stream)
+        else:
+            fields = self.read_json(request)
+            if not isinstance(fields, dict) or "base64Image" not in fields:
+                raise InvalidImageError("Missing 'base64Image' in JSON body or an 'image' upload.")
+            return fields, self.decode(fields["base64Image"])
+
+        if sniff_image_format(image_bytes) is None:
+            raise InvalidImageError("The image is not a supported format.")
+        return fields, image_bytes
+
+    def read_json(self, request, max_request_bytes=None):
+        """The JSON body, or None when the request is not JSON or does not parse.
+
+        The body is read in chunks up to ``max_request_bytes`` (by default
+        what one image allows), so a chunked request cannot make the
+        worker buffer an unbounded body before the image size is checked.
+        """
+        if not request.is_json:
+            return None
+        limit = self.max_request_bytes(request) if max_request_bytes is None else max_request_bytes
+        chunks = []
+        size = 0
+        while True:
+            chunk = request.stream.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > limit:
+                raise ImageTooLargeError(f"The request must be at most {limit} bytes.")
+            chunks.append(chunk)
+        try:
+            return json.loads(b"".join(chunks))
+        except ValueError:
+            return None
+
+    def decode(self, base64_image):
+        """Decodes a base64 image and applies the size and format checks of an upload."""
+        image_bytes = decode_base64_image(base64_image)
+        if len(image_bytes) > self.max_bytes:
+            raise ImageTooLargeError(f"The image must be at most {self.max_bytes} bytes.")
+        if sniff_image_format(image_bytes) is None:
+            raise InvalidImageError("The image is not a supported format.")
+        return image_bytes
+
+    def max_request_bytes(self, request):
+        if request.mimetype.startswith("image/"):
+            return self.max_bytes
+        if request.mimetype == "multipart/form-data":
+            return self.max_bytes + FIELDS_ALLOWANCE
+        # Base64 turns every 3 bytes into 4 characters.
+        return self.max_bytes * 4 // 3 + FIELDS_ALLOWANCE
+
+    def _read_multipart(self, request):
+        parser = FormDataParser(
+            stream_factory=self._spool,
+            max_form_memory_size=FORM_MEMORY_BYTES,
+            max_content_length=self.max_bytes + FIELDS_ALLOWANCE,
+        )
+        try:
+            _, form, files = parser.parse_from_environ(request.environ)
+        except RequestEntityTooLarge:
+            raise ImageTooLargeError(f"The image must be at most {self.max_bytes} bytes.")
+        try:
+            upload = files.get("image")
+            if upload is None:
+                raise InvalidImageError("Missing 'image' file in the multipart form.")
+            # The parser has already spooled the part and enforced the size limit.
+            upload.stream.seek(0)
+            image_bytes = upload.stream.read()
+        finally:
+            for part in files.values():
+                part.close()
+        if not image_bytes:
+            raise InvalidImageError("The image upload is empty.")
+        # The parser's limit leaves room for the other fields.
+        if len(image_bytes) > self.max_bytes:
+            raise ImageTooLargeError(f"The image must be at most {self.max_bytes} bytes.")
+        return _fields(form), image_bytes
+
+    def _read_stream(self, stream):
+        with self._spool() as buffer:
+            size = 0
+            header = b""
+            while True:
+                chunk = stream.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if len(header) < SIGNATURE_BYTES:
+                    header += chunk[:SIGNATURE_BYTES - len(header)]
+                    if len(header) == SIGNATURE_BYTES and sniff_image_format(header) is None:
+                        # Turn away anything that is not an image before reading the rest of it.
+                        raise InvalidImageError("The image is not a supported format.")
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise ImageTooLargeError(f"The image must be at most {self.max_bytes} bytes.")
+                buffer.write(chunk)
+            if size == 0:
+                raise InvalidImageError("The image upload is empty.")
+            buffer.seek(0)
+            return buffer.read()
+
+    def _spool(self, *args, **kwargs):
+        return SpooledTemporaryFile(max_size=self.spool_bytes, mode="w+b")
+
+
+def _fields(values):
+    fields = {}
+    for key in values:
+        items = values.getlist(key)
+        if key in LIST_FIELDS:
+            fields[key] = [item.strip() for value in items for item in value.split(",") if item.strip()]
+        elif key in BOOLEAN_FIELDS:
+            fields[key] = items[-1].lower() in ("1", "true")
+        else:
+            fields[key] = items[-1]
+    return fields
@@ -0,0 +1,292 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from email.utils import parsedate_to_datetime
+from metrics import propagate, record_hedge, record_rate_limit_rejection, record_retry, record_upstream
+from ratelimit import PRIORITY_INTERACTIVE, RateLimited
+from requests.adapters import HTTPAdapter
+import datetime
+import logging
+import random
+import requests
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+LATENCY_SAMPLES = 200
+# Hedge tokens that can be saved up for a burst of slow calls.
+HEDGE_BURST = 10
+
+
+def _close_response(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+class UpstreamClient:
+    """Pooled keep-alive HTTP client for a single upstream API.
+
+    Connection errors and 429/5xx responses are retried with full-jitter
+    exponential backoff. A ``Retry-After`` header takes precedence over the
+    computed delay, as long as it is not longer than ``retry_after_max``.
+    Read timeouts are not retried, since the upstream may still be working
+    on the request.
+
+    With a ``limiter`` every attempt is admitted through it first, its
+    buckets follow the upstream's rate-limit headers, and a 429 that cannot
+    be retried raises ``RateLimited`` instead of being returned.
+
+    With a ``breaker`` every attempt is checked against it first and reports
+    its outcome to it; 5xx responses, connection errors and timeouts count
+    as failures.
+
+    Calls made with a ``route`` are hedged when ``hedge_percentile`` is set:
+    once a call has taken longer than that percentile of recent calls on
+    the same route (and at least ``hedge_min_delay``), an identical request
+    is sent and whichever answers first is used. At most ``hedge_max_rate``
+    of calls are hedged. Hedged calls and their hedges each run on a thread
+    of their own rather than a bounded pool, so they never wait for a free
+    worker, and the hedge delay counts from when the call was sent.
+    """
+
+    def __init__(self, name, url, pool_size=10, connect_timeout=5.0, read_timeout=60.0,
+                 max_retries=2, backoff_base=0.5, backoff_max=8.0, retry_after_max=30.0, breaker=None,
+                 hedge_percentile=None, hedge_max_rate=0.05, hedge_min_delay=1.0, hedge_min_samples=20):
+        self.name = name
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_after_max = retry_after_max
+        self.pool_size = pool_size
+        self.breaker = breaker
+        self.hedge_percentile = hedge_percentile
+        self.hedge_max_rate = hedge_max_rate
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self._latencies = {}
+        self._hedge_tokens = HEDGE_BURST
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedges_won = 0
+
+    def post(self, json=None, headers=None, limiter=None, cost=0, priority=PRIORITY_INTERACTIVE, route=None,
+             **kwargs):
+        attempt = 0
+        while True:
+            throttled = False
+            if self.breaker is not None:
+                self.breaker.before_call()
+            if limiter is not None:
+                try:
+                    limiter.acquire(cost, priority)
+                except RateLimited:
+                    if self.breaker is not None:
+                        self.breaker.cancel()
+                    raise
+            start = time.perf_counter()
+            try:
+                response = self._send(route, limiter, cost, json=json, headers=headers, **kwargs)
+            except requests.RequestException as e:
+                self._record_outcome(route, kwargs, False, time.perf_counter() - start)
+                if not isinstance(e, (requests.ConnectionError, requests.exceptions.ConnectTimeout)):
+                    raise
+                if attempt >= self.max_retries:
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning("%s connection error (%s), retrying in %.2fs", self.name, e, delay)
+            else:
+                self._record_outcome(route, kwargs, response.status_code < 500, time.perf_counter() - start)
+                if limiter is not None:
+                    limiter.observe(response.headers)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                delay = self._retry_after(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                throttled = response.status_code == 429 and limiter is not None
+                if throttled:
+                    # The limiter holds back every caller of this key, including this retry.
+                    limiter.penalize(delay)
+                if attempt >= self.max_retries or delay > self.retry_after_max:
+                    if throttled:
+                        response.close()
+                        record_rate_limit_rejection(limiter.name, "upstream")
+                        raise RateLimited(limiter.name, delay, "upstream")
+                    return response
+                logger.warning(
+                    "%s returned %s (upstream request id %s), retrying in %.2fs",
+                    self.name, response.status_code, response.headers.get("x-request-id", "-"), delay,
+                )
+                response.close()
+
+            with self._lock:
+                self.retries += 1
+            record_retry(self.name)
+            attempt += 1
+            if not throttled:
+                time.sleep(delay)
+
+    def warm_up(self, connections=1):
+        """Opens ``connections`` keep-alive connections ahead of the first call.
+
+        Any response will do, so a bodiless HEAD is sent to the endpoint.
+        """
+        def connect():
+            try:
+                self.session.head(self.url, timeout=self.timeout).close()
+            except requests.RequestException as e:
+                logger.warning("Could not connect to %s ahead of time: %s", self.name, e)
+
+        threads = [threading.Thread(target=connect) for _ in range(min(connections, self.pool_size))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def stats(self):
+        stats = {
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "hedges_won": self.hedges_won,
+        }
+        if self.breaker is not None:
+            stats["breaker"] = self.breaker.stats()
+        return stats
+
+    def _request(self, **kwargs):
+        with self._lock:
+            self.requests += 1
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.url, timeout=self.timeout, **kwargs)
+        except requests.RequestException:
+            record_upstream(self.name, "error", time.perf_counter() - start)
+            raise
+        record_upstream(
+            self.name, response.status_code, time.perf_counter() - start,
+            request_bytes=len(response.request.body or b""),
+            response_bytes=self._response_size(response, kwargs.get("stream", False)),
+        )
+        return response
+
+    def _send(self, route, limiter, cost, **kwargs):
+        delay = self._hedge_delay(route, kwargs.get("stream", False))
+        if delay is None:
+            return self._request(**kwargs)
+
+        primary = self._spawn(**kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_hedge_token():
+            return primary.result()
+        if limiter is not None and not limiter.try_acquire(cost):
+            record_hedge(self.name, "skipped")
+            return primary.result()
+
+        record_hedge(self.name, "sent")
+        with self._lock:
+            self.hedges += 1
+        hedge = self._spawn(**kwargs)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winners = [future for future in done if future.exception() is None]
+            if winners or not pending:
+                winner = winners[0] if winners else done.pop()
+                for future in pending | (done - {winner}):
+                    future.add_done_callback(_close_response)
+                if winner is hedge and winners:
+                    with self._lock:
+                        self.hedges_won += 1
+                    record_hedge(self.name, "won")
+                else:
+                    record_hedge(self.name, "lost")
+                return winner.result()
+
+    def _spawn(self, **kwargs):
+        """Sends a request on a new thread; returns its future once the request has started."""
+        future = Future()
+        future.set_running_or_notify_cancel()
+        started = threading.Event()
+        request = propagate(self._request)
+
+        def run():
+            started.set()
+            try:
+                future.set_result(request(**kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name=f"{self.name}-call", daemon=True).start()
+        started.wait()
+        return future
+
+    def _hedge_delay(self, route, stream):
+        if route is None or self.hedge_percentile is None:
+            return None
+        with self._lock:
+            self._hedge_tokens = min(HEDGE_BURST, self._hedge_tokens + self.hedge_max_rate)
+            latencies = self._latencies.get((route, stream))
+            if latencies is None or len(latencies) < self.hedge_min_samples:
+                return None
+            samples = sorted(latencies)
+        index = min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100.0))
+        return max(self.hedge_min_delay, samples[index])
+
+    def _take_hedge_token(self):
+        with self._lock:
+            if self._hedge_tokens < 1:
+                record_hedge(self.name, "over_budget")
+                return False
+            self._hedge_tokens -= 1
+            return True
+
+    def _record_outcome(self, route, kwargs, success, seconds):
+        if self.breaker is not None:
+            self.breaker.record(success, seconds)
+        if route is not None and success:
+            with self._lock:
+                key = (route, kwargs.get("stream", False))
+                self._latencies.setdefault(key, deque(maxlen=LATENCY_SAMPLES)).append(seconds)
+
+    def _response_size(self, response, stream):
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit():
+            return int(length)
+        # Reading the size of a streamed body would consume it.
+        return None if stream else len(response.content)
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _retry_after(self, response):
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+        return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
@@ -0,0 +1,60 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WarmUp:
+    """Runs start-up tasks in background threads and reports when all of them are done.
+
+    ``tasks`` is a list of ``(name, fn)`` pairs, each run in its own thread.
+    A task that fails is logged and counted as done, so an unreachable
+    dependency cannot keep the service from becoming ready; whatever it would
+    have prepared is then loaded on first use instead.
+    """
+
+    def __init__(self, tasks):
+        self.tasks = list(tasks)
+        self._done = threading.Event()
+        self._started_at = None
+        self.seconds = None
+        self.results = {}
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+    def start(self):
+        self._started_at = time.perf_counter()
+        threading.Thread(target=self._run, name="warm-up", daemon=True).start()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def stats(self):
+        return {"ready": self.ready, "seconds": self.seconds, "tasks": dict(self.results)}
+
+    def _run(self):
+        threads = [
+            threading.Thread(target=self._run_task, args=(name, fn), name=f"warm-up-{name}", daemon=True)
+            for name, fn in self.tasks
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.seconds = round(time.perf_counter() - self._started_at, 3)
+        self._done.set()
+        logger.info("Warm-up finished in %.2fs", self.seconds)
+
+    def _run_task(self, name, fn):
+        start = time.perf_counter()
+        result = {}
+        try:
+            fn()
+        except Exception as e:
+            logger.warning("Warm-up task %s failed: %s", name, e)
+            result["error"] = str(e)
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        self.results[name] = result
@@ -0,0 +1,133 @@
+"""Local news site for exercising article link enrichment.
+
+    python bench/article_fixtures.py --port 8901 --latency 0.2
+
+Paths:
+
+- ``/article/<n>``: an article page with OpenGraph tags;
+- ``/plain/<n>``: a page with only a <title> and a <time> tag;
+- ``/redirect/<n>``: a 301 to ``/article/<n>``;
+- ``/moved/<n>``: a 301 to ``/article/<n>`` by this server's own address,
+  for redirects that leave the host they started on;
+- ``/dead/<n>``: 404;
+- ``/blocked/<n>``: 403, like a site that turns away bots;
+- ``/slow/<n>``: an article page after ``slow_latency`` seconds;
+- ``/report.pdf``: a non-HTML document.
+
+Every response waits ``latency`` seconds first, and ``counts`` tracks how
+many times each kind of path was fetched.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import threading
+import time
+
+ARTICLE_PAGE = """<!doctype html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Article {n} | Fixture News</title>
+<meta property="og:title" content="Apple beats estimates, part {n}">
+<meta property="og:image" content="/images/{n}.jpg">
+<meta property="og:site_name" content="Fixture News">
+<meta property="article:published_time" content="2025-01-{day:02d}T14:30:00Z">
+</head>
+<body>{body}</body>
+</html>
+"""
+
+PLAIN_PAGE = """<!doctype html>
+<html><head><title>Plain article {n}</title></head>
+<body><time datetime="2025-02-{day:02d}">February {day}</time>{body}</body></html>
+"""
+
+# Article bodies are long, as on real news sites, so reading only the head matters.
+BODY = "<p>" + "Shares rose after the company reported earnings. " * 2000 + "</p>"
+
+
+class ArticleFixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        config = self.server.config
+        kind, _, n = self.path.strip("/").partition("/")
+        with self.server.lock:
+            self.server.counts[kind] = self.server.counts.get(kind, 0) + 1
+        if config["latency"]:
+            time.sleep(config["latency"])
+
+        if kind in ("article", "slow"):
+            if kind == "slow":
+                time.sleep(config["slow_latency"])
+            return self.send(200, "text/html; charset=utf-8", ARTICLE_PAGE.format(n=n, day=day(n), body=BODY))
+        if kind == "plain":
+            return self.send(200, "text/html", PLAIN_PAGE.format(n=n, day=day(n), body=BODY))
+        if kind == "redirect":
+            return self.send(301, "text/html", "", {"Location": f"/article/{n}"})
+        if kind == "moved":
+            return self.send(301, "text/html", "", {"Location": f"{self.server.url}/article/{n}"})
+        if kind == "blocked":
+            return self.send(403, "text/html", "<h1>Forbidden</h1>")
+        if kind == "report.pdf":
+            return self.send(200, "application/pdf", "%PDF-1.4")
+        self.send(404, "text/html", "<h1>Not Found</h1>")
+
+    def send(self, status, content_type, text, headers=None):
+        data = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def day(n):
+    return int(n) % 28 + 1 if n.isdigit() else 1
+
+
+class ArticleFixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=0.0, slow_latency=5.0):
+        super().__init__(address, ArticleFixtureHandler)
+        self.config = {"latency": latency, "slow_latency": slow_latency}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Clients drop keep-alive connections they stopped reading halfway.
+        pass
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def articles(self, paths):
+        """Perplexity-style articles linking to ``paths`` on this server."""
+        return [
+            {"title": f"Article at {path}", "summary": "Fixture article.", "link": f"{self.url}{path}"}
+            for path in paths
+        ]
+
+
+def start(port=0, latency=0.0, slow_latency=5.0):
+    server = ArticleFixtureServer(("127.0.0.1", port), latency=latency, slow_latency=slow_latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    args = parser.parse_args()
+    server = ArticleFixtureServer(("127.0.0.1", args.port), latency=args.latency, slow_latency=args.slow_latency)
+    print(f"Serving article fixtures on {server.url}")
+    server.serve_forever()
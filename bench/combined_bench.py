@@ -0,0 +1,71 @@
+"""Compare /getChartAnalysisWithArticles against the two sequential calls it replaces.
+
+    python bench/combined_bench.py --latency 1.0 --chunk-delay 0.01 --runs 5
+
+The client today calls /getChartAnalysis, reads the ticker and then calls
+/getArticles. The combined endpoint should take about as long as the slower
+of the two upstream calls rather than their sum. Without tesseract on the
+host the articles call starts from the model's streamed ticker.
+"""
+import argparse
+import json
+import os
+import time
+
+import requests
+
+import fake_upstreams
+from load_test import make_image, percentile, request_bodies, start_server
+
+
+def sequential(url, body):
+    start = time.perf_counter()
+    chart = requests.post(url + "/getChartAnalysis", json=body, timeout=300)
+    chart.raise_for_status()
+    articles = requests.post(url + "/getArticles", json={"userPrompt": chart.json()["ticker"]}, timeout=300)
+    articles.raise_for_status()
+    return time.perf_counter() - start
+
+
+def combined(url, body):
+    start = time.perf_counter()
+    response = requests.post(url + "/getChartAnalysisWithArticles", json=body, timeout=300)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--chunk-delay", type=float, default=0.01)
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    # Every run should reach Perplexity, so the articles cache is disabled.
+    os.environ["ARTICLES_CACHE_TTL"] = "0"
+    upstream = fake_upstreams.start(latency=args.latency, chunk_delay=args.chunk_delay, chunk_size=args.chunk_size)
+    process, url = start_server("gevent", upstream, workers=1)
+    try:
+        modes = {"sequential": sequential, "combined": combined}
+        samples = {mode: [] for mode in modes}
+        for _ in range(args.runs):
+            for mode, run in modes.items():
+                # A fresh image per call keeps the chart result cache out of the measurement.
+                body = request_bodies(make_image(800, 600))["/getChartAnalysis"]
+                samples[mode].append(run(url, body))
+
+        result = {"upstream_latency": args.latency, "chunk_delay": args.chunk_delay}
+        for mode, values in samples.items():
+            result[mode] = {
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+            }
+        print(json.dumps(result))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Measure conversation sessions on /getResponses with successive chat screenshots.
+
+    python bench/conversation_bench.py --chats 10 --screenshots 5 --latency 1
+
+Each chat is a scripted conversation rendered as a phone screenshot that
+scrolls down a few messages at a time, so consecutive screenshots overlap
+like a user capturing a thread as it grows. Every chat is uploaded once
+without and once with a ``sessionId``. Reports, per upload after the
+first, the bytes sent upstream and the latency, plus how the session
+uploads were sent (``full``, ``incremental`` or ``unchanged``).
+
+Incremental uploads need tesseract; without it every session upload falls
+back to the full screenshot, which the ``modes`` in the report show.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import argparse
+import base64
+import json
+import os
+import uuid
+
+import requests
+from PIL import Image, ImageDraw, ImageFont
+
+import fake_upstreams
+from load_test import percentile, start_server
+
+ENDPOINT = "/getResponses"
+WIDTH, HEIGHT = 750, 1334
+HEADER, FOOTER = 150, 100
+BUBBLE_GAP = 24
+LINES = [
+    "hey! are we still on for friday?", "yes!! where do you want to go", "that new ramen place downtown?",
+    "omg yes I've been wanting to try it", "7:30 work for you?", "perfect, I'll book a table",
+    "should I bring anything", "just yourself haha", "ok see you then", "wait do they take cards",
+    "I think so, I'll check", "they do!", "amazing", "also my friend might join after, is that ok",
+    "sure, the more the merrier", "you're the best", "what are you up to tonight", "just watching a movie",
+    "which one", "the new dune one", "no way, I loved it", "no spoilers!!", "my lips are sealed",
+    "ok it's so good", "told you", "friday can't come soon enough", "same honestly", "goodnight",
+]
+
+
+def render_chat(lines, font):
+    """One tall image of the whole conversation, alternating between the two people."""
+    canvas = Image.new("RGB", (WIDTH, 120 * len(lines)), "white")
+    draw = ImageDraw.Draw(canvas)
+    y = BUBBLE_GAP
+    for i, line in enumerate(lines):
+        mine = i % 2 == 1
+        left, top, right, bottom = draw.textbbox((0, 0), line, font=font)
+        width, height = right - left + 48, bottom - top + 36
+        x = WIDTH - width - 30 if mine else 30
+        draw.rounded_rectangle((x, y, x + width, y + height), radius=28, fill="#0b84ff" if mine else "#e5e5ea")
+        draw.text((x + 24 - left, y + 18 - top), line, font=font, fill="white" if mine else "black")
+        y += height + BUBBLE_GAP
+    return canvas.crop((0, 0, WIDTH, y))
+
+
+def screenshots(chat, name, font, count):
+    """``count`` screenshots scrolling down ``chat`` with overlapping views."""
+    view = HEIGHT - HEADER - FOOTER
+    step = max(1, (chat.height - view) // max(1, count - 1))
+    images = []
+    for i in range(count):
+        top = min(i * step, max(0, chat.height - view))
+        frame = Image.new("RGB", (WIDTH, HEIGHT), "white")
+        frame.paste(chat.crop((0, top, WIDTH, top + view)), (0, HEADER))
+        draw = ImageDraw.Draw(frame)
+        draw.rectangle((0, 0, WIDTH, HEADER), fill="#f6f6f6")
+        draw.text((WIDTH // 2, HEADER // 2), name, font=font, fill="black", anchor="mm")
+        draw.rectangle((0, HEIGHT - FOOTER, WIDTH, HEIGHT), fill="#f6f6f6")
+        buffer = BytesIO()
+        frame.save(buffer, format="PNG")
+        images.append(buffer.getvalue())
+    return images
+
+
+def upload_chat(url, images, session_id):
+    session = requests.Session()
+    samples = []
+    for i, image in enumerate(images):
+        body = {"base64Image": base64.b64encode(image).decode(), "name": "Sam", "description": "Dating app match"}
+        if session_id:
+            body["sessionId"] = session_id
+        response = session.post(url + ENDPOINT, json=body, timeout=120)
+        response.raise_for_status()
+        samples.append((i, response.elapsed.total_seconds()))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--screenshots", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=1.0)
+    args = parser.parse_args()
+
+    font = ImageFont.load_default(size=30)
+    images = screenshots(render_chat(LINES, font), "Sam", font, args.screenshots)
+    os.environ["CHART_CACHE_SIZE"] = "0"
+    upstream = fake_upstreams.start(latency=args.latency)
+    process, url = start_server("gevent", upstream, workers=1)
+    try:
+        for mode in ("image", "session"):
+            bytes_before = upstream.counts["post_bytes"]
+            posts_before = upstream.counts["post"]
+            with ThreadPoolExecutor(max_workers=args.chats) as executor:
+                chats = list(executor.map(
+                    lambda chat: upload_chat(url, images, uuid.uuid4().hex if mode == "session" else None),
+                    range(args.chats),
+                ))
+            followups = [seconds for samples in chats for i, seconds in samples if i > 0]
+            stats = requests.get(url + "/stats", timeout=5).json()["conversations"]
+            result = {
+                "mode": mode,
+                "uploads": args.chats * args.screenshots,
+                "upstream_calls": upstream.counts["post"] - posts_before,
+                "upstream_kb_per_upload": round(
+                    (upstream.counts["post_bytes"] - bytes_before) / (args.chats * args.screenshots) / 1024, 1,
+                ),
+                "followup_p50_ms": round(percentile(followups, 50) * 1000, 1),
+                "followup_p95_ms": round(percentile(followups, 95) * 1000, 1),
+            }
+            if mode == "session":
+                result.update({"modes": stats["modes"], "ocr": stats["ocr"]})
+            print(json.dumps(result))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Offline evaluation and benchmark of the local chart pre-filter.
+
+    python bench/eval_chart_filter.py samples/
+    python bench/eval_chart_filter.py samples/ --synthesize 40
+
+``samples/`` holds images in ``chart/`` and ``not_chart/`` subfolders. With
+``--synthesize N`` the folder is first filled with N generated images per
+class, which is only meant as a smoke test of the harness itself.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "api"))
+
+from chart_filter import ChartFilter  # noqa: E402
+from load_test import percentile  # noqa: E402
+
+LABELS = {"chart": True, "not_chart": False}
+EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+def synthetic_chart(width=1170, height=900):
+    dark = random.random() < 0.5
+    image = Image.new("RGB", (width, height), (19, 23, 34) if dark else (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    grid = (42, 46, 57) if dark else (230, 230, 230)
+    for y in range(60, height - 60, random.randint(70, 120)):
+        draw.line([(0, y), (width - 110, y)], fill=grid, width=1)
+        draw.text((width - 100, y - 6), f"{random.uniform(50, 500):.2f}", fill=(180, 180, 180))
+
+    price = height / 2
+    step = random.randint(10, 22)
+    for x in range(20, width - 130, step):
+        close = min(height - 80, max(80, price + random.gauss(0, 18)))
+        high, low = min(price, close) - random.uniform(2, 25), max(price, close) + random.uniform(2, 25)
+        color = (38, 166, 154) if close < price else (239, 83, 80)
+        draw.line([(x + step // 3, high), (x + step // 3, low)], fill=color, width=1)
+        draw.rectangle([x, min(price, close), x + 2 * step // 3, max(price, close) + 1], fill=color)
+        price = close
+    return image
+
+
+def synthetic_other(width=1170, height=2000):
+    kind = random.choice(["chat", "noise", "shapes"])
+    if kind == "noise":
+        return Image.effect_noise((width, height), random.randint(20, 90)).convert("RGB")
+
+    image = Image.new("RGB", (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    if kind == "chat":
+        y = 40
+        while y < height - 120:
+            left = random.random() < 0.5
+            bubble_width = random.randint(300, 800)
+            x0 = 30 if left else width - 30 - bubble_width
+            draw.rounded_rectangle([x0, y, x0 + bubble_width, y + 90], 30, fill=(233, 233, 235) if left else (10, 132, 255))
+            draw.text((x0 + 25, y + 35), "hey what are you up to this weekend?", fill=(0, 0, 0) if left else (255, 255, 255))
+            y += random.randint(110, 180)
+    else:
+        for _ in range(12):
+            x, y = random.randint(0, width), random.randint(0, height)
+            fill = tuple(random.randint(0, 255) for _ in range(3))
+            draw.ellipse([x, y, x + random.randint(50, 400), y + random.randint(50, 400)], fill=fill)
+    return image
+
+
+def synthesize(folder, count):
+    for label, make in (("chart", synthetic_chart), ("not_chart", synthetic_other)):
+        os.makedirs(os.path.join(folder, label), exist_ok=True)
+        for i in range(count):
+            make().save(os.path.join(folder, label, f"synthetic_{i:03d}.jpg"), quality=90)
+
+
+def load_samples(folder):
+    samples = []
+    for label, is_chart in LABELS.items():
+        directory = os.path.join(folder, label)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if name.lower().endswith(EXTENSIONS):
+                with open(os.path.join(directory, name), "rb") as f:
+                    samples.append((os.path.join(label, name), is_chart, f.read()))
+    return samples
+
+
+def evaluate(scores, threshold):
+    tp = sum(1 for s in scores if s["label"] and s["confidence"] >= threshold)
+    fn = sum(1 for s in scores if s["label"] and s["confidence"] < threshold)
+    tn = sum(1 for s in scores if not s["label"] and s["confidence"] < threshold)
+    fp = sum(1 for s in scores if not s["label"] and s["confidence"] >= threshold)
+    return {
+        "threshold": threshold,
+        "accuracy": round((tp + tn) / len(scores), 3),
+        # A false reject costs a real user their analysis, so chart recall is the number to watch.
+        "chart_recall": round(tp / (tp + fn), 3) if tp + fn else None,
+        "non_chart_rejected": round(tn / (tn + fp), 3) if tn + fp else None,
+        "false_rejects": fn,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder")
+    parser.add_argument("--synthesize", type=int, default=0)
+    parser.add_argument("--no-ocr", action="store_true")
+    parser.add_argument("--thresholds", default="0.1,0.2,0.3,0.5")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.synthesize:
+        synthesize(args.folder, args.synthesize)
+
+    samples = load_samples(args.folder)
+    if not samples:
+        sys.exit(f"No images found under {args.folder}/chart or {args.folder}/not_chart")
+
+    chart_filter = ChartFilter(mode="shadow", ocr=not args.no_ocr)
+    scores = []
+    for name, is_chart, data in samples:
+        score = chart_filter.score(data)
+        scores.append({"name": name, "label": is_chart, "confidence": score.confidence, "elapsed": score.elapsed})
+        if args.verbose:
+            print(json.dumps({"name": name, "label": is_chart, "confidence": round(score.confidence, 3),
+                              "features": score.features}), file=sys.stderr)
+
+    latencies = [s["elapsed"] for s in scores]
+    print(json.dumps({
+        "images": len(scores),
+        "charts": sum(1 for s in scores if s["label"]),
+        "ocr": chart_filter.ocr,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "max": round(max(latencies) * 1000, 2),
+        },
+        "results": [evaluate(scores, float(t)) for t in args.thresholds.split(",")],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""Local stand-ins for OpenAI, Perplexity and the GCS prompt bucket.
+
+Run directly to serve all three on one port:
+
+    python bench/fake_upstreams.py --port 8900 --latency 0.5 --jitter 0.3 --error-rate 0.02
+
+and point the API at it with
+
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1/chat/completions
+    PERPLEXITY_BASE_URL=http://127.0.0.1:8900/chat/completions
+    STORAGE_EMULATOR_HOST=http://127.0.0.1:8900
+"""
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+import argparse
+import json
+import random
+import threading
+import time
+
+CHART_RESULT = {
+    "status": True,
+    "result": {
+        "ticker": "AAPL",
+        "features": {
+            "generalTrends": {
+                "trendDirection": "up",
+                "trendStrength": "moderate",
+                "volume": "medium",
+                "volatility": "low",
+                "analysis": "AAPL is trading at 189.20 in a steady uptrend.",
+            },
+            "supportResistance": {
+                "supportLevels": ["185.00"],
+                "resistanceLevels": ["192.50"],
+                "analysis": "Support at 185 has held twice.",
+            },
+            "candlestickPatterns": {"recognizedPatterns": []},
+            "indicatorAnalyses": {"selectedIndicators": []},
+            "futureMarketPrediction": {"timeHorizon": "short_term", "analysis": "Likely to retest 192.50."},
+            "potentialTradeSetup": {
+                "entryTargetPrice": "186.00",
+                "stopLossPrice": "183.90",
+                "analysis": "Buy the pullback into support.",
+            },
+        },
+    },
+}
+
+RIZZ_RESULT = {
+    "responses": [
+        {"text": "Dinner Friday?", "category": "rizz"},
+        {"text": "You up?", "category": "nsfw"},
+        {"text": "I've been thinking about you.", "category": "romantic"},
+        {"text": "This isn't working for me.", "category": "end it"},
+    ],
+    "interestLevel": 6,
+    "breakdown": "Mixed effort but consistent replies.",
+    "redFlags": "Slow replies on weekends.",
+    "greenFlags": "Asks follow-up questions.",
+}
+
+ARTICLES_RESULT = {
+    "articles": [
+        {"title": "Apple beats estimates", "summary": "Earnings support the uptrend.", "link": "https://example.com/a"},
+    ]
+}
+
+BATCH_SUMMARY_RESULT = {
+    "trendAlignment": "aligned",
+    "analysis": "Both timeframes show an uptrend with support near 185.",
+}
+
+RESULTS_BY_SCHEMA = {
+    "chart_analysis": CHART_RESULT,
+    "decode_situationship": RIZZ_RESULT,
+    "chart_batch_summary": BATCH_SUMMARY_RESULT,
+}
+
+PROMPTS = {
+    "openai_prompt.txt": "Analyze the chart.",
+    "perplexity_prompt.txt": "Find recent news for the ticker.",
+    "rizz_prompt.txt": "Decode the situationship.",
+}
+
+
+def completion(content, usage=None):
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": usage or {"prompt_tokens": 1000, "completion_tokens": 500, "total_tokens": 1500},
+    }
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        config = self.server.config
+        with self.server.lock:
+            self.server.counts["post"] += 1
+            self.server.counts["post_bytes"] += len(body)
+
+        payload = json.loads(body or b"{}")
+        allowed, self.rate_limit_headers = self.server.take_request()
+        if not allowed:
+            retry_after = {"Retry-After": self.rate_limit_headers["x-ratelimit-reset-requests"].rstrip("s")}
+            return self.send_json(429, {"error": {"message": "Rate limit reached for requests"}}, retry_after)
+
+        if self.path.startswith("/v1/chat/completions"):
+            schema_name = payload.get("response_format", {}).get("json_schema", {}).get("name")
+            result = RESULTS_BY_SCHEMA.get(schema_name, RIZZ_RESULT)
+        else:
+            result = {"articles": config["articles"]} if config["articles"] is not None else ARTICLES_RESULT
+
+        # The model "generates" chunk_size characters every chunk_delay seconds
+        # after an initial latency, whether or not the caller streams.
+        content = json.dumps(result, indent=2)
+        size = config["chunk_size"]
+        chunks = [content[i:i + size] for i in range(0, len(content), size)]
+        if config["latency"]:
+            time.sleep(config["latency"] * random.uniform(1 - config["jitter"], 1 + config["jitter"]))
+        if config["straggler_rate"] and random.random() < config["straggler_rate"]:
+            with self.server.lock:
+                self.server.counts["stragglers"] += 1
+            time.sleep(config["straggler_latency"])
+
+        if config["error_rate"] and random.random() < config["error_rate"]:
+            with self.server.lock:
+                self.server.counts["errors"] += 1
+            headers = {"Retry-After": config["retry_after"]} if config["retry_after"] is not None else {}
+            return self.send_json(config["error_status"], {"error": {"message": "Injected failure"}}, headers)
+
+        if payload.get("stream"):
+            return self.send_stream(chunks, config["chunk_delay"])
+
+        if config["chunk_delay"]:
+            time.sleep(config["chunk_delay"] * len(chunks))
+        self.send_json(200, completion(content))
+
+    def do_HEAD(self):
+        # Clients open connections ahead of time with a HEAD to the endpoint.
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        # Minimal subset of the GCS JSON API used by google-cloud-storage.
+        if self.server.config["gcs_latency"]:
+            time.sleep(self.server.config["gcs_latency"])
+        with self.server.lock:
+            self.server.counts["get"] += 1
+        path = urlparse(self.path).path
+        parts = path.split("/o/", 1)
+        name = unquote(parts[1]) if len(parts) == 2 else None
+        if name not in PROMPTS:
+            return self.send_json(404, {"error": {"code": 404, "message": "Not Found"}})
+
+        if path.startswith("/download/") or "alt=media" in self.path:
+            data = PROMPTS[name].encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("X-Goog-Generation", "1")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        self.send_json(200, {
+            "kind": "storage#object",
+            "name": name,
+            "bucket": "gen_ai_prompts",
+            "generation": "1",
+            "metageneration": "1",
+            "etag": "CAE=",
+            "size": str(len(PROMPTS[name])),
+        })
+
+    def send_stream(self, chunks, delay):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in getattr(self, "rate_limit_headers", {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        for chunk in chunks:
+            if delay:
+                time.sleep(delay)
+            event = {"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": chunk}}]}
+            self.write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+        usage = {"object": "chat.completion.chunk", "choices": [], "usage": completion("")["usage"]}
+        self.write_chunk(f"data: {json.dumps(usage)}\n\n".encode())
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.write_chunk(b"")
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def send_json(self, status, obj, headers=None):
+        data = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in dict(getattr(self, "rate_limit_headers", {}), **(headers or {})).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=0.0, chunk_delay=0.0, chunk_size=16, jitter=0.0, error_rate=0.0,
+                 error_status=503, retry_after=None, gcs_latency=0.0, rpm_limit=0, straggler_rate=0.0,
+                 straggler_latency=5.0, articles=None):
+        super().__init__(address, FakeUpstreamHandler)
+        self.config = {
+            "latency": latency,
+            "chunk_delay": chunk_delay,
+            "chunk_size": chunk_size,
+            # Each latency is drawn uniformly from latency * (1 +/- jitter).
+            "jitter": jitter,
+            # This share of requests is held up for another straggler_latency seconds.
+            "straggler_rate": straggler_rate,
+            "straggler_latency": straggler_latency,
+            "error_rate": error_rate,
+            "error_status": error_status,
+            "retry_after": retry_after,
+            "gcs_latency": gcs_latency,
+            # Requests per rolling minute before answering 429, like OpenAI; 0 is unlimited.
+            "rpm_limit": rpm_limit,
+            # Articles Perplexity "finds", e.g. links into article_fixtures; None for ARTICLES_RESULT.
+            "articles": articles,
+        }
+        self.counts = {"post": 0, "post_bytes": 0, "get": 0, "errors": 0, "throttled": 0, "stragglers": 0}
+        self.lock = threading.Lock()
+        self.recent = deque()
+
+    def take_request(self):
+        """Applies ``rpm_limit``; returns whether the request is allowed and x-ratelimit-* headers."""
+        limit = self.config["rpm_limit"]
+        if not limit:
+            return True, {}
+        now = time.monotonic()
+        with self.lock:
+            while self.recent and self.recent[0] <= now - 60:
+                self.recent.popleft()
+            allowed = len(self.recent) < limit
+            if allowed:
+                self.recent.append(now)
+            else:
+                self.counts["throttled"] += 1
+            reset = self.recent[0] + 60 - now if len(self.recent) >= limit else 0.0
+            remaining = limit - len(self.recent)
+        return allowed, {
+            "x-ratelimit-limit-requests": str(limit),
+            "x-ratelimit-remaining-requests": str(remaining),
+            "x-ratelimit-reset-requests": f"{reset:.3f}s",
+        }
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def env(self):
+        return {
+            "OPENAI_BASE_URL": f"{self.url}/v1/chat/completions",
+            "PERPLEXITY_BASE_URL": f"{self.url}/chat/completions",
+            "STORAGE_EMULATOR_HOST": self.url,
+            "CANDLESTICK_OPENAI_API_KEY": "fake",
+            "RIZZ_OPENAI_API_KEY": "fake",
+            "PERPLEXITY_API_KEY": "fake",
+        }
+
+
+def start(port=0, latency=0.0, chunk_delay=0.0, chunk_size=16, **config):
+    server = FakeUpstreamServer(
+        ("127.0.0.1", port), latency=latency, chunk_delay=chunk_delay, chunk_size=chunk_size, **config,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after")
+    parser.add_argument("--gcs-latency", type=float, default=0.0)
+    parser.add_argument("--rpm-limit", type=int, default=0)
+    parser.add_argument("--straggler-rate", type=float, default=0.0)
+    parser.add_argument("--straggler-latency", type=float, default=5.0)
+    args = parser.parse_args()
+    server = FakeUpstreamServer(
+        ("127.0.0.1", args.port), latency=args.latency, chunk_delay=args.chunk_delay, chunk_size=args.chunk_size,
+        jitter=args.jitter, error_rate=args.error_rate, error_status=args.error_status,
+        retry_after=args.retry_after, gcs_latency=args.gcs_latency, rpm_limit=args.rpm_limit,
+        straggler_rate=args.straggler_rate, straggler_latency=args.straggler_latency,
+    )
+    print(f"Serving fake upstreams on {server.url}")
+    server.serve_forever()
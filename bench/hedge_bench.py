@@ -0,0 +1,96 @@
+"""Measure hedged upstream requests and the circuit breaker.
+
+    python bench/hedge_bench.py --requests 300 --straggler-rate 0.05
+
+Hedging: the same requests run against a gunicorn server with hedging off
+and on, while the fake upstream holds up ``--straggler-rate`` of requests
+for ``--straggler-latency`` seconds. Reports latency percentiles and how
+many extra upstream calls the hedges cost.
+
+Breaker: the fake upstream fails every request and the time the API takes
+to answer is measured before and after the breaker opens.
+"""
+import argparse
+import json
+import os
+import time
+
+import requests
+
+import fake_upstreams
+from load_test import make_image, percentile, request_bodies, run_load, start_server
+
+ENDPOINT = "/getResponses"
+
+
+def hedging(args, body):
+    upstream = fake_upstreams.start(
+        latency=args.latency, jitter=args.jitter,
+        straggler_rate=args.straggler_rate, straggler_latency=args.straggler_latency,
+    )
+    for percentile_setting in ("0", str(args.hedge_percentile)):
+        os.environ["UPSTREAM_HEDGE_PERCENTILE"] = percentile_setting
+        process, url = start_server("gevent", upstream, workers=1)
+        try:
+            # Enough calls for the client to learn the latency distribution.
+            run_load(url, ENDPOINT, body, args.concurrency, 40)
+            posts_before = upstream.counts["post"]
+            result = run_load(url, ENDPOINT, body, args.concurrency, args.requests)
+            stats = requests.get(url + "/stats", timeout=5).json()["upstreams"]["openai"]
+            result.update({
+                "hedging": percentile_setting != "0",
+                "upstream_calls_per_request": round((upstream.counts["post"] - posts_before) / args.requests, 3),
+                "hedges": stats["hedges"],
+                "hedges_won": stats["hedges_won"],
+            })
+            print(json.dumps(result))
+        finally:
+            process.terminate()
+            process.wait()
+    os.environ.pop("UPSTREAM_HEDGE_PERCENTILE")
+
+
+def breaker(args, body):
+    upstream = fake_upstreams.start(latency=args.latency, error_rate=1.0, error_status=503)
+    os.environ.update({"UPSTREAM_MAX_RETRIES": "0", "UPSTREAM_BREAKER_MIN_CALLS": "10"})
+    process, url = start_server("gevent", upstream, workers=1)
+    try:
+        session = requests.Session()
+        latencies = {}
+        for _ in range(30):
+            start = time.perf_counter()
+            status = session.post(url + ENDPOINT, json=body, timeout=60).status_code
+            latencies.setdefault(status, []).append(time.perf_counter() - start)
+        stats = requests.get(url + "/stats", timeout=5).json()["upstreams"]["openai"]
+        print(json.dumps({
+            "breaker": stats["breaker"],
+            "upstream_calls": upstream.counts["post"],
+            "by_status": {
+                status: {"count": len(values), "p50_ms": round(percentile(values, 50) * 1000, 1)}
+                for status, values in latencies.items()
+            },
+        }))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--straggler-rate", type=float, default=0.05)
+    parser.add_argument("--straggler-latency", type=float, default=3.0)
+    parser.add_argument("--hedge-percentile", type=float, default=95)
+    args = parser.parse_args()
+
+    os.environ["UPSTREAM_HEDGE_MIN_DELAY"] = "0.1"
+    body = request_bodies(make_image(400, 300))[ENDPOINT]
+    hedging(args, body)
+    breaker(args, body)
+
+
+if __name__ == "__main__":
+    main()
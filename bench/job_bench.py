@@ -0,0 +1,106 @@
+"""Compare synchronous analysis with the job API when clients drop connections.
+
+    python bench/job_bench.py --requests 50 --latency 2 --drop-after 1
+
+Every client loses its first connection after ``--drop-after`` seconds and
+then retries, like a phone switching networks mid-request. Synchronous
+clients simply repeat the request; job clients resubmit with the same
+Idempotency-Key and poll. Reports upstream calls per result (what we pay
+OpenAI for), time until the client has its result, and how long a submit
+holds a web worker.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import tempfile
+import time
+import uuid
+
+import requests
+
+import fake_upstreams
+from load_test import make_image, percentile, request_bodies, start_server
+
+ENDPOINT = "/getChartAnalysis"
+
+
+def synchronous(url, body, drop_after):
+    start = time.perf_counter()
+    try:
+        requests.post(url + ENDPOINT, json=body, timeout=(5, drop_after)).raise_for_status()
+    except requests.Timeout:
+        requests.post(url + ENDPOINT, json=body, timeout=300).raise_for_status()
+    return {"result": time.perf_counter() - start}
+
+
+def job(url, body, drop_after, poll_interval):
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+    start = time.perf_counter()
+    try:
+        requests.post(url + "/jobs/getChartAnalysis", json=body, headers=headers, timeout=(5, drop_after))
+    except requests.Timeout:
+        pass
+    submit = time.perf_counter() - start
+    # A submit is short enough to rarely be cut off, but the client resubmits
+    # as if it had been; with the same key it gets the job it already created.
+    response = requests.post(url + "/jobs/getChartAnalysis", json=body, headers=headers, timeout=300)
+    response.raise_for_status()
+    location = response.headers["Location"]
+    while True:
+        status = requests.get(url + location, timeout=30).json()
+        if "result" in status:
+            return {"result": time.perf_counter() - start, "submit": submit}
+        time.sleep(poll_interval)
+
+
+def summarize(samples, key):
+    values = [sample[key] for sample in samples]
+    return {f"{key}_p50_ms": round(percentile(values, 50) * 1000, 1), f"{key}_p95_ms": round(percentile(values, 95) * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--drop-after", type=float, default=1.0)
+    parser.add_argument("--poll-interval", type=float, default=0.25)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    os.environ.update({
+        "CHART_CACHE_SIZE": "0",
+        "JOB_QUEUE_PATH": os.path.join(tempfile.mkdtemp(), "jobs.sqlite3"),
+        "JOB_WORKERS": str(args.concurrency),
+    })
+    upstream = fake_upstreams.start(latency=args.latency)
+    body = request_bodies(make_image(800, 600))[ENDPOINT]
+    process, url = start_server("gevent", upstream, args.workers)
+    try:
+        for mode in ("sync", "job"):
+            if mode == "sync":
+                run = lambda _: synchronous(url, body, args.drop_after)  # noqa: E731
+            else:
+                run = lambda _: job(url, body, args.drop_after, args.poll_interval)  # noqa: E731
+            posts_before = upstream.counts["post"]
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                samples = list(executor.map(run, range(args.requests)))
+            # Abandoned synchronous requests still reach the upstream after the client gave up.
+            time.sleep(args.latency + 1)
+            result = {
+                "mode": mode,
+                "requests": args.requests,
+                "upstream_calls_per_result": round((upstream.counts["post"] - posts_before) / args.requests, 3),
+            }
+            result.update(summarize(samples, "result"))
+            if mode == "job":
+                result.update(summarize(samples, "submit"))
+            print(json.dumps(result))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Measure article link enrichment against a local news site.
+
+    python bench/link_bench.py --requests 40 --page-latency 0.2 [--slow-link]
+
+Perplexity (fake_upstreams) answers every prompt with the same links into
+``article_fixtures``: live articles, a redirect and a dead link, plus with
+``--slow-link`` a page slower than the enrichment deadline. Every request
+uses a new prompt, so the articles cache never hits and only the per-URL
+link cache can help, as when many tickers share the same popular stories.
+
+For each mode this reports latency percentiles, how many articles came
+back and how many pages the API fetched from the news site:
+
+- ``off``: links are returned unchecked;
+- ``sequential``: enrichment with a pool of one connection;
+- ``concurrent``: enrichment with the default pool.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+
+import requests
+
+import article_fixtures
+import fake_upstreams
+from load_test import percentile, start_server
+
+ENDPOINT = "/getArticles"
+PATHS = ["/article/1", "/article/2", "/article/3", "/article/4", "/plain/5", "/redirect/6", "/dead/7"]
+MODES = {
+    "off": {"ARTICLE_LINKS_ENRICH": "0"},
+    "sequential": {"ARTICLE_LINKS_ENRICH": "1", "ARTICLE_LINKS_POOL_SIZE": "1"},
+    "concurrent": {"ARTICLE_LINKS_ENRICH": "1", "ARTICLE_LINKS_POOL_SIZE": "16"},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--page-latency", type=float, default=0.2)
+    parser.add_argument("--deadline", type=float, default=2.0)
+    parser.add_argument("--slow-link", action="store_true")
+    args = parser.parse_args()
+    paths = PATHS + ["/slow/8"] if args.slow_link else PATHS
+
+    site = article_fixtures.start(latency=args.page_latency, slow_latency=args.deadline * 3)
+    upstream = fake_upstreams.start(articles=site.articles(paths))
+    os.environ.update({"ARTICLE_LINKS_ALLOW_PRIVATE": "1", "ARTICLE_LINKS_DEADLINE": str(args.deadline)})
+
+    for mode, env in MODES.items():
+        os.environ.update(env)
+        site.counts.clear()
+        process, url = start_server("gevent", upstream, workers=1)
+        try:
+            session = requests.Session()
+
+            def one(i):
+                response = session.post(url + ENDPOINT, json={"userPrompt": f"TICKER{i}"}, timeout=60)
+                response.raise_for_status()
+                return response.elapsed.total_seconds(), len(response.json()["articles"])
+
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                samples = list(executor.map(one, range(args.requests)))
+            latencies = [seconds for seconds, _ in samples]
+            print(json.dumps({
+                "mode": mode,
+                "requests": args.requests,
+                "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+                "max_ms": round(max(latencies) * 1000, 1),
+                "articles_returned": sorted({count for _, count in samples}),
+                "page_fetches": sum(site.counts.values()),
+                "links": len(paths),
+            }))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
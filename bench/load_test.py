@@ -0,0 +1,154 @@
+"""Drive the API against stubbed upstreams and report throughput/latency.
+
+    python bench/load_test.py --server sync --server gevent --concurrency 200
+
+Each ``--server`` is started as a gunicorn process with the matching worker
+class, pointed at ``fake_upstreams`` and hit with the same request mix.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import argparse
+import base64
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+from PIL import Image
+
+import fake_upstreams
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "api")
+
+SERVERS = {
+    "sync": {"WEB_WORKER_CLASS": "sync"},
+    "gthread": {"WEB_WORKER_CLASS": "gthread", "WEB_THREADS": "16"},
+    "gevent": {"WEB_WORKER_CLASS": "gevent"},
+}
+
+
+def make_image(width=1170, height=2532, quality=90):
+    image = Image.effect_noise((width, height), 64).convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def request_bodies(image_bytes):
+    base64_image = base64.b64encode(image_bytes).decode()
+    return {
+        "/getChartAnalysis": {"base64Image": base64_image, "tradingStyles": ["Swing"], "risk": "Medium"},
+        "/getResponses": {"base64Image": base64_image, "name": "Sam", "description": "Met at a party"},
+        "/getArticles": {"userPrompt": "AAPL"},
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind, upstream, workers):
+    port = free_port()
+    env = dict(os.environ)
+    env.update(upstream.env())
+    env.update(SERVERS[kind])
+    env.update({"PORT": str(port), "WEB_CONCURRENCY": str(workers)})
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:app", "--access-logfile", "/dev/null"],
+        cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f"{url}/stats", timeout=1)
+            return process, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{kind} server did not start")
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def run_load(url, endpoint, body, concurrency, total):
+    local = threading.local()
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            ok = session.post(url + endpoint, json=body, timeout=300).status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - start
+
+    return {
+        "requests": total,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(total / wall, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", action="append", choices=sorted(SERVERS))
+    parser.add_argument("--endpoint", default="/getArticles", choices=["/getChartAnalysis", "/getResponses", "/getArticles"])
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=1.0, help="fake upstream latency in seconds")
+    args = parser.parse_args()
+
+    upstream = fake_upstreams.start(latency=args.latency)
+    body = request_bodies(make_image())[args.endpoint]
+
+    for kind in args.server or ["sync", "gevent"]:
+        process, url = start_server(kind, upstream, args.workers)
+        try:
+            result = run_load(url, args.endpoint, body, args.concurrency, args.requests)
+        finally:
+            process.terminate()
+            process.wait()
+        result.update({
+            "server": kind,
+            "workers": args.workers,
+            "endpoint": args.endpoint,
+            "concurrency": args.concurrency,
+            "upstream_latency": args.latency,
+        })
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
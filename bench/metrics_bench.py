@@ -0,0 +1,79 @@
+"""Measure the cost of the per-stage metrics and request-ID middleware.
+
+    python bench/metrics_bench.py --requests 300
+
+Runs the same sequential requests against a gunicorn server with
+METRICS_ENABLED=0 and =1 (fake upstreams with no latency, so app overhead is
+all there is to measure), and times a bare ``stage()`` span in-process.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import requests
+
+import fake_upstreams
+from load_test import API_DIR, make_image, percentile, request_bodies, start_server
+
+ENDPOINTS = ["/getArticles", "/getResponses"]
+
+
+def span_cost(iterations):
+    sys.path.insert(0, API_DIR)
+    import metrics
+
+    def run():
+        start = time.perf_counter()
+        for _ in range(iterations):
+            with metrics.stage("bench"):
+                pass
+        return (time.perf_counter() - start) / iterations
+
+    metrics.ENABLED = False
+    disabled = run()
+    metrics.ENABLED = True
+    enabled = run()
+    return {"disabled_us": round(disabled * 1e6, 2), "enabled_us": round(enabled * 1e6, 2)}
+
+
+def measure(url, endpoint, body, total):
+    session = requests.Session()
+    latencies = []
+    for _ in range(total):
+        start = time.perf_counter()
+        session.post(url + endpoint, json=body, timeout=60).raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--span-iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    print(json.dumps({"stage_span": span_cost(args.span_iterations)}))
+
+    upstream = fake_upstreams.start()
+    bodies = request_bodies(make_image(400, 300))
+    for enabled in ("0", "1"):
+        os.environ["METRICS_ENABLED"] = enabled
+        process, url = start_server("gevent", upstream, workers=1)
+        try:
+            for endpoint in ENDPOINTS:
+                measure(url, endpoint, bodies[endpoint], 20)
+                result = measure(url, endpoint, bodies[endpoint], args.requests)
+                print(json.dumps(dict(result, endpoint=endpoint, metrics_enabled=enabled == "1")))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Per-request CPU time and peak allocation of building an upstream body.
+
+    python bench/payload_bench.py --image-mb 5
+
+"before" rebuilds the payload dict with an f-string data URL and serializes
+it the way ``requests.post(json=...)`` does; "after" renders the pre-built
+``PayloadTemplate`` used by the API.
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "api"))
+
+from images import NormalizedImage  # noqa: E402
+from payloads import PayloadTemplate, slot  # noqa: E402
+
+RESPONSE_FORMAT = {"type": "json_schema", "json_schema": {"name": "bench", "schema": {"type": "object"}}}
+PROMPT = "User trading style(s): Swing. User risk preference: Medium.\n\n" + "Analyze the chart. " * 200
+
+
+def before(image):
+    payload = {
+        "model": "gpt-5-mini-2025-08-07",
+        "messages": [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": PROMPT},
+                {"type": "image_url", "image_url": {
+                    "url": f"data:{image.mime_type};base64,{base64.b64encode(image.data).decode('ascii')}",
+                    "detail": image.detail,
+                }},
+            ],
+        }],
+        "response_format": RESPONSE_FORMAT,
+    }
+    return json.dumps(payload, allow_nan=False).encode("utf-8")
+
+
+TEMPLATE = PayloadTemplate({
+    "model": "gpt-5-mini-2025-08-07",
+    "messages": [{
+        "role": "user",
+        "content": [
+            {"type": "text", "text": slot("prompt")},
+            {"type": "image_url", "image_url": {"url": slot("image"), "detail": slot("detail")}},
+        ],
+    }],
+    "response_format": RESPONSE_FORMAT,
+})
+
+
+def after(image):
+    return TEMPLATE.render(prompt=PROMPT, image=image, detail=image.detail)
+
+
+def measure(build, image, iterations):
+    assert json.loads(before(image)) == json.loads(after(image))
+    start = time.process_time()
+    for _ in range(iterations):
+        build(image)
+    cpu_ms = (time.process_time() - start) / iterations * 1000
+
+    tracemalloc.start()
+    build(image)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"cpu_ms": round(cpu_ms, 2), "peak_alloc_mb": round(peak / 2 ** 20, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image-mb", type=float, default=5.0)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    data = os.urandom(int(args.image_mb * 2 ** 20))
+    image = NormalizedImage(data, "image/jpeg", "high", 0, 0, len(data), 0, 0)
+    print(json.dumps({
+        "image_mb": args.image_mb,
+        "before": measure(before, image, args.iterations),
+        "after": measure(after, image, args.iterations),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Measure latency-aware routing across several OpenAI-compatible upstreams.
+
+    python bench/routing_bench.py --requests 200 --concurrency 8
+
+Starts one fake OpenAI per member, each with its own latency profile:
+
+- ``primary``: the default endpoint, having a slow day (``--slow`` seconds);
+- ``fallback``: a second key and model on a fast endpoint (``--fast`` seconds);
+- ``flaky``: fast, but fails ``--flaky-error-rate`` of its calls with a 503.
+
+``single`` sends /getResponses through ``primary`` only, as with one
+endpoint; ``pool`` configures all three with RIZZ_UPSTREAMS. For each this
+reports latency percentiles and, from /stats, how many requests each member
+served, its EWMA latency and whether it ended up ejected.
+"""
+import argparse
+import json
+import os
+
+import requests
+
+import fake_upstreams
+from load_test import make_image, request_bodies, run_load, start_server
+
+ENDPOINT = "/getResponses"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--slow", type=float, default=1.2)
+    parser.add_argument("--fast", type=float, default=0.3)
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--flaky-error-rate", type=float, default=0.5)
+    parser.add_argument("--probe-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    members = {
+        "primary": fake_upstreams.start(latency=args.slow, jitter=args.jitter),
+        "fallback": fake_upstreams.start(latency=args.fast, jitter=args.jitter),
+        "flaky": fake_upstreams.start(latency=args.fast, jitter=args.jitter, error_rate=args.flaky_error_rate),
+    }
+    # Token limits are off so the comparison is about latency, not the extra keys' quota.
+    pools = {
+        "single": [{"name": "primary", "tpm": 0}],
+        "pool": [
+            {"name": "primary", "tpm": 0},
+            {
+                "name": "fallback", "url": f"{members['fallback'].url}/v1/chat/completions", "model": "gpt-4.1-mini",
+                "tpm": 0,
+            },
+            {"name": "flaky", "url": f"{members['flaky'].url}/v1/chat/completions", "tpm": 0},
+        ],
+    }
+    body = request_bodies(make_image(750, 1334))[ENDPOINT]
+    os.environ["UPSTREAM_PROBE_SECONDS"] = str(args.probe_seconds)
+
+    for mode, config in pools.items():
+        os.environ["RIZZ_UPSTREAMS"] = json.dumps(config)
+        for server in members.values():
+            server.counts.update(post=0, errors=0)
+        # primary also serves Perplexity and the prompt bucket, so it is the base upstream.
+        process, url = start_server("gevent", members["primary"], workers=1)
+        try:
+            result = run_load(url, ENDPOINT, body, args.concurrency, args.requests)
+            routing = requests.get(url + "/stats", timeout=5).json()["routing"]["rizz"]
+        finally:
+            process.terminate()
+            process.wait()
+        result["mode"] = mode
+        result["members"] = {
+            name: {
+                "routed": stats["routed"],
+                "ewma_ms": stats["ewma_ms"],
+                "ejected": stats["ejected"],
+                "failovers": stats["failovers"],
+                "upstream_errors": members[name].counts["errors"],
+            }
+            for name, stats in routing.items()
+        }
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Measure how a locked SQLite database affects a gevent worker.
+
+    python bench/sqlite_stall_bench.py --hold 6
+
+The job queue and the chart cache live in SQLite files shared by every
+worker process on the host. This bench plays another process holding the
+write lock on one of them for ``--hold`` seconds, while a client samples
+GET /ready (which touches neither database) every 20 ms:
+
+- ``queue``: the lock is on the job queue, which the job workers poll;
+- ``cache``: the lock is on the chart cache while chart analyses finish
+  and store their verdicts.
+
+Reports /ready latency while the lock is held. If SQLite's busy wait ran
+on the event loop, every request of the worker would stall with it.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import requests
+
+import fake_upstreams
+from load_test import make_image, percentile, request_bodies, start_server
+
+
+def sample(url, stop):
+    session = requests.Session()
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        session.get(url + "/ready", timeout=30)
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.02)
+    return latencies
+
+
+def hold_lock(path, seconds):
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.execute("BEGIN EXCLUSIVE")
+    time.sleep(seconds)
+    connection.execute("COMMIT")
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hold", type=float, default=6.0)
+    parser.add_argument("--charts", type=int, default=10)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    paths = {"queue": os.path.join(directory, "jobs.sqlite3"), "cache": os.path.join(directory, "charts.sqlite3")}
+    os.environ.update({"JOB_QUEUE_PATH": paths["queue"], "CHART_CACHE_PATH": paths["cache"]})
+    upstream = fake_upstreams.start(latency=0.2)
+    process, url = start_server("gevent", upstream, workers=1)
+    body = request_bodies(make_image(400, 300))["/getChartAnalysis"]
+    try:
+        requests.get(url + "/ready", timeout=30)
+        for target, path in paths.items():
+            stop = threading.Event()
+            with ThreadPoolExecutor(max_workers=args.charts + 1) as executor:
+                sampler = executor.submit(sample, url, stop)
+                time.sleep(0.5)
+                locker = threading.Thread(target=hold_lock, args=(path, args.hold))
+                locker.start()
+                if target == "cache":
+                    # Distinct trading profiles so every analysis misses the cache and stores a verdict.
+                    list(executor.map(
+                        lambda i: requests.post(url + "/getChartAnalysis", json=dict(body, risk=f"r{i}"), timeout=60),
+                        range(args.charts),
+                    ))
+                locker.join()
+                stop.set()
+                latencies = sampler.result()
+            print(json.dumps({
+                "locked": target,
+                "hold_seconds": args.hold,
+                "samples": len(latencies),
+                "ready_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                "ready_p99_ms": round(percentile(latencies, 99) * 1000, 1),
+                "ready_max_ms": round(max(latencies) * 1000, 1),
+            }))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
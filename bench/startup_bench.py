@@ -0,0 +1,111 @@
+"""Measure how long a fresh worker takes to become useful.
+
+    python bench/startup_bench.py --runs 5 --gcs-latency 0.5
+    python bench/startup_bench.py --api-dir /tmp/old-checkout/api
+
+Reports, as medians over ``--runs`` cold starts against fake upstreams:
+
+- ``import_ms``: ``import app`` in a fresh interpreter;
+- ``ready_ms``: from spawning gunicorn until ``/ready`` answers 200 (or,
+  for trees without ``/ready``, until the server answers at all);
+- ``first_success_ms``: from spawning gunicorn until the first chart
+  analysis succeeds, sent as soon as the server accepts connections;
+- ``first_request_ms``: the latency of that first successful request.
+
+``--api-dir`` points at another checkout to compare before and after.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+import fake_upstreams
+from load_test import API_DIR, SERVERS, free_port, make_image, request_bodies
+
+ENDPOINT = "/getChartAnalysis"
+IMPORT_SCRIPT = "import time; start = time.perf_counter(); import app; print(time.perf_counter() - start)"
+
+
+def server_env(upstream):
+    env = dict(os.environ)
+    env.update(upstream.env())
+    env["JOB_QUEUE_PATH"] = os.path.join(tempfile.mkdtemp(), "jobs.sqlite3")
+    return env
+
+
+def import_seconds(api_dir, upstream):
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT], cwd=api_dir, env=server_env(upstream),
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+    ).stdout
+    return float(output.decode().strip().splitlines()[-1])
+
+
+def cold_start(api_dir, upstream, body, timeout=60):
+    env = server_env(upstream)
+    env.update(SERVERS["gevent"])
+    port = free_port()
+    env.update({"PORT": str(port), "WEB_CONCURRENCY": "1"})
+    url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:app", "--access-logfile", "/dev/null"],
+        cwd=api_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        first_success = first_request = None
+        while first_success is None:
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError("server did not answer a request in time")
+            try:
+                sent = time.perf_counter()
+                response = requests.post(url + ENDPOINT, json=body, timeout=30)
+            except requests.ConnectionError:
+                time.sleep(0.02)
+                continue
+            if response.ok:
+                first_success = time.perf_counter() - start
+                first_request = time.perf_counter() - sent
+
+        # Requests are served before warm-up finishes, so /ready can flip later.
+        while True:
+            response = requests.get(url + "/ready", timeout=5)
+            if response.status_code in (200, 404):
+                ready = time.perf_counter() - start
+                break
+            time.sleep(0.02)
+        return {"ready": ready, "first_success": first_success, "first_request": first_request}
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--gcs-latency", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--api-dir", default=API_DIR)
+    args = parser.parse_args()
+
+    os.environ.update({"CHART_CACHE_SIZE": "0"})
+    upstream = fake_upstreams.start(latency=args.latency, gcs_latency=args.gcs_latency)
+    body = request_bodies(make_image(800, 600))[ENDPOINT]
+
+    imports = [import_seconds(args.api_dir, upstream) for _ in range(args.runs)]
+    starts = [cold_start(args.api_dir, upstream, body) for _ in range(args.runs)]
+    result = {"api_dir": os.path.abspath(args.api_dir), "runs": args.runs, "gcs_latency": args.gcs_latency}
+    result["import_ms"] = round(statistics.median(imports) * 1000, 1)
+    for key in ("ready", "first_success", "first_request"):
+        result[f"{key}_ms"] = round(statistics.median(run[key] for run in starts) * 1000, 1)
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
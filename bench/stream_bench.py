@@ -0,0 +1,90 @@
+"""Compare time-to-first-section of the SSE mode against the buffered mode.
+
+    python bench/stream_bench.py --latency 1.0 --chunk-delay 0.02 --runs 5
+
+The fake upstream waits ``latency`` and then produces ``chunk_size``
+characters every ``chunk_delay`` seconds, so the buffered call takes as long
+as the whole generation.
+"""
+import argparse
+import json
+import time
+
+import requests
+
+import fake_upstreams
+from load_test import make_image, percentile, request_bodies, start_server
+
+# The first event that is actually useful to show to a user.
+FIRST_USEFUL = {"/getChartAnalysis": "generalTrends", "/getResponses": "responses"}
+
+
+def buffered(url, endpoint, body):
+    start = time.perf_counter()
+    response = requests.post(url + endpoint, json=body, timeout=300)
+    response.raise_for_status()
+    return {"total": time.perf_counter() - start}
+
+
+def streamed(url, endpoint, body):
+    timings = {}
+    start = time.perf_counter()
+    with requests.post(url + endpoint, json=dict(body, stream=True), stream=True, timeout=300) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if not line.startswith("event:"):
+                continue
+            event = line[len("event:"):].strip()
+            timings.setdefault("first_event", time.perf_counter() - start)
+            if event == FIRST_USEFUL[endpoint]:
+                timings.setdefault("first_useful", time.perf_counter() - start)
+            if event in ("result", "error"):
+                timings["total"] = time.perf_counter() - start
+    return timings
+
+
+def summarize(samples, key):
+    values = [sample[key] for sample in samples if key in sample]
+    return {
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--chunk-delay", type=float, default=0.02)
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    upstream = fake_upstreams.start(latency=args.latency, chunk_delay=args.chunk_delay, chunk_size=args.chunk_size)
+    process, url = start_server("gevent", upstream, workers=1)
+    try:
+        for endpoint in FIRST_USEFUL:
+            # A fresh image per call keeps the chart result cache out of the measurement.
+            modes = {"buffered": buffered, "streamed": streamed}
+            samples = {mode: [] for mode in modes}
+            for _ in range(args.runs):
+                for mode, run in modes.items():
+                    body = request_bodies(make_image(800, 600))[endpoint]
+                    samples[mode].append(run(url, endpoint, body))
+
+            result = {
+                "endpoint": endpoint,
+                "upstream_latency": args.latency,
+                "chunk_delay": args.chunk_delay,
+                "buffered_total": summarize(samples["buffered"], "total"),
+                "streamed_first_event": summarize(samples["streamed"], "first_event"),
+                "streamed_first_useful": summarize(samples["streamed"], "first_useful"),
+                "streamed_total": summarize(samples["streamed"], "total"),
+            }
+            print(json.dumps(result))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""Benchmark matrix over endpoints, image sizes and concurrency levels.
+
+    python bench/suite.py --output results.json
+    python bench/suite.py --latency 1.0 --jitter 0.3 --error-rate 0.02 --output after.json --compare before.json
+
+Every scenario starts a fresh gunicorn server against ``fake_upstreams`` so
+CPU time and peak RSS belong to that scenario alone. Chart and article
+caches are disabled unless ``--cache`` is given, so every request reaches
+the fake upstreams. Results are written as JSON; with ``--compare`` each
+scenario is diffed against an earlier run and the exit status is 1 if any
+metric regressed by more than ``--tolerance``.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import requests
+
+import fake_upstreams
+from load_test import SERVERS, make_image, request_bodies, run_load, start_server
+
+# Width x height of screenshots the apps actually upload.
+IMAGE_SIZES = {
+    "small": (800, 600),
+    "phone": (1170, 2532),
+    "tablet": (2048, 2732),
+}
+ENDPOINTS = ["/getChartAnalysis", "/getResponses", "/getArticles"]
+IMAGE_ENDPOINTS = {"/getChartAnalysis", "/getResponses"}
+
+# Metric name -> True when a larger value is better.
+COMPARED = {
+    "throughput_rps": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "cpu_ms_per_request": False,
+    "peak_rss_mb": False,
+}
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def process_tree(pid):
+    """The gunicorn master and its workers, read from /proc."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        pending.extend(children.get(current, []))
+    return pids
+
+
+def cpu_seconds(pids):
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        # utime and stime are fields 14 and 15 of /proc/<pid>/stat.
+        total += int(fields[11]) + int(fields[12])
+    return total / CLOCK_TICKS
+
+
+def peak_rss_mb(pids):
+    peak = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        peak = max(peak, int(line.split()[1]))
+        except OSError:
+            continue
+    return round(peak / 1024, 1)
+
+
+def scenarios(args):
+    for endpoint in args.endpoint or ENDPOINTS:
+        sizes = args.image_size or ["phone"]
+        for size in sizes if endpoint in IMAGE_ENDPOINTS else [None]:
+            for concurrency in args.concurrency or [10, 50]:
+                yield endpoint, size, concurrency
+
+
+def run_scenario(args, upstream, endpoint, size, concurrency, images):
+    if size is None:
+        body = request_bodies(b"")[endpoint]
+    else:
+        body = request_bodies(images[size])[endpoint]
+        if args.stream:
+            body = dict(body, stream=True)
+
+    process, url = start_server(args.server, upstream, args.workers)
+    try:
+        for _ in range(args.warmup):
+            requests.post(url + endpoint, json=body, timeout=300)
+
+        pids = process_tree(process.pid)
+        cpu_before = cpu_seconds(pids)
+        upstream_errors_before = upstream.counts["errors"]
+        upstream_throttled_before = upstream.counts["throttled"]
+        result = run_load(url, endpoint, body, concurrency, args.requests)
+        cpu = cpu_seconds(pids) - cpu_before
+        result.update({
+            "endpoint": endpoint,
+            "image": size,
+            "image_bytes": len(images[size]) if size else None,
+            "concurrency": concurrency,
+            "server": args.server,
+            "workers": args.workers,
+            "error_rate": round(result["errors"] / result["requests"], 4),
+            "upstream_errors_injected": upstream.counts["errors"] - upstream_errors_before,
+            "upstream_throttled": upstream.counts["throttled"] - upstream_throttled_before,
+            "cpu_ms_per_request": round(cpu / result["requests"] * 1000, 3),
+            "peak_rss_mb": peak_rss_mb(pids),
+        })
+        return result
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def scenario_key(result):
+    return result["endpoint"], result["image"], result["concurrency"], result["server"]
+
+
+def compare(results, baseline, tolerance):
+    previous = {scenario_key(result): result for result in baseline["scenarios"]}
+    regressions = []
+    for result in results:
+        before = previous.get(scenario_key(result))
+        if before is None:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            regressed = change < -tolerance if higher_is_better else change > tolerance
+            line = {
+                "scenario": list(scenario_key(result)),
+                "metric": metric,
+                "before": old,
+                "after": new,
+                "change": round(change, 4),
+                "regressed": regressed,
+            }
+            print(json.dumps(line), file=sys.stderr)
+            if regressed:
+                regressions.append(line)
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--endpoint", action="append", choices=ENDPOINTS)
+    parser.add_argument("--image-size", action="append", choices=sorted(IMAGE_SIZES))
+    parser.add_argument("--concurrency", action="append", type=int)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--server", default="gevent", choices=sorted(SERVERS))
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--stream", action="store_true", help="use the SSE mode of the image endpoints")
+    parser.add_argument("--cache", action="store_true", help="leave the chart and articles caches on")
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after")
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--gcs-latency", type=float, default=0.05)
+    parser.add_argument("--rpm-limit", type=int, default=0, help="requests per minute the fakes allow before 429")
+    parser.add_argument("--output", help="write results as JSON to this file instead of stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    if not args.cache:
+        os.environ.update({"CHART_CACHE_SIZE": "0", "ARTICLES_CACHE_TTL": "0"})
+
+    upstream = fake_upstreams.start(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, error_status=args.error_status,
+        retry_after=args.retry_after, chunk_delay=args.chunk_delay, chunk_size=args.chunk_size,
+        gcs_latency=args.gcs_latency, rpm_limit=args.rpm_limit,
+    )
+    images = {name: make_image(*IMAGE_SIZES[name]) for name in args.image_size or ["phone"]}
+
+    results = []
+    for endpoint, size, concurrency in scenarios(args):
+        result = run_scenario(args, upstream, endpoint, size, concurrency, images)
+        print(json.dumps(result), file=sys.stderr)
+        results.append(result)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "scenarios": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
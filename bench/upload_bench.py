@@ -0,0 +1,115 @@
+"""Compare base64-in-JSON uploads against multipart and raw image/* uploads.
+
+    python bench/upload_bench.py --image-size tablet --requests 100 --uplink-mbps 5
+
+For each upload format this reports:
+
+- the bytes on the wire and how long they take on a ``--uplink-mbps`` link;
+- peak Python allocation while the API reads the request (tracemalloc,
+  in-process);
+- latency and peak worker RSS against a fresh gunicorn server, with fake
+  upstreams that answer immediately.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import requests
+
+import fake_upstreams
+from load_test import API_DIR, make_image, percentile, request_bodies, start_server
+from suite import IMAGE_SIZES, peak_rss_mb, process_tree
+
+ENDPOINT = "/getChartAnalysis"
+FIELDS = {"tradingStyles": "Swing", "risk": "Medium"}
+
+
+def prepare(mode, url, image):
+    """A prepared request for ``image`` in the given upload format."""
+    if mode == "json":
+        request = requests.Request("POST", url, json=request_bodies(image)[ENDPOINT])
+    elif mode == "multipart":
+        request = requests.Request("POST", url, data=FIELDS, files={"image": ("chart.jpg", image, "image/jpeg")})
+    else:
+        request = requests.Request("POST", url, params=FIELDS, data=image, headers={"Content-Type": "image/jpeg"})
+    return request.prepare()
+
+
+def read_allocation(mode, image):
+    """Peak bytes allocated by the API while reading one upload."""
+    sys.path.insert(0, API_DIR)
+    from flask import Flask
+    from uploads import ImageUploadReader
+
+    prepared = prepare(mode, "http://localhost" + ENDPOINT, image)
+    reader = ImageUploadReader()
+    app = Flask(__name__)
+    with app.test_request_context(
+        prepared.path_url, method="POST", data=prepared.body, headers=dict(prepared.headers),
+    ) as context:
+        tracemalloc.start()
+        reader.read(context.request)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak
+
+
+def run_load(prepared, concurrency, total):
+    local = threading.local()
+    latencies = []
+
+    def one(_):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        session.send(prepared, timeout=300).raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(total)))
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image-size", default="tablet", choices=sorted(IMAGE_SIZES))
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--uplink-mbps", type=float, default=5.0)
+    args = parser.parse_args()
+
+    os.environ.update({"CHART_CACHE_SIZE": "0", "CHART_FILTER_MODE": "off"})
+    image = make_image(*IMAGE_SIZES[args.image_size])
+    upstream = fake_upstreams.start()
+    for mode in ("json", "multipart", "raw"):
+        process, url = start_server("gevent", upstream, workers=1)
+        try:
+            prepared = prepare(mode, url + ENDPOINT, image)
+            run_load(prepared, 1, 3)
+            result = run_load(prepared, args.concurrency, args.requests)
+            body_bytes = len(prepared.body)
+            result.update({
+                "mode": mode,
+                "image_bytes": len(image),
+                "body_bytes": body_bytes,
+                "upload_ms": round(body_bytes * 8 / (args.uplink_mbps * 1e6) * 1000, 1),
+                "read_peak_alloc_mb": round(read_allocation(mode, image) / 2 ** 20, 2),
+                "peak_rss_mb": peak_rss_mb(process_tree(process.pid)),
+            })
+            print(json.dumps(result))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The API modules import each other as top-level modules, as they do when
+# gunicorn runs from api/; the fake upstreams live with the benchmarks.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "api"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
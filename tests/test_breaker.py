@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+OPEN_SECONDS = 0.05
+
+
+def breaker(**kwargs):
+    kwargs.setdefault("open_seconds", OPEN_SECONDS)
+    return CircuitBreaker("test", min_calls=4, error_rate=0.5, **kwargs)
+
+
+def opened():
+    circuit = breaker()
+    for success in (True, True, False, False):
+        circuit.record(success, 0.01)
+    return circuit
+
+
+def test_stays_closed_below_min_calls():
+    circuit = breaker()
+    for _ in range(3):
+        circuit.record(False, 0.01)
+
+    assert circuit.state == CLOSED
+    circuit.before_call()
+
+
+def test_opens_at_the_error_rate():
+    circuit = breaker()
+    for success in (True, True, True, False, False):
+        circuit.record(success, 0.01)
+    assert circuit.state == CLOSED
+
+    circuit.record(False, 0.01)
+
+    assert circuit.state == OPEN
+    assert not circuit.available
+    with pytest.raises(CircuitOpen) as raised:
+        circuit.before_call()
+    assert raised.value.retry_after >= 1.0
+    assert circuit.stats()["opened"] == 1
+    assert circuit.stats()["rejected"] == 1
+
+
+def test_opens_when_too_many_calls_are_slow():
+    circuit = breaker(slow_seconds=1.0, slow_rate=0.5)
+    for seconds in (0.1, 0.1, 2.0, 2.0):
+        circuit.record(True, seconds)
+
+    assert circuit.state == OPEN
+
+
+def test_old_outcomes_leave_the_window():
+    circuit = breaker(window=0.05)
+    for _ in range(3):
+        circuit.record(False, 0.01)
+    time.sleep(0.06)
+
+    circuit.record(False, 0.01)
+
+    assert circuit.state == CLOSED
+
+
+def test_lets_one_probe_through_after_open_seconds():
+    circuit = opened()
+    time.sleep(OPEN_SECONDS + 0.01)
+
+    assert circuit.available
+    circuit.before_call()
+    assert circuit.state == HALF_OPEN
+    assert not circuit.available
+    with pytest.raises(CircuitOpen):
+        circuit.before_call()
+
+
+def test_successful_probe_closes():
+    circuit = opened()
+    time.sleep(OPEN_SECONDS + 0.01)
+    circuit.before_call()
+
+    circuit.record(True, 0.01)
+
+    assert circuit.state == CLOSED
+    assert circuit.stats()["recent_calls"] == 0
+    circuit.before_call()
+
+
+@pytest.mark.parametrize("success, seconds", [(False, 0.01), (True, 60.0)])
+def test_failed_or_slow_probe_reopens(success, seconds):
+    circuit = opened()
+    time.sleep(OPEN_SECONDS + 0.01)
+    circuit.before_call()
+
+    circuit.record(success, seconds)
+
+    assert circuit.state == OPEN
+    assert circuit.stats()["opened"] == 2
+    with pytest.raises(CircuitOpen):
+        circuit.before_call()
+
+
+def test_cancelled_probe_frees_the_slot():
+    circuit = opened()
+    time.sleep(OPEN_SECONDS + 0.01)
+    circuit.before_call()
+
+    circuit.cancel()
+
+    assert circuit.state == HALF_OPEN
+    circuit.before_call()
@@ -0,0 +1,176 @@
+import threading
+import time
+
+import pytest
+
+from cache import RefreshingCache, SingleFlight
+
+WAITERS = 8
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting"
+        time.sleep(0.005)
+
+
+class GatedLoader:
+    """A loader that blocks until ``release`` so callers can pile up behind it."""
+
+    def __init__(self, value="value", error=None):
+        self.value = value
+        self.error = error
+        self.calls = 0
+        self.gate = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.gate.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def release(self):
+        self.gate.set()
+
+
+def call_concurrently(fn, count=WAITERS):
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(fn())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def join(threads):
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_calls_share_one_load():
+    flight = SingleFlight()
+    loader = GatedLoader()
+
+    threads, results, errors = call_concurrently(lambda: flight.do("key", loader))
+    wait_for(lambda: flight.stats()["shared"] == WAITERS - 1)
+    loader.release()
+    join(threads)
+
+    assert loader.calls == 1
+    assert results == ["value"] * WAITERS
+    assert errors == []
+    assert flight.stats() == {"calls": 1, "shared": WAITERS - 1, "in_flight": 0}
+
+
+def test_error_reaches_every_waiter_and_is_not_kept():
+    flight = SingleFlight()
+    error = ValueError("upstream failed")
+    loader = GatedLoader(error=error)
+
+    threads, results, errors = call_concurrently(lambda: flight.do("key", loader))
+    wait_for(lambda: flight.stats()["shared"] == WAITERS - 1)
+    loader.release()
+    join(threads)
+
+    assert results == []
+    assert errors == [error] * WAITERS
+    assert flight.do("key", lambda: "retried") == "retried"
+
+
+def test_different_keys_load_separately():
+    flight = SingleFlight()
+
+    assert flight.do("a", lambda: 1) == 1
+    assert flight.do("b", lambda: 2) == 2
+    assert flight.stats()["calls"] == 2
+
+
+def test_concurrent_misses_make_one_load():
+    cache = RefreshingCache(ttl=60)
+    loader = GatedLoader()
+
+    threads, results, _ = call_concurrently(lambda: cache.get_or_load("key", loader))
+    wait_for(lambda: cache.stats()["coalesced"]["shared"] == WAITERS - 1)
+    loader.release()
+    join(threads)
+
+    assert loader.calls == 1
+    assert results == ["value"] * WAITERS
+    assert cache.get_or_load("key", GatedLoader("other")) == "value"
+    assert cache.stats()["fresh_hits"] == 1
+
+
+def test_failed_load_is_not_cached():
+    cache = RefreshingCache(ttl=60)
+    loader = GatedLoader(error=ValueError("upstream failed"))
+
+    threads, _, errors = call_concurrently(lambda: cache.get_or_load("key", loader))
+    wait_for(lambda: cache.stats()["coalesced"]["shared"] == WAITERS - 1)
+    loader.release()
+    join(threads)
+
+    assert len(errors) == WAITERS
+    assert cache.get_or_load("key", lambda: "value") == "value"
+
+
+def test_uncacheable_values_are_loaded_every_time():
+    cache = RefreshingCache(ttl=60, cacheable=lambda value: value != "error")
+    loader = GatedLoader("error")
+    loader.release()
+
+    cache.get_or_load("key", loader)
+    cache.get_or_load("key", loader)
+
+    assert loader.calls == 2
+
+
+def test_stale_value_is_served_while_one_refresh_runs():
+    cache = RefreshingCache(ttl=0.2, stale_ttl=60)
+    cache.get_or_load("key", lambda: "old")
+    time.sleep(0.21)
+    loader = GatedLoader("new")
+
+    threads, results, _ = call_concurrently(lambda: cache.get_or_load("key", loader))
+    join(threads)
+
+    assert results == ["old"] * WAITERS
+    assert cache.stats()["stale_hits"] == WAITERS
+    wait_for(lambda: loader.calls == 1)
+    loader.release()
+    wait_for(lambda: cache.get_or_load("key", loader) == "new")
+    assert loader.calls == 1
+
+
+def test_failed_refresh_keeps_the_stale_value():
+    cache = RefreshingCache(ttl=0.05, stale_ttl=60)
+    cache.get_or_load("key", lambda: "old")
+    time.sleep(0.06)
+    loader = GatedLoader(error=ValueError("upstream failed"))
+    loader.release()
+
+    assert cache.get_or_load("key", loader) == "old"
+    wait_for(lambda: cache.stats()["refresh_errors"] == 1)
+    assert cache.get_or_load("key", lambda: "new") == "old"
+
+
+@pytest.mark.parametrize("age, loads", [(0.0, 1), (0.2, 2)])
+def test_entries_past_the_stale_ttl_are_loaded_again(age, loads):
+    cache = RefreshingCache(ttl=0.05, stale_ttl=0.1)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return len(calls)
+
+    cache.get_or_load("key", loader)
+    time.sleep(age)
+
+    assert cache.get_or_load("key", loader) == loads
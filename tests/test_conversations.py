@@ -0,0 +1,129 @@
+import time
+
+from conversations import FULL, INCREMENTAL, UNCHANGED, ChatMessage, ConversationSessions, Transcript
+
+
+def transcript(*lines):
+    """``"me: hi"`` and ``"them: hey"`` lines as a transcript."""
+    messages = [ChatMessage(*line.split(": ", 1)) for line in lines]
+    return Transcript(messages, 90.0)
+
+
+FIRST = transcript("them: hey, how was your weekend?", "me: great, went hiking", "them: oh nice, where?")
+RESULT = {"breakdown": "She is asking follow-up questions.", "interestLevel": 7}
+
+
+def uploaded(sessions, key, upload):
+    """Plans and stores ``upload`` as answered, and returns its plan."""
+    plan = sessions.plan(key, sessions.get(key), upload)
+    sessions.update(plan, upload, RESULT)
+    return plan
+
+
+def test_first_upload_is_sent_in_full():
+    sessions = ConversationSessions()
+
+    plan = sessions.plan("chat", sessions.get("chat"), FIRST)
+
+    assert plan.mode == FULL
+    assert plan.session is None
+
+
+def test_unchanged_reupload_has_nothing_new():
+    sessions = ConversationSessions()
+    uploaded(sessions, "chat", FIRST)
+
+    plan = sessions.plan("chat", sessions.get("chat"), FIRST)
+
+    assert plan.mode == UNCHANGED
+    assert plan.new_messages == []
+
+
+def test_appended_message_is_sent_on_its_own():
+    sessions = ConversationSessions()
+    uploaded(sessions, "chat", FIRST)
+    # Scrolled down: the oldest message went off the top of the screenshot.
+    upload = transcript("me: great, went hiking", "them: oh nice, where?", "me: up in the mountains")
+
+    plan = uploaded(sessions, "chat", upload)
+
+    assert plan.mode == INCREMENTAL
+    assert plan.new_messages == [ChatMessage("me", "up in the mountains")]
+    assert [message.text for message in sessions.get("chat")["messages"]] == [
+        "hey, how was your weekend?", "great, went hiking", "oh nice, where?", "up in the mountains",
+    ]
+
+
+def test_ocr_noise_does_not_break_the_overlap():
+    sessions = ConversationSessions()
+    uploaded(sessions, "chat", FIRST)
+    upload = transcript("me: great , went hiking.", "them: Oh nice where?", "me: up in the mountains")
+
+    plan = sessions.plan("chat", sessions.get("chat"), upload)
+
+    assert plan.mode == INCREMENTAL
+    assert plan.new_messages == [ChatMessage("me", "up in the mountains")]
+
+
+def test_cut_off_last_message_is_sent_again():
+    sessions = ConversationSessions()
+    uploaded(sessions, "chat", transcript(
+        "them: hey, how was your weekend?", "me: great, went hiking", "them: oh nice, where?", "me: up in the mou",
+    ))
+    upload = transcript(
+        "me: great, went hiking", "them: oh nice, where?", "me: up in the mountains", "them: sounds fun",
+    )
+
+    plan = sessions.plan("chat", sessions.get("chat"), upload)
+
+    assert plan.mode == INCREMENTAL
+    assert [message.text for message in plan.new_messages] == ["up in the mountains", "sounds fun"]
+
+
+def test_another_conversation_is_sent_in_full():
+    sessions = ConversationSessions()
+    uploaded(sessions, "chat", FIRST)
+
+    plan = sessions.plan("chat", sessions.get("chat"), transcript("them: are we still on for friday?", "me: yes!"))
+
+    assert plan.mode == FULL
+
+
+def test_unreadable_screenshot_is_sent_in_full():
+    sessions = ConversationSessions()
+    uploaded(sessions, "chat", FIRST)
+
+    assert sessions.plan("chat", sessions.get("chat"), None).mode == FULL
+
+
+def test_expired_session_starts_over():
+    sessions = ConversationSessions(ttl=0.05)
+    uploaded(sessions, "chat", FIRST)
+    time.sleep(0.06)
+
+    plan = sessions.plan("chat", sessions.get("chat"), FIRST)
+
+    assert plan.mode == FULL
+    assert plan.session is None
+
+
+def test_context_carries_the_summary_and_new_messages():
+    sessions = ConversationSessions(context_messages=2)
+    uploaded(sessions, "chat", FIRST)
+    upload = transcript("me: great, went hiking", "them: oh nice, where?", "me: up in the mountains")
+
+    context = sessions.context(sessions.plan("chat", sessions.get("chat"), upload), name="Sam")
+
+    assert "She is asking follow-up questions. Interest level so far: 7/10." in context
+    assert "User: great, went hiking\nSam: oh nice, where?" in context
+    assert "hey, how was your weekend?" not in context
+    assert context.endswith("New messages since then:\nUser: up in the mountains")
+
+
+def test_modes_are_counted():
+    sessions = ConversationSessions()
+    uploaded(sessions, "chat", FIRST)
+    uploaded(sessions, "chat", FIRST)
+
+    assert sessions.stats()["modes"] == {INCREMENTAL: 0, UNCHANGED: 1, FULL: 1}
+    assert sessions.stats()["sessions"] == 1
@@ -0,0 +1,154 @@
+from io import BytesIO
+import random
+
+import pytest
+from PIL import Image
+
+from images import EXIF_ORIENTATION, ImageNormalizer, InvalidImageError, has_metadata
+
+
+def encode(image, image_format="JPEG", **kwargs):
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **kwargs)
+    return buffer.getvalue()
+
+
+def noise(width, height):
+    # Noise does not compress, so re-encoding it cannot come out much smaller.
+    generator = random.Random(0)
+    return Image.frombytes("RGB", (width, height), bytes(generator.getrandbits(8) for _ in range(width * height * 3)))
+
+
+def with_orientation(image, orientation):
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = orientation
+    return encode(image, exif=exif.tobytes())
+
+
+def decoded(normalized):
+    return Image.open(BytesIO(normalized.data))
+
+
+def test_large_image_is_fitted_to_the_short_side():
+    normalizer = ImageNormalizer(max_side=2048, short_side=768)
+
+    normalized = normalizer.normalize(encode(Image.new("RGB", (3000, 1500), "white")))
+
+    assert (normalized.width, normalized.height) == (1536, 768)
+    assert decoded(normalized).size == (1536, 768)
+    assert (normalized.original_width, normalized.original_height) == (3000, 1500)
+    assert normalized.mime_type == "image/jpeg"
+    assert normalized.detail == "high"
+
+
+def test_long_side_is_capped():
+    normalizer = ImageNormalizer(max_side=2048, short_side=768)
+
+    normalized = normalizer.normalize(encode(Image.new("RGB", (8000, 400), "white")))
+
+    assert (normalized.width, normalized.height) == (2048, 102)
+
+
+def test_exif_orientation_is_applied():
+    normalizer = ImageNormalizer()
+    # Orientation 6: stored landscape, displayed rotated 90 degrees clockwise.
+    upload = with_orientation(Image.new("RGB", (400, 200), "white"), 6)
+
+    normalized = normalizer.normalize(upload)
+
+    assert (normalized.width, normalized.height) == (200, 400)
+    image = decoded(normalized)
+    assert image.size == (200, 400)
+    assert EXIF_ORIENTATION not in image.getexif()
+
+
+def test_small_compressed_upload_without_metadata_is_passed_through():
+    normalizer = ImageNormalizer(quality=85)
+    upload = encode(noise(64, 64), quality=30)
+
+    normalized = normalizer.normalize(upload)
+
+    assert normalized.data == upload
+    assert normalized.mime_type == "image/jpeg"
+    assert normalized.detail == "low"
+
+
+@pytest.mark.parametrize("metadata", [
+    {"exif": b"Exif\x00\x00MM\x00*\x00\x00\x00\x08\x00\x00\x00\x00\x00\x00"},
+    {"comment": b"taken at home"},
+])
+def test_upload_with_metadata_is_always_re_encoded(metadata):
+    normalizer = ImageNormalizer(quality=85)
+    upload = encode(noise(64, 64), quality=30, **metadata)
+    assert has_metadata(Image.open(BytesIO(upload)))
+
+    normalized = normalizer.normalize(upload)
+
+    assert normalized.data != upload
+    assert not has_metadata(decoded(normalized))
+
+
+def test_exif_is_dropped():
+    exif = Image.Exif()
+    exif[0x8825] = {2: (52.0, 22.0, 1.0)}  # GPS latitude
+    exif[0x010F] = "Phone maker"
+    upload = encode(noise(64, 64), quality=30, exif=exif.tobytes())
+
+    normalized = ImageNormalizer().normalize(upload)
+
+    assert b"Phone maker" not in normalized.data
+    assert len(decoded(normalized).getexif()) == 0
+
+
+def test_png_text_chunks_count_as_metadata():
+    from PIL.PngImagePlugin import PngInfo
+    info = PngInfo()
+    info.add_text("Author", "someone")
+    upload = encode(Image.new("RGB", (16, 16), "white"), "PNG", pnginfo=info)
+
+    assert has_metadata(Image.open(BytesIO(upload)))
+    assert not has_metadata(Image.open(BytesIO(encode(Image.new("RGB", (16, 16), "white"), "PNG"))))
+
+
+def test_transparent_png_is_flattened_onto_white():
+    image = Image.new("RGBA", (2000, 2000), (0, 0, 0, 0))
+
+    normalized = ImageNormalizer().normalize(encode(image, "PNG"))
+
+    assert normalized.mime_type == "image/jpeg"
+    assert decoded(normalized).getpixel((10, 10)) == pytest.approx((255, 255, 255), abs=2)
+
+
+def test_webp_output():
+    normalized = ImageNormalizer(image_format="WEBP").normalize(encode(Image.new("RGB", (1200, 900), "white")))
+
+    assert normalized.mime_type == "image/webp"
+    assert decoded(normalized).format == "WEBP"
+
+
+def test_not_an_image_is_invalid():
+    with pytest.raises(InvalidImageError):
+        ImageNormalizer().normalize(b"definitely not an image")
+
+
+def test_decompression_bomb_is_invalid(monkeypatch):
+    upload = encode(Image.new("RGB", (1000, 1000), "white"))
+    # Pillow refuses images over twice MAX_IMAGE_PIXELS.
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 100000)
+
+    with pytest.raises(InvalidImageError):
+        ImageNormalizer().normalize(upload)
+
+
+def test_stats_count_bytes_and_pixels():
+    normalizer = ImageNormalizer(short_side=768)
+    upload = encode(Image.new("RGB", (3000, 1500), "white"))
+
+    normalized = normalizer.normalize(upload)
+
+    stats = normalizer.stats()
+    assert stats["images"] == 1
+    assert stats["bytes_in"] == len(upload)
+    assert stats["bytes_out"] == len(normalized.data)
+    assert stats["pixels_in"] == 3000 * 1500
+    assert stats["pixels_out"] == 1536 * 768
@@ -0,0 +1,270 @@
+import hashlib
+import hmac
+import json
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import jobs
+from jobs import DONE, FAILED, QUEUED, RUNNING, IdempotencyConflict, JobQueue
+
+
+class Unavailable(Exception):
+    def __init__(self, retry_after):
+        super().__init__("try again later")
+        self.retry_after = retry_after
+
+
+def echo(fields, image_bytes):
+    return {"fields": fields, "size": len(image_bytes)}, 200
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(handlers=None, **kwargs):
+        kwargs.setdefault("poll_interval", 0.02)
+        queue = JobQueue(str(tmp_path / "jobs.sqlite3"), handlers or {"echo": echo}, **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.stop()
+
+
+def wait_for_status(queue, job_id, statuses=(DONE, FAILED), timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = queue.get(job_id)
+        if job["status"] in statuses:
+            return job
+        assert time.monotonic() < deadline, f"job stayed {job['status']}"
+        time.sleep(0.01)
+
+
+def test_job_runs_to_done(make_queue):
+    queue = make_queue()
+    queue.start()
+
+    job, created = queue.submit("echo", {"risk": "Low"}, b"image")
+    job = wait_for_status(queue, job["jobId"])
+
+    assert created
+    assert job["status"] == DONE
+    assert job["resultStatus"] == 200
+    assert job["result"] == {"fields": {"risk": "Low"}, "size": 5}
+    assert job["attempts"] == 1
+    assert queue.stats()["completed"] == 1
+
+
+@pytest.mark.parametrize("handler, status", [
+    (lambda fields, image_bytes: ({"error": "Not a chart"}, 400), 400),
+    (lambda fields, image_bytes: ({"error": "upstream"}, 502), 502),
+    (lambda fields, image_bytes: 1 / 0, 500),
+])
+def test_terminal_states(make_queue, handler, status):
+    queue = make_queue({"echo": handler})
+    queue.start()
+
+    job, _ = queue.submit("echo", {}, b"")
+    job = wait_for_status(queue, job["jobId"])
+
+    # Client errors are a finished job; server errors a failed one.
+    assert job["status"] == (DONE if status < 500 else FAILED)
+    assert job["resultStatus"] == status
+
+
+def test_retryable_errors_are_queued_again(make_queue):
+    calls = []
+
+    def flaky(fields, image_bytes):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise Unavailable(0.05)
+        return {"ok": True}, 200
+
+    queue = make_queue({"echo": flaky}, retry_on=Unavailable)
+    queue.start()
+
+    job, _ = queue.submit("echo", {}, b"")
+    job = wait_for_status(queue, job["jobId"])
+
+    assert job["status"] == DONE
+    assert job["attempts"] == 2
+    assert calls[1] - calls[0] >= 0.05
+    assert queue.stats()["retried"] == 1
+
+
+def test_retries_give_up_after_max_attempts(make_queue):
+    def unavailable(fields, image_bytes):
+        raise Unavailable(0.0)
+
+    queue = make_queue({"echo": unavailable}, retry_on=Unavailable, max_attempts=2)
+    queue.start()
+
+    job, _ = queue.submit("echo", {}, b"")
+    job = wait_for_status(queue, job["jobId"])
+
+    assert job["status"] == FAILED
+    assert job["resultStatus"] == 503
+    assert job["attempts"] == 2
+
+
+def test_each_job_is_claimed_once_across_processes(make_queue):
+    # Two queues on one file stand in for two worker processes.
+    queues = [make_queue(), make_queue()]
+    submitted = {queues[0].submit("echo", {"n": i}, b"")[0]["jobId"] for i in range(40)}
+    claimed = []
+
+    def claim_all(queue):
+        while True:
+            row = queue._claim()
+            if row is None:
+                return
+            claimed.append(row[0])
+
+    threads = [threading.Thread(target=claim_all, args=(queue,)) for queue in queues for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == sorted(submitted)
+    assert queues[0].depths()[0] == {QUEUED: 0, RUNNING: 40}
+
+
+def test_stale_running_job_is_queued_again(make_queue):
+    queue = make_queue(job_timeout=60, max_attempts=2)
+    job, _ = queue.submit("echo", {}, b"")
+    assert queue._claim()[0] == job["jobId"]
+
+    # Its worker died: after job_timeout the job goes back to the queue.
+    later = time.time() + 61
+    queue._db.run(queue._maintain, later)
+
+    assert queue.get(job["jobId"])["status"] == QUEUED
+    assert queue._db.run(queue._claim_next, later)[0] == job["jobId"]
+
+    # Out of attempts, the next timeout fails it.
+    queue._db.run(queue._maintain, later + 61)
+
+    job = queue.get(job["jobId"])
+    assert job["status"] == FAILED
+    assert job["resultStatus"] == 504
+
+
+def test_running_job_within_its_timeout_is_left_alone(make_queue):
+    queue = make_queue(job_timeout=60)
+    job, _ = queue.submit("echo", {}, b"")
+    queue._claim()
+
+    queue._db.run(queue._maintain, time.time() + 30)
+
+    assert queue.get(job["jobId"])["status"] == RUNNING
+
+
+def test_idempotent_resubmit_returns_the_same_job(make_queue):
+    queue = make_queue()
+
+    first, first_created = queue.submit("echo", {"n": 1}, b"", idempotency_key="key")
+    second, second_created = queue.submit("echo", {"n": 2}, b"", idempotency_key="key")
+
+    assert first_created and not second_created
+    assert second["jobId"] == first["jobId"]
+    assert queue.stats()["attached"] == 1
+    assert queue.depths()[0][QUEUED] == 1
+
+
+def test_idempotency_key_of_another_kind_conflicts(make_queue):
+    queue = make_queue({"echo": echo, "other": echo})
+    queue.submit("echo", {}, b"", idempotency_key="key")
+
+    with pytest.raises(IdempotencyConflict):
+        queue.submit("other", {}, b"", idempotency_key="key")
+
+
+def test_expired_idempotency_key_can_be_used_again(make_queue):
+    queue = make_queue(result_ttl=0.05)
+    first, _ = queue.submit("echo", {}, b"", idempotency_key="key")
+    time.sleep(0.06)
+
+    second, created = queue.submit("echo", {}, b"", idempotency_key="key")
+
+    assert created
+    assert second["jobId"] != first["jobId"]
+    assert queue.get(first["jobId"]) is None
+
+
+def test_finishing_a_job_retries_while_the_database_is_locked(make_queue, monkeypatch):
+    queue = make_queue()
+    job, _ = queue.submit("echo", {}, b"")
+    execute = queue._db.execute
+    failures = []
+
+    def locked_twice(sql, parameters=()):
+        if sql.startswith("UPDATE") and len(failures) < 2:
+            failures.append(sql)
+            raise sqlite3.OperationalError("database is locked")
+        return execute(sql, parameters)
+
+    monkeypatch.setattr(queue._db, "execute", locked_twice)
+    monkeypatch.setattr(jobs, "WRITE_BACKOFF_MAX", 0.0)
+
+    queue._run(*queue._claim())
+
+    assert len(failures) == 2
+    assert queue.get(job["jobId"])["status"] == DONE
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.received.append((dict(self.headers), body))
+        self.send_response(204)
+        self.end_headers()
+
+
+@pytest.fixture
+def webhook_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), WebhookHandler)
+    server.received = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_webhook_is_signed_and_delivered(make_queue, webhook_server):
+    queue = make_queue(webhook_secret="secret", webhook_allow_private=True)
+    queue.start()
+    url = f"http://127.0.0.1:{webhook_server.server_port}/hook"
+
+    job, _ = queue.submit("echo", {}, b"", webhook_url=url)
+    wait_for_status(queue, job["jobId"])
+    deadline = time.monotonic() + 5
+    while not webhook_server.received:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    headers, body = webhook_server.received[0]
+    assert json.loads(body)["jobId"] == job["jobId"]
+    assert json.loads(body)["status"] == DONE
+    expected = hmac.new(b"secret", body, hashlib.sha256).hexdigest()
+    assert headers[jobs.WEBHOOK_SIGNATURE_HEADER] == expected
+
+
+def test_webhook_to_a_private_address_is_refused(make_queue, webhook_server):
+    queue = make_queue()
+    job = queue.get(queue.submit("echo", {}, b"")[0]["jobId"])
+
+    queue._notify(f"http://127.0.0.1:{webhook_server.server_port}/hook", job)
+
+    assert webhook_server.received == []
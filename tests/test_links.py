@@ -0,0 +1,143 @@
+import pytest
+import requests
+
+import addresses
+import article_fixtures
+from addresses import AddressRefused, PublicAddressAdapter, public_address
+from cache import LRUCache
+from links import LinkEnricher
+
+# Resolves to the fixture site as if it were a public host.
+PUBLIC_HOST = "news.example"
+
+
+@pytest.fixture
+def site():
+    servers = []
+
+    def start(**config):
+        server = article_fixtures.start(**config)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def public_site(site, monkeypatch):
+    """The fixture site, reachable as ``PUBLIC_HOST`` through the public address check."""
+    server = site()
+    check = addresses.public_address
+
+    def resolve(host, port):
+        return "127.0.0.1" if host == PUBLIC_HOST else check(host, port)
+
+    monkeypatch.setattr(addresses, "public_address", resolve)
+    server.public_url = f"http://{PUBLIC_HOST}:{server.server_port}"
+    return server
+
+
+def enricher(**kwargs):
+    return LinkEnricher(LRUCache(), **kwargs)
+
+
+@pytest.mark.parametrize("host", [
+    "127.0.0.1", "localhost", "10.1.2.3", "192.168.0.1", "169.254.169.254", "::1", "::ffff:127.0.0.1",
+    "::ffff:169.254.169.254", "2130706433", "0x7f000001", "127.1", "0.0.0.0",
+])
+def test_private_addresses_are_refused(host):
+    with pytest.raises(AddressRefused):
+        public_address(host, 80)
+
+
+def test_public_address_is_returned():
+    assert public_address("8.8.8.8", 443) == "8.8.8.8"
+
+
+def test_adapter_refuses_to_connect_to_a_private_address(site):
+    server = site()
+    session = requests.Session()
+    session.mount("http://", PublicAddressAdapter())
+
+    with pytest.raises(AddressRefused):
+        session.get(f"{server.url}/article/1")
+    assert server.counts == {}
+
+
+def test_private_link_is_dropped(site):
+    server = site()
+    articles = server.articles(["/article/1"])
+
+    assert enricher().enrich(articles) == []
+    assert server.counts == {}
+
+
+def test_public_link_gets_a_preview(public_site):
+    article = {"title": "Apple", "link": f"{public_site.public_url}/redirect/1"}
+
+    enriched = enricher().enrich([article])
+
+    assert enriched[0]["preview"]["title"] == "Apple beats estimates, part 1"
+    assert public_site.counts == {"redirect": 1, "article": 1}
+
+
+def test_redirect_to_a_private_address_is_blocked(public_site):
+    link_enricher = enricher()
+    article = {"title": "Apple", "link": f"{public_site.public_url}/moved/1"}
+
+    assert link_enricher.enrich([article]) == []
+    assert public_site.counts == {"moved": 1}
+    assert link_enricher.stats()["outcomes"] == {"dead": 1}
+
+
+def test_slow_page_times_out_and_keeps_the_article(site):
+    server = site(slow_latency=1.0)
+    link_enricher = enricher(read_timeout=0.1, allow_private=True)
+    articles = server.articles(["/slow/1"])
+
+    assert link_enricher.enrich(articles) == articles
+    assert link_enricher.stats()["outcomes"] == {"timeout": 1}
+
+
+def test_links_still_loading_at_the_deadline_are_returned_as_they_are(site):
+    server = site(slow_latency=0.5)
+    link_enricher = enricher(deadline=0.1, allow_private=True)
+    articles = server.articles(["/slow/1", "/article/2"])
+
+    enriched = link_enricher.enrich(articles)
+
+    assert enriched[0] == articles[0]
+    assert "preview" in enriched[1]
+    assert link_enricher.stats()["late"] == 1
+
+
+def test_reading_stops_at_the_head(site):
+    server = site()
+    link_enricher = enricher(allow_private=True)
+    response = link_enricher.session.get(f"{server.url}/article/1", stream=True)
+
+    with response:
+        html = link_enricher._read_head(response)
+
+    assert b"</head>" in html
+    assert len(html) < int(response.headers["Content-Length"])
+
+
+def test_reading_stops_at_max_bytes(site):
+    server = site()
+    link_enricher = enricher(max_bytes=100, allow_private=True)
+    response = link_enricher.session.get(f"{server.url}/article/1", stream=True)
+
+    with response:
+        html = link_enricher._read_head(response)
+
+    assert len(html) == 100
+    assert b"</head>" not in html
+
+
+@pytest.mark.parametrize("link", ["ftp://example.com/article", "javascript:alert(1)", None])
+def test_non_http_links_are_dropped(link):
+    assert enricher().enrich([{"title": "Apple", "link": link}]) == []
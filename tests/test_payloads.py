@@ -0,0 +1,71 @@
+import base64
+import json
+
+import pytest
+
+from images import NormalizedImage
+from payloads import ENCODE_CHUNK_SIZE, PayloadTemplate, encode_json, slot
+
+
+def image(data, mime_type="image/jpeg"):
+    return NormalizedImage(data, mime_type, "high", 10, 10, len(data), 10, 10)
+
+
+def chat_payload(prompt, image_url):
+    return {
+        "model": "gpt-5-mini",
+        "messages": [
+            {"role": "system", "content": "Answer in JSON."},
+            {"role": "user", "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": image_url, "detail": "high"}},
+            ]},
+        ],
+        "stream": False,
+    }
+
+
+def compact(payload):
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+PROMPTS = [
+    "",
+    "plain prompt",
+    'quotes " and backslashes \\ and \x00 nulls',
+    "newlines\nand\ttabs, unicode é 中 and an emoji \U0001F600",
+    "\u0000prompt\u0000",
+]
+
+
+@pytest.mark.parametrize("prompt", PROMPTS)
+@pytest.mark.parametrize("size", [0, 1, 2, 3, 4, ENCODE_CHUNK_SIZE - 1, ENCODE_CHUNK_SIZE, ENCODE_CHUNK_SIZE + 1])
+def test_render_matches_json_dumps(prompt, size):
+    data = bytes(range(256)) * (size // 256) + bytes(range(size % 256))
+    template = PayloadTemplate(chat_payload(slot("prompt"), slot("image")))
+
+    rendered = template.render(prompt=prompt, image=image(data, "image/png"))
+
+    expected = chat_payload(prompt, "data:image/png;base64," + base64.b64encode(data).decode())
+    assert bytes(rendered) == compact(expected)
+
+
+def test_render_fills_bytes_as_encoded_json():
+    template = PayloadTemplate({"model": slot("model"), "messages": slot("messages"), "n": 1})
+    messages = [{"role": "user", "content": "hi \"there\""}]
+
+    rendered = template.render(model="gpt-4.1-mini", messages=encode_json(messages))
+
+    assert json.loads(rendered) == {"model": "gpt-4.1-mini", "messages": messages, "n": 1}
+
+
+def test_template_without_slots_renders_the_payload():
+    payload = {"model": "gpt-5-mini", "stream": True}
+
+    assert bytes(PayloadTemplate(payload).render()) == compact(payload)
+
+
+def test_same_slot_used_twice():
+    template = PayloadTemplate({"a": slot("name"), "b": [slot("name")]})
+
+    assert json.loads(template.render(name="x")) == {"a": "x", "b": ["x"]}
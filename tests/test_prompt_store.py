@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+from prompt_store import PromptStore
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.text, self.generation = bucket.objects[name]
+        self.etag = f"etag-{self.generation}"
+
+    def download_as_text(self):
+        self.bucket.downloads.append(self.name)
+        return self.text
+
+
+class FakeBucket:
+    """Just enough of a google-cloud-storage bucket for ``PromptStore``."""
+
+    def __init__(self, objects):
+        self.objects = dict(objects)
+        self.downloads = []
+        self.error = None
+
+    def upload(self, name, text):
+        generation = self.objects[name][1] + 1 if name in self.objects else 1
+        self.objects[name] = (text, generation)
+
+    def get_blob(self, name):
+        if self.error is not None:
+            raise self.error
+        return FakeBlob(self, name) if name in self.objects else None
+
+
+@pytest.fixture
+def bucket():
+    return FakeBucket({"analysis.txt": ("Analyze the chart.", 1)})
+
+
+def store(bucket, **kwargs):
+    prompts = PromptStore("prompts", ["analysis.txt"], ttl=0, bucket=bucket, **kwargs)
+    prompts.start()
+    return prompts
+
+
+def test_prompts_are_preloaded(bucket):
+    prompts = store(bucket)
+
+    assert prompts.get("analysis.txt") == "Analyze the chart."
+    assert prompts.version("analysis.txt") == "1"
+    assert bucket.downloads == ["analysis.txt"]
+    assert prompts.stats()["hits"] == 1
+
+
+def test_unchanged_generation_is_not_downloaded_again(bucket):
+    prompts = store(bucket)
+
+    prompts.refresh()
+    prompts.refresh()
+
+    assert bucket.downloads == ["analysis.txt"]
+    assert prompts.stats()["not_modified"] == 2
+
+
+def test_new_generation_is_downloaded_and_announced(bucket):
+    prompts = store(bucket)
+    changed = []
+    prompts.add_listener(changed.append)
+    bucket.upload("analysis.txt", "Analyze the chart, briefly.")
+
+    prompts.refresh()
+
+    assert prompts.get("analysis.txt") == "Analyze the chart, briefly."
+    assert prompts.version("analysis.txt") == "2"
+    assert bucket.downloads == ["analysis.txt", "analysis.txt"]
+    assert changed == ["analysis.txt"]
+
+
+def test_bucket_error_keeps_the_last_good_prompt(bucket):
+    prompts = store(bucket)
+    bucket.error = ConnectionError("bucket unreachable")
+
+    prompts.refresh()
+
+    assert prompts.get("analysis.txt") == "Analyze the chart."
+    assert prompts.stats()["errors"] == 1
+
+    bucket.error = None
+    bucket.upload("analysis.txt", "Analyze the chart, briefly.")
+    prompts.refresh()
+
+    assert prompts.get("analysis.txt") == "Analyze the chart, briefly."
+
+
+def test_missing_prompt_is_not_served(bucket):
+    prompts = store(bucket)
+
+    with pytest.raises(FileNotFoundError):
+        prompts.get("missing.txt")
+
+
+def test_background_refresh_picks_up_a_new_generation(bucket):
+    prompts = PromptStore("prompts", ["analysis.txt"], ttl=0.01, bucket=bucket)
+    prompts.start()
+    bucket.upload("analysis.txt", "Analyze the chart, briefly.")
+    try:
+        deadline = time.monotonic() + 2
+        while prompts.get("analysis.txt") != "Analyze the chart, briefly.":
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        prompts.stop()
@@ -0,0 +1,164 @@
+import threading
+import time
+
+import pytest
+
+import ratelimit
+from ratelimit import PRIORITY_BATCH, PRIORITY_INTERACTIVE, RateLimited, RateLimiter, parse_duration
+
+
+def drained(rpm, **kwargs):
+    """A limiter whose request bucket the upstream says is empty."""
+    limiter = RateLimiter("test", rpm=rpm, **kwargs)
+    limiter.observe({"x-ratelimit-remaining-requests": "0"})
+    return limiter
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting"
+        time.sleep(0.005)
+
+
+def test_admits_right_away_with_room():
+    limiter = RateLimiter("test", rpm=60, tpm=1000)
+
+    assert limiter.acquire(cost=100) == 0.0
+    assert limiter.stats()["admitted"] == 1
+
+
+def test_interactive_requests_go_ahead_of_batch():
+    limiter = drained(rpm=120)
+    order = []
+
+    def acquire(name, priority):
+        limiter.acquire(priority=priority, timeout=5)
+        order.append(name)
+
+    threads = [threading.Thread(target=acquire, args=("batch", PRIORITY_BATCH))]
+    threads[0].start()
+    wait_for(lambda: limiter.stats()["waiting"] == 1)
+    threads.append(threading.Thread(target=acquire, args=("interactive", PRIORITY_INTERACTIVE)))
+    threads[1].start()
+    wait_for(lambda: limiter.stats()["waiting"] == 2)
+    for thread in threads:
+        thread.join()
+
+    assert order == ["interactive", "batch"]
+
+
+def test_wait_that_cannot_fit_the_timeout_fails_fast():
+    limiter = drained(rpm=60)
+
+    start = time.monotonic()
+    with pytest.raises(RateLimited) as raised:
+        limiter.acquire(timeout=0.2)
+
+    assert time.monotonic() - start < 0.2
+    assert raised.value.reason == "timeout"
+    assert raised.value.retry_after >= 1.0
+    assert limiter.stats()["timed_out"] == 1
+    assert limiter.stats()["waiting"] == 0
+
+
+def test_full_queue_is_rejected():
+    limiter = drained(rpm=60, max_queue=0)
+
+    with pytest.raises(RateLimited) as raised:
+        limiter.acquire()
+
+    assert raised.value.reason == "queue_full"
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_waiter_behind_the_head_times_out_and_leaves_the_queue():
+    limiter = drained(rpm=60)
+    head = threading.Thread(target=lambda: limiter.acquire(timeout=5))
+    head.start()
+    wait_for(lambda: limiter.stats()["waiting"] == 1)
+
+    with pytest.raises(RateLimited):
+        limiter.acquire(timeout=0.1)
+    head.join()
+
+    assert limiter.stats()["timed_out"] == 1
+    assert limiter.stats()["admitted"] == 1
+
+
+def test_try_acquire_never_waits_or_counts_a_rejection(monkeypatch):
+    rejections = []
+    monkeypatch.setattr(ratelimit, "record_rate_limit_rejection", lambda *args: rejections.append(args))
+    limiter = RateLimiter("test", rpm=60)
+    assert limiter.try_acquire()
+
+    limiter.observe({"x-ratelimit-remaining-requests": "0"})
+
+    start = time.monotonic()
+    assert not limiter.try_acquire()
+    assert time.monotonic() - start < 0.1
+    assert limiter.stats()["admitted"] == 1
+    assert limiter.stats()["rejected"] == limiter.stats()["timed_out"] == 0
+    assert rejections == []
+
+
+def test_try_acquire_does_not_jump_the_queue():
+    limiter = drained(rpm=120)
+    waiter = threading.Thread(target=lambda: limiter.acquire(timeout=5))
+    waiter.start()
+    wait_for(lambda: limiter.stats()["waiting"] == 1)
+    # Make room in the buckets while the waiter is still queued.
+    limiter.requests.level = 10.0
+
+    assert not limiter.try_acquire()
+    waiter.join()
+
+
+def test_headers_resync_the_limits():
+    limiter = RateLimiter("test", rpm=500, tpm=200000, share=0.5)
+
+    limiter.observe({
+        "x-ratelimit-limit-requests": "120",
+        "x-ratelimit-remaining-requests": "30",
+        "x-ratelimit-limit-tokens": "1000",
+        "x-ratelimit-remaining-tokens": "1000",
+    })
+
+    assert limiter.stats()["rpm"] == 60
+    assert limiter.stats()["tpm"] == 500
+    assert limiter.headroom() == pytest.approx(0.25, abs=0.01)
+
+
+def test_exhausted_headers_block_until_the_reset():
+    limiter = RateLimiter("test", rpm=600)
+
+    limiter.observe({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "2s"})
+
+    assert limiter.headroom() == 0.0
+    with pytest.raises(RateLimited):
+        limiter.acquire(timeout=0.5)
+
+
+def test_unlimited_bucket_ignores_remaining():
+    limiter = RateLimiter("test", rpm=0, tpm=0)
+
+    limiter.observe({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "1m"})
+
+    assert limiter.acquire() == 0.0
+
+
+def test_penalize_backs_off():
+    limiter = RateLimiter("test", rpm=600)
+
+    limiter.penalize(2)
+
+    with pytest.raises(RateLimited):
+        limiter.acquire(timeout=0.5)
+    assert limiter.stats()["throttled"] == 1
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("1s", 1.0), ("6m0s", 360.0), ("20ms", 0.02), ("1h2m3.5s", 3723.5), ("0.5", 0.5), ("", None), ("soon", None),
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == (pytest.approx(seconds) if seconds is not None else None)
@@ -0,0 +1,158 @@
+import json
+import socket
+
+import pytest
+import requests
+
+import fake_upstreams
+from breaker import CircuitBreaker
+from ratelimit import RateLimiter
+from router import PoolMember, UpstreamPool
+from upstream import UpstreamClient
+
+
+@pytest.fixture
+def upstreams():
+    servers = []
+
+    def start(**config):
+        server = fake_upstreams.start(**config)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def member(name, url, limiter=None, min_calls=100):
+    breaker = CircuitBreaker(name, error_rate=0.5, min_calls=min_calls, open_seconds=60)
+    client = UpstreamClient(name, url, max_retries=0, connect_timeout=1.0, read_timeout=5.0, breaker=breaker)
+    return PoolMember(name, client, limiter, "key-" + name, "model-" + name)
+
+
+def completions(server):
+    return f"{server.url}/v1/chat/completions"
+
+
+def closed_port_url():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    return f"http://127.0.0.1:{port}/v1/chat/completions"
+
+
+def post(pool):
+    rendered = []
+
+    def render(model):
+        rendered.append(model)
+        return json.dumps({"model": model, "messages": []}).encode()
+
+    response = pool.post(render)
+    return response, rendered
+
+
+def test_fails_over_from_a_failing_member(upstreams):
+    failing, healthy = upstreams(error_rate=1.0), upstreams()
+    pool = UpstreamPool("test", [member("failing", completions(failing)), member("healthy", completions(healthy))])
+
+    response, rendered = post(pool)
+
+    assert response.status_code == 200
+    assert rendered == ["model-failing", "model-healthy"]
+    assert failing.counts["errors"] == 1
+    assert pool.stats()["failing"]["failovers"] == 1
+    assert pool.stats()["healthy"]["routed"] == 1
+
+
+def test_fails_over_from_an_unreachable_member(upstreams):
+    healthy = upstreams()
+    pool = UpstreamPool("test", [member("down", closed_port_url()), member("healthy", completions(healthy))])
+
+    response, rendered = post(pool)
+
+    assert response.status_code == 200
+    assert rendered == ["model-down", "model-healthy"]
+    assert pool.stats()["down"]["failovers"] == 1
+    assert pool.stats()["down"]["in_flight"] == 0
+
+
+def test_fails_over_from_a_rate_limited_member(upstreams):
+    limited, healthy = upstreams(), upstreams()
+    limiter = RateLimiter("limited", rpm=60, max_wait=0)
+    limiter.observe({"x-ratelimit-remaining-requests": "0"})
+    pool = UpstreamPool("test", [
+        member("limited", completions(limited), limiter=limiter), member("healthy", completions(healthy)),
+    ])
+
+    response, rendered = post(pool)
+
+    assert response.status_code == 200
+    assert limited.counts["post"] == 0
+    assert healthy.counts["post"] == 1
+
+
+def test_last_members_answer_is_returned(upstreams):
+    first, second = upstreams(error_rate=1.0), upstreams(error_rate=1.0, error_status=502)
+    pool = UpstreamPool("test", [member("first", completions(first)), member("second", completions(second))])
+
+    response, rendered = post(pool)
+
+    assert response.status_code == 502
+    assert len(rendered) == 2
+
+
+def test_all_members_unreachable_raises():
+    pool = UpstreamPool("test", [member("a", closed_port_url()), member("b", closed_port_url())])
+
+    with pytest.raises(requests.ConnectionError):
+        post(pool)
+
+
+def test_member_is_ejected_while_its_breaker_is_open(upstreams):
+    failing, healthy = upstreams(error_rate=1.0), upstreams()
+    failing_member = member("failing", completions(failing), min_calls=2)
+    pool = UpstreamPool("test", [failing_member, member("healthy", completions(healthy))], probe_interval=3600)
+    # Keep the failing member looking fastest, so it is picked until its breaker opens.
+    for _ in range(2):
+        failing_member.ewma = 0.0
+        assert post(pool)[0].status_code == 200
+    assert failing_member.ejected
+
+    for _ in range(5):
+        assert post(pool)[0].status_code == 200
+
+    assert failing.counts["post"] == 2
+    assert healthy.counts["post"] == 7
+    assert pool.stats()["failing"]["ejected"]
+
+
+def test_faster_member_gets_the_traffic(upstreams):
+    slow, fast = upstreams(latency=0.2), upstreams(latency=0.01)
+    pool = UpstreamPool("test", [member("slow", completions(slow)), member("fast", completions(fast))],
+                        probe_interval=3600)
+
+    for _ in range(10):
+        post(pool)
+
+    assert slow.counts["post"] == 1
+    assert fast.counts["post"] == 9
+    assert pool.stats()["fast"]["ewma_ms"] < pool.stats()["slow"]["ewma_ms"]
+
+
+def test_member_not_picked_for_probe_interval_is_probed(upstreams):
+    slow, fast = upstreams(latency=0.1), upstreams()
+    pool = UpstreamPool("test", [member("slow", completions(slow)), member("fast", completions(fast))],
+                        probe_interval=0.0)
+
+    for _ in range(4):
+        post(pool)
+
+    assert slow.counts["post"] >= 2
+
+
+def test_pool_needs_members():
+    with pytest.raises(ValueError):
+        UpstreamPool("test", [])
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from streaming import IncrementalJSONParser
+
+DOCUMENT = {
+    "result": {
+        "features": {
+            "generalTrends": "Up \"strongly\" since the {open}, then [flat]",
+            "levels": [101.5, -2e3, None, True],
+        },
+        "note": "back\\slash, unicode é and 中, escaped \n newline",
+    },
+    "empty": {},
+    "last": 7,
+}
+PATHS = [
+    ("result", "features", "generalTrends"),
+    ("result", "features", "levels"),
+    ("result", "note"),
+    ("empty",),
+    ("last",),
+]
+
+
+def feed_all(parser, chunks):
+    completed = []
+    for chunk in chunks:
+        completed.extend(parser.feed(chunk))
+    return completed
+
+
+def expected_values():
+    features = DOCUMENT["result"]["features"]
+    return {
+        ("result", "features", "generalTrends"): features["generalTrends"],
+        ("result", "features", "levels"): features["levels"],
+        ("result", "note"): DOCUMENT["result"]["note"],
+        ("empty",): {},
+        ("last",): 7,
+    }
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 16, 10000])
+def test_every_chunk_size_finds_the_same_values(size):
+    text = json.dumps(DOCUMENT, indent=2)
+    chunks = [text[i:i + size] for i in range(0, len(text), size)]
+
+    completed = feed_all(IncrementalJSONParser(PATHS), chunks)
+
+    assert dict(completed) == expected_values()
+    assert len(completed) == len(PATHS)
+
+
+def test_split_at_every_position():
+    text = json.dumps(DOCUMENT, separators=(",", ":"))
+    for split in range(1, len(text)):
+        completed = feed_all(IncrementalJSONParser(PATHS), [text[:split], text[split:]])
+        assert dict(completed) == expected_values(), split
+
+
+def test_value_is_returned_once_it_closes():
+    parser = IncrementalJSONParser([("a",), ("b",)])
+
+    assert parser.feed('{"a": "x\\"') == []
+    assert parser.feed('y",') == [(("a",), 'x"y')]
+    # A number is only complete once the next delimiter arrives.
+    assert parser.feed(' "b": 12') == []
+    assert parser.feed("3}") == [(("b",), 123)]
+
+
+def test_escaped_quotes_and_backslashes_do_not_end_strings():
+    parser = IncrementalJSONParser([("k",), ("after",)])
+    text = '{"k": "a\\\\", "after": "\\"}\\""}'
+
+    assert feed_all(parser, list(text)) == [(("k",), "a\\"), (("after",), '"}"')]
+
+
+def test_array_items_have_index_paths():
+    parser = IncrementalJSONParser([("items", 0, "text"), ("items", 1, "text"), ("items",)])
+    text = '{"items": [{"text": "one"}, {"text": "two"}]}'
+
+    assert feed_all(parser, [text[:20], text[20:]]) == [
+        (("items", 0, "text"), "one"),
+        (("items", 1, "text"), "two"),
+        (("items",), [{"text": "one"}, {"text": "two"}]),
+    ]
+
+
+def test_empty_array_and_keys_that_look_like_structure():
+    parser = IncrementalJSONParser([("list",), ("{[:,]}",)])
+    text = '{"list": [], "{[:,]}": [[], {}]}'
+
+    assert feed_all(parser, list(text)) == [(("list",), []), (("{[:,]}",), [[], {}])]
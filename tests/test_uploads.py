@@ -0,0 +1,156 @@
+import base64
+import io
+import json
+
+import pytest
+from flask import Flask, jsonify, request
+
+from images import InvalidImageError
+from uploads import ImageTooLargeError, ImageUploadReader
+
+MAX_BYTES = 1024
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+
+
+class CountingStream(io.BytesIO):
+    """A request body that records how often it was read."""
+
+    reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+@pytest.fixture
+def client():
+    reader = ImageUploadReader(max_bytes=MAX_BYTES, spool_bytes=256)
+    app = Flask(__name__)
+
+    @app.route("/upload", methods=["POST"])
+    def upload():
+        try:
+            fields, image_bytes = reader.read(request)
+        except ImageTooLargeError as e:
+            return jsonify({"error": str(e)}), 413
+        except InvalidImageError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"fields": fields, "size": len(image_bytes)})
+
+    return app.test_client()
+
+
+def chunked(client, body, content_type="image/png"):
+    """Posts ``body`` without a Content-Length, as a chunked request arrives from gunicorn."""
+    return client.post(
+        "/upload", input_stream=body, content_type=content_type,
+        headers={"Transfer-Encoding": "chunked"}, environ_base={"wsgi.input_terminated": True},
+    )
+
+
+def test_raw_image_with_query_fields(client):
+    response = client.post("/upload?risk=Low&tradingStyles=Swing", data=PNG, content_type="image/png")
+
+    assert response.status_code == 200
+    assert response.json == {"fields": {"risk": "Low", "tradingStyles": ["Swing"]}, "size": len(PNG)}
+
+
+def test_oversized_content_length_is_refused_before_reading():
+    body = CountingStream(PNG + b"\x00" * MAX_BYTES)
+    app = Flask(__name__)
+
+    with app.test_request_context("/upload", method="POST", input_stream=body, content_type="image/png",
+                                  content_length=len(PNG) + MAX_BYTES):
+        with pytest.raises(ImageTooLargeError):
+            ImageUploadReader(max_bytes=MAX_BYTES).read(request)
+
+    assert body.reads == 0
+
+
+def test_oversized_content_length_is_a_413(client):
+    response = client.post("/upload", data=PNG + b"\x00" * MAX_BYTES, content_type="image/png")
+
+    assert response.status_code == 413
+
+
+def test_chunked_body_over_max_bytes_is_refused(client):
+    response = chunked(client, io.BytesIO(PNG + b"\x00" * MAX_BYTES))
+
+    assert response.status_code == 413
+
+
+def test_chunked_body_within_max_bytes_is_read(client):
+    response = chunked(client, io.BytesIO(PNG))
+
+    assert response.status_code == 200
+    assert response.json["size"] == len(PNG)
+
+
+def test_bad_magic_bytes_are_refused_after_the_first_chunk(client):
+    body = CountingStream(b"<html>not an image</html>" * 1000)
+
+    response = chunked(client, body)
+
+    assert response.status_code == 400
+    assert body.reads == 1
+
+
+def test_multipart_upload(client):
+    response = client.post("/upload", data={
+        "image": (io.BytesIO(PNG), "chart.png"),
+        "tradingStyles": ["Swing, Scalping", "Day"],
+        "risk": "High",
+        "stream": "true",
+        "enrichLinks": "0",
+    })
+
+    assert response.status_code == 200
+    assert response.json == {
+        "fields": {
+            "tradingStyles": ["Swing", "Scalping", "Day"], "risk": "High", "stream": True, "enrichLinks": False,
+        },
+        "size": len(PNG),
+    }
+
+
+def test_multipart_without_an_image_is_refused(client):
+    response = client.post("/upload", data={"risk": "High"}, content_type="multipart/form-data")
+
+    assert response.status_code == 400
+    assert "image" in response.json["error"]
+
+
+def test_multipart_image_over_max_bytes_is_refused(client):
+    response = client.post("/upload", data={"image": (io.BytesIO(PNG + b"\x00" * 2 * MAX_BYTES), "chart.png")})
+
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize("value, expected", [("1", True), ("TRUE", True), ("no", False), ("", False)])
+def test_boolean_fields(client, value, expected):
+    response = client.post(f"/upload?stream={value}", data=PNG, content_type="image/png")
+
+    assert response.json["fields"]["stream"] is expected
+
+
+def test_json_upload(client):
+    body = {"base64Image": base64.b64encode(PNG).decode(), "tradingStyles": ["Swing"]}
+
+    response = client.post("/upload", json=body)
+
+    assert response.status_code == 200
+    assert response.json == {"fields": body, "size": len(PNG)}
+
+
+def test_json_without_an_image_is_refused(client):
+    response = client.post("/upload", json={"risk": "Low"})
+
+    assert response.status_code == 400
+
+
+def test_chunked_json_over_the_limit_is_refused(client):
+    body = json.dumps({"base64Image": "A" * 4 * MAX_BYTES}).encode()
+
+    response = chunked(client, io.BytesIO(body), content_type="application/json")
+
+    assert response.status_code == 413